@@ -38,6 +38,8 @@ function parseArgs(argv) {
     headed: false,
     betweenMs: 6000,
     pageWaitMs: 12000,
+    concurrency: 1,
+    ratePerMinute: 0,
     maxConsecutiveFailures: 5,
     maxFailureRate: 0.4,
     dryRun: false,
@@ -64,6 +66,8 @@ function parseArgs(argv) {
     else if (arg === "--headed") options.headed = true;
     else if (arg === "--between-ms") options.betweenMs = Number(argv[++i] || 0);
     else if (arg === "--page-wait-ms") options.pageWaitMs = Number(argv[++i] || 0);
+    else if (arg === "--concurrency") options.concurrency = Number(argv[++i] || 1);
+    else if (arg === "--rate-per-minute") options.ratePerMinute = Number(argv[++i] || 0);
     else if (arg === "--max-consecutive-failures") options.maxConsecutiveFailures = Number(argv[++i] || 0);
     else if (arg === "--max-failure-rate") options.maxFailureRate = Number(argv[++i] || 0);
     else if (arg === "--work-dir") options.workDir = argv[++i] || options.workDir;
@@ -82,6 +86,7 @@ function parseArgs(argv) {
   if (options.browserConfirm) {
     options.batchSize = Math.min(options.batchSize || 3, 5);
     options.maxConsecutiveFailures = Math.min(options.maxConsecutiveFailures || 2, 2);
+    options.concurrency = 1;
   }
   return options;
 }
@@ -318,7 +323,10 @@ function scraperArgs(options, useBrowser = false) {
     options.chromeExecutablePath,
     "--stop-after-consecutive-failures",
     String(options.maxConsecutiveFailures),
+    "--concurrency",
+    String(options.concurrency),
   ];
+  if (options.ratePerMinute > 0) args.push("--rate-per-minute", String(options.ratePerMinute));
   if (useBrowser) {
     if (options.cdpUrl) args.push("--cdp-url", options.cdpUrl);
     if (options.newTab) args.push("--new-tab");
@@ -421,7 +429,10 @@ function scrapeAndWriteEach(rows, options, useBrowser, summary, browserRows) {
         reject(new Error(`invalid scraper JSON: ${line}`));
         return;
       }
-      const row = rows[index] || { seq: `unknown-${index}` };
+      // With --concurrency results arrive in completion order; match rows by seq.
+      const row = rows.find((candidate) => result.seq != null && String(candidate.seq) === String(result.seq))
+        || rows[index]
+        || { seq: `unknown-${index}` };
       index += 1;
       const handled = handleScrapeResult(options, summary, row, result, browserRows);
       if (handled.failed) {
@@ -8,12 +8,28 @@ import ssl
 import subprocess
 import sys
 import time
+from collections import deque
 import urllib.parse
 import urllib.request
 from pathlib import Path
 
 UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 DOUYIN_COOKIE_PATH = os.path.expanduser("~/.config/video-download/douyin_cookies.json")
+RISK_ERROR_RE = re.compile(r"platform risk|captcha|verify|异常访问|安全验证", re.I)
+CONCURRENT_RISK_BACKOFFS = 1
+READY_JS = "() => document.title.includes(' - 抖音') && !!document.querySelector('[data-e2e=\"detail-video-info\"]')?.textContent.includes('发布时间：')"
+READY_GRACE_MS = 15000
+READY_POLL_MS = 250
+# Only aweme detail endpoints carry the record build_result needs; feed and
+# recommendation JSON on busy pages is skipped before its body is read.
+AWEME_RESPONSE_PATTERNS = (
+    "/aweme/v1/web/aweme/detail/",
+    "/aweme/v1/web/multi/aweme/detail/",
+    "/web/api/v2/aweme/iteminfo/",
+)
+MAX_RESPONSE_BYTES = 5_000_000
+RESPONSE_BUFFER_SIZE = 8
+BARE_METRIC_LABELS = {"赞", "抢首评", "收藏"}
 ssl._create_default_https_context = ssl._create_unverified_context
 
 
@@ -22,7 +38,7 @@ def parse_args():
     parser.add_argument("--json", action="store_true", help="Output JSON lines.")
     parser.add_argument("--json-input", action="store_true", help="Read JSONL rows with url/mode/analyzeVideo.")
     parser.add_argument("--between-ms", type=int, default=6000)
-    parser.add_argument("--page-wait-ms", type=int, default=12000)
+    parser.add_argument("--page-wait-ms", type=int, default=12000, help="Readiness ceiling after navigation is this plus 15 s; the scrape moves on as soon as the page is ready.")
     parser.add_argument("--chrome-user-data-dir", default="")
     parser.add_argument("--chrome-executable-path", default="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")
     parser.add_argument("--cdp-url", default="", help="Connect to an already-open Chrome via CDP and leave it open.")
@@ -32,6 +48,10 @@ def parse_args():
     parser.add_argument("--headed", action="store_true")
     parser.add_argument("--work-dir", default="/tmp/douyin-scraper")
     parser.add_argument("--stop-after-consecutive-failures", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of worker tabs driven in one browser context.")
+    parser.add_argument("--rate-per-minute", type=float, default=0, help="Global page navigation budget shared by all tabs; default derives from --between-ms.")
+    parser.add_argument("--risk-backoff-ms", type=int, default=120000, help="Pause for all tabs after a platform risk signal in concurrent mode.")
+    parser.add_argument("--risk-backoffs", type=int, default=None, help=f"Platform risk signals to back off from before stopping a concurrent run (default {CONCURRENT_RISK_BACKOFFS}); sequential runs always stop on the first.")
     return parser.parse_args()
 
 
@@ -107,21 +127,6 @@ def is_aweme_candidate(node):
     return isinstance(node, dict) and any(key in node for key in ("desc", "description", "statistics", "stats", "video"))
 
 
-def iter_aweme_candidates(*values):
-    for value in values:
-        for node in walk(value):
-            if not isinstance(node, dict):
-                continue
-            detail = node.get("aweme_detail")
-            if is_aweme_candidate(detail):
-                yield detail
-            if ("awemeId" in node or "aweme_id" in node) and is_aweme_candidate(node):
-                yield node
-            child = node.get("aweme")
-            if is_aweme_candidate(child):
-                yield child
-
-
 def node_aweme_id(node):
     if not isinstance(node, dict):
         return ""
@@ -160,24 +165,60 @@ def format_publish_time(epoch_value):
         return ""
 
 
-def find_aweme(*values):
-    candidates = []
-    for candidate in iter_aweme_candidates(*values):
-        candidates.append(candidate)
-    candidates.sort(key=lambda item: len(json.dumps(item, ensure_ascii=False, default=str)), reverse=True)
-    return candidates[0] if candidates else None
+class AwemeIndex:
+    # One walk over page state and captured payloads. Aweme candidates are indexed
+    # by id and ranked by a structural size estimate (scalars plus string lengths,
+    # roughly their JSON length) instead of serializing each one. Stream URLs are
+    # collected only for the candidate a caller asks about, then cached.
+    def __init__(self, *values):
+        self.candidates = []
+        self.by_id = {}
+        self.registered = set()
+        self.video_urls = {}
+        self.add(*values)
+
+    def add(self, *values):
+        for value in values:
+            self._visit(value, False)
+
+    def _visit(self, node, hinted):
+        if isinstance(node, dict):
+            size = 1
+            for key, child in node.items():
+                size += self._visit(child, key in ("aweme_detail", "aweme"))
+            if is_aweme_candidate(node) and (hinted or "awemeId" in node or "aweme_id" in node):
+                self._register(node, size)
+            return size
+        if isinstance(node, list):
+            return 1 + sum(self._visit(child, False) for child in node)
+        if isinstance(node, str):
+            return 2 + len(node)
+        return 1
+
+    def _register(self, node, size):
+        if id(node) in self.registered:
+            return
+        self.registered.add(id(node))
+        self.candidates.append((size, node))
+        aweme_id = node_aweme_id(node)
+        if aweme_id:
+            self.by_id.setdefault(aweme_id, []).append((size, node))
 
+    def largest(self):
+        return max(self.candidates, key=lambda entry: entry[0])[1] if self.candidates else None
 
-def find_aweme_by_id(aweme_id, *values):
-    if not aweme_id:
-        return None
-    target = str(aweme_id)
-    candidates = []
-    for candidate in iter_aweme_candidates(*values):
-        if node_aweme_id(candidate) == target:
-            candidates.append(candidate)
-    candidates.sort(key=lambda item: len(json.dumps(item, ensure_ascii=False, default=str)), reverse=True)
-    return candidates[0] if candidates else None
+    def best(self, aweme_id):
+        matches = self.by_id.get(str(aweme_id or ""))
+        return max(matches, key=lambda entry: entry[0])[1] if matches else None
+
+    def video_url(self, aweme):
+        if id(aweme) not in self.registered:
+            return ""
+        urls = self.video_urls.get(id(aweme))
+        if urls is None:
+            video = aweme.get("video")
+            urls = self.video_urls[id(aweme)] = collect_video_urls(video) if isinstance(video, dict) else []
+        return choose_video_url(urls)
 
 
 def decode_render_data(raw):
@@ -286,6 +327,21 @@ def parse_visible_current(page_title, visible_text):
 
 
 def parse_visible_dom_metrics(metrics):
+    if isinstance(metrics, dict):
+        # Targeted engagement-bar read: one text per control. A control showing only
+        # its bare label (赞 / 抢首评 / 收藏) means zero; any other text without a
+        # number (an aria-label such as 点赞) or a missing control means unknown.
+        result = {}
+        for key, field in (("liked", "likedCount"), ("comment", "commentCount"), ("collect", "collectedCount")):
+            text = str(metrics.get(key) or "").strip().replace(",", "")
+            if not text:
+                continue
+            match = re.search(r"\d+(?:\.\d+)?[万亿]?", text)
+            if match:
+                result[field] = normalize_count(match.group(0))
+            elif text in BARE_METRIC_LABELS:
+                result[field] = 0
+        return result
     if not isinstance(metrics, list):
         return {}
     cleaned = [str(value or "").strip() for value in metrics if str(value or "").strip()]
@@ -362,11 +418,8 @@ def collect_video_urls(value):
     return urls
 
 
-def choose_video_url(aweme):
-    video = aweme.get("video") if isinstance(aweme, dict) else None
-    if not isinstance(video, dict):
-        return ""
-    for url in collect_video_urls(video):
+def choose_video_url(urls):
+    for url in urls:
         if "douyinvod.com" in url or "aweme/v1/play" in url or "video" in url:
             return url
     return ""
@@ -441,7 +494,8 @@ def analyze_video(url, item, video_url, work_dir):
 
 
 def build_result(item, page_url, page_title, page_data, response_data, captured_video_url, work_dir):
-    risk_text = f"{page_title}\n{page_data.get('text', '')}"
+    # riskText covers the whole page (captcha overlays live outside the info container).
+    risk_text = f"{page_title}\n{page_data.get('riskText', '')}\n{page_data.get('text', '')}"
     if "发布时间：" not in risk_text and re.search(r"验证码|异常访问|访问过于频繁|安全验证|captcha|verify|risk", risk_text, re.I):
         return {"ok": False, "url": item["url"], "error": "platform risk detected"}
 
@@ -454,12 +508,25 @@ def build_result(item, page_url, page_title, page_data, response_data, captured_
             "resolvedUrl": page_url,
             "error": f"resolved video mismatch expected={expected_aweme_id} actual={current_aweme_id}",
         }
-    current_aweme = find_aweme_by_id(current_aweme_id, page_data, *response_data)
-    aweme = current_aweme or find_aweme(page_data, *response_data)
+    # response_data may be a ResponseCapture that parses bodies on iteration; only
+    # touch it when the page state itself does not hold the record.
+    index = AwemeIndex(page_data)
+    if (current_aweme_id and not index.best(current_aweme_id)) or not index.candidates:
+        index.add(*response_data)
+    current_aweme = index.best(current_aweme_id) if current_aweme_id else None
+    aweme = current_aweme or index.largest()
     visible = parse_visible_current(page_title, page_data.get("text", ""))
     dom_metrics = parse_visible_dom_metrics(page_data.get("metrics"))
     publish_time = parse_publish_time_from_text(page_data.get("text", ""))
     visible_body = visible.get("body") or ""
+    if "展开\n" not in page_data.get("text", ""):
+        # Caption not rendered yet (ready by the aweme response) or laid out without
+        # the expand toggle: the visible body is only the page title, so prefer the
+        # structured caption and timestamp, then the description container.
+        aweme_desc = (current_aweme.get("desc"), current_aweme.get("description")) if current_aweme else ()
+        visible_body = first_string(*aweme_desc, page_data.get("desc"), visible_body)
+        if current_aweme:
+            publish_time = publish_time or format_publish_time(current_aweme.get("create_time") or current_aweme.get("createTime"))
     preferred_aweme = current_aweme or aweme
     preferred_stats = preferred_aweme.get("statistics") if isinstance(preferred_aweme, dict) else None
     if not isinstance(preferred_stats, dict) and isinstance(preferred_aweme, dict):
@@ -478,7 +545,7 @@ def build_result(item, page_url, page_title, page_data, response_data, captured_
         or (preferred_aweme.get("collect_count") if isinstance(preferred_aweme, dict) else None)
     )
     if visible_body and "/video/" in page_url:
-        video_url = choose_video_url(current_aweme or {})
+        video_url = index.video_url(current_aweme)
         analysis = analyze_video(page_url, item, video_url, work_dir)
         body = visible_body
         if analysis:
@@ -527,7 +594,7 @@ def build_result(item, page_url, page_title, page_data, response_data, captured_
         normalize_count(statistics.get("comment_count") or statistics.get("commentCount") or aweme.get("comment_count")),
         merge_metric(visible.get("commentCount"), dom_metrics.get("commentCount")),
     )
-    video_url = choose_video_url(current_aweme or aweme)
+    video_url = index.video_url(current_aweme or aweme)
     analysis = analyze_video(page_url, item, video_url, work_dir)
     body = desc
     if analysis:
@@ -551,42 +618,146 @@ def build_result(item, page_url, page_title, page_data, response_data, captured_
     }
 
 
-def scrape_one(page, item, args):
-    response_data = []
-    captured_video_url = ""
-
-    def on_response(response):
-        nonlocal captured_video_url
+def response_aweme_ids(url):
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    ids = set()
+    for key in ("aweme_id", "item_ids", "aweme_ids"):
+        for value in query.get(key, []):
+            ids.update(re.findall(r"\d+", value))
+    return ids
+
+
+def detail_aweme_ids(data):
+    # Ids of the aweme records a detail response really carries; an empty body or
+    # "aweme_detail": null carries none.
+    if not isinstance(data, dict):
+        return set()
+    records = [data.get("aweme_detail")]
+    for key in ("aweme_details", "item_list"):
+        if isinstance(data.get(key), list):
+            records.extend(data[key])
+    return {node_aweme_id(record) for record in records if isinstance(record, dict)} - {""}
+
+
+class ResponseCapture:
+    def __init__(self, page):
+        self.page = page
+        # The most recent matching responses; bodies are fetched and parsed on first use.
+        self.responses = deque(maxlen=RESPONSE_BUFFER_SIZE)
+        self.captured_video_url = ""
+        page.on("response", self.on_response)
+
+    def on_response(self, response):
         url = response.url
-        content_type = response.headers.get("content-type", "")
-        if not captured_video_url and "douyinvod.com" in url and ("video_mp4" in url or ".mp4" in url):
-            captured_video_url = url
-        if "json" not in content_type and "aweme" not in url:
+        if not self.captured_video_url and "douyinvod.com" in url and ("video_mp4" in url or ".mp4" in url):
+            self.captured_video_url = url
+        if not any(pattern in url for pattern in AWEME_RESPONSE_PATTERNS):
             return
         try:
-            text = response.text()
-            if len(text) > 5_000_000:
-                return
-            response_data.append(json.loads(text))
-        except (Exception, asyncio.CancelledError):
+            length = int(response.headers.get("content-length") or 0)
+        except ValueError:
+            length = 0
+        if length > MAX_RESPONSE_BYTES:
             return
+        self.responses.append({"ids": response_aweme_ids(url), "response": response, "data": None, "details": None})
+
+    @staticmethod
+    def _parse(entry):
+        response = entry["response"]
+        if response is not None:
+            entry["response"] = None
+            try:
+                text = response.text()
+                entry["data"] = json.loads(text) if len(text) <= MAX_RESPONSE_BYTES else None
+            except (Exception, asyncio.CancelledError):
+                entry["data"] = None
+            entry["details"] = detail_aweme_ids(entry["data"])
+        return entry["data"]
+
+    def has_detail(self, aweme_id):
+        # The request URL only names the id; only a body that parses to that aweme's
+        # record counts. Entries for other ids stay unparsed.
+        if not aweme_id:
+            return False
+        for entry in list(self.responses):
+            if aweme_id in entry["ids"]:
+                self._parse(entry)
+                if aweme_id in entry["details"]:
+                    return True
+        return False
+
+    def __iter__(self):
+        for entry in list(self.responses):
+            data = self._parse(entry)
+            if data is not None:
+                yield data
+
+    def close(self):
+        try:
+            self.page.remove_listener("response", self.on_response)
+        except Exception:
+            pass
+
 
-    page.on("response", on_response)
+def start_scrape(page, item):
+    capture = ResponseCapture(page)
     try:
-        expected_aweme_id = current_video_id_from_url(item.get("url", ""))
         page.goto(item["url"], wait_until="domcontentloaded", timeout=45000)
-        page.wait_for_timeout(args.page_wait_ms)
+    except BaseException:
+        capture.close()
+        raise
+    return capture
+
+
+def ready_deadline(args):
+    return time.monotonic() + (max(args.page_wait_ms, 0) + READY_GRACE_MS) / 1000
+
+
+def response_ready(page, capture):
+    # Cheap signal: the aweme detail response for the video the page shows has arrived.
+    return capture.has_detail(current_video_id_from_url(page.url))
+
+
+def dom_ready(page):
+    # Costlier signal: an evaluate round trip per tab. READY_JS reads the info
+    # container's textContent, so it does not force a layout.
+    try:
+        return bool(page.evaluate(READY_JS))
+    except Exception:
+        return False
+
+
+def page_ready(page, capture):
+    # Either signal is enough: the caption block with 发布时间 has rendered, or the
+    # aweme detail response for the video the page currently shows has arrived.
+    if response_ready(page, capture):
+        return "response"
+    if dom_ready(page):
+        return "dom"
+    return ""
+
+
+def wait_until_ready(page, capture, deadline):
+    while True:
+        reason = page_ready(page, capture)
+        if reason:
+            return reason
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "timeout"
+        page.wait_for_timeout(int(min(remaining * 1000, READY_POLL_MS)))
+
+
+def finish_scrape(page, item, capture, args, deadline, governor=None):
+    try:
+        expected_aweme_id = current_video_id_from_url(item.get("url", ""))
+        ready_by = wait_until_ready(page, capture, deadline)
         if expected_aweme_id and current_video_id_from_url(page.url) != expected_aweme_id:
             # Retry once with canonical URL to avoid stale/reused feed page capture.
+            if governor:
+                governor.take()
             page.goto(f"https://www.douyin.com/video/{expected_aweme_id}", wait_until="domcontentloaded", timeout=45000)
-            page.wait_for_timeout(args.page_wait_ms)
-        try:
-            page.wait_for_function(
-                "() => document.title.includes(' - 抖音') && document.body && document.body.innerText.includes('发布时间：')",
-                timeout=15000,
-            )
-        except Exception:
-            pass
+            ready_by = wait_until_ready(page, capture, ready_deadline(args))
         page_data = page.evaluate(
             """() => {
                 const render = document.querySelector('#RENDER_DATA')?.textContent || '';
@@ -596,29 +767,82 @@ def scrape_one(page, item, args):
                     const key = meta.getAttribute('name') || meta.getAttribute('property');
                     if (key) metas[key] = meta.getAttribute('content');
                 }
+                // Read the engagement bar and description container directly; textContent
+                // does not force layout. Only sweep the whole document when none of the
+                // engagement controls exist (layout change, non-video page).
+                const pick = (selector) => {
+                    const el = document.querySelector(selector);
+                    return el ? (el.textContent || el.getAttribute('aria-label') || '').trim() : null;
+                };
+                // innerText-shaped lines for the caption/info container built from
+                // textContent: block tags start a new line, inline tags (hashtag links)
+                // stay on theirs.
+                const BLOCK = /^(DIV|P|H[1-6]|LI|UL|OL|SECTION|ARTICLE|HEADER|FOOTER|BUTTON|BR)$/;
+                const linesOf = (root) => {
+                    const lines = [''];
+                    const visit = (node) => {
+                        if (node.nodeType === Node.TEXT_NODE) {
+                            lines[lines.length - 1] += node.textContent;
+                        } else if (node.nodeType === Node.ELEMENT_NODE && !/^(SCRIPT|STYLE)$/.test(node.tagName)) {
+                            const block = BLOCK.test(node.tagName);
+                            if (block) lines.push('');
+                            node.childNodes.forEach(visit);
+                            if (block) lines.push('');
+                        }
+                    };
+                    visit(root);
+                    return lines.map((line) => line.trim()).filter(Boolean).join('\\n');
+                };
+                // Text for the risk check: the body's text nodes (no scripts or
+                // styles, bounded), plus a marker when a captcha container is mounted,
+                // since an overlay appended late in the body may fall past the bound.
+                const SKIP = /^(SCRIPT|STYLE|NOSCRIPT|TEMPLATE)$/;
+                const textOf = (root, limit) => {
+                    let out = '';
+                    const walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT, {
+                        acceptNode: (node) => SKIP.test(node.parentNode?.nodeName || '') ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_ACCEPT,
+                    });
+                    while (out.length < limit && walker.nextNode()) {
+                        const value = walker.currentNode.textContent.trim();
+                        if (value) out += value + '\\n';
+                    }
+                    return out.slice(0, limit);
+                };
+                const captcha = document.querySelector('#captcha_container, .captcha_verify_container, [id^="captcha"], iframe[src*="verify"]');
+                const info = document.querySelector('[data-e2e="detail-video-info"]') || document.querySelector('[data-e2e="video-desc"]');
+                let metrics = {
+                    liked: pick('[data-e2e="video-player-digg"]'),
+                    comment: pick('[data-e2e="feed-comment-icon"]'),
+                    collect: pick('[data-e2e="video-player-collect"]'),
+                };
+                if (Object.values(metrics).every((value) => value === null)) {
+                    const seen = new Set();
+                    for (const el of document.querySelectorAll('[aria-label], [title], button, [role="button"], span, div')) {
+                        const label = el.getAttribute('aria-label') || el.getAttribute('title') || '';
+                        const value = (label || (el.textContent || '').trim()).trim();
+                        if (value) seen.add(value);
+                        if (seen.size >= 500) break;
+                    }
+                    metrics = Array.from(seen);
+                }
                 return {
                     title: document.title,
                     url: location.href,
                     render,
                     initial,
                     metas,
-                    metrics: Array.from(document.querySelectorAll('[aria-label], [title], button, [role="button"], span, div'))
-                        .map((el) => {
-                            const label = el.getAttribute('aria-label') || el.getAttribute('title') || '';
-                            const text = (el.innerText || el.textContent || '').trim();
-                            return (label || text).trim();
-                        })
-                        .filter(Boolean)
-                        .filter((value, index, array) => array.indexOf(value) === index)
-                        .slice(0, 500),
-                    text: document.body ? document.body.innerText.slice(0, 3000) : ''
+                    metrics,
+                    desc: pick('[data-e2e="video-desc"]') || pick('[data-e2e="detail-video-info"] h1') || '',
+                    text: info ? linesOf(info).slice(0, 3000) : '',
+                    riskText: (captcha ? 'captcha\\n' : '') + (document.body ? textOf(document.body, 3000) : '')
                 };
             }"""
         )
         render_data = decode_render_data(page_data.get("render"))
         if render_data:
             page_data["renderDecoded"] = render_data
-        result = build_result(item, page.url, page_data.get("title", ""), page_data, response_data, captured_video_url, args.work_dir)
+        result = build_result(item, page.url, page_data.get("title", ""), page_data, capture, capture.captured_video_url, args.work_dir)
+        result["readyBy"] = ready_by
         if result.get("ok") and args.comment and item.get("commentText"):
             comment_result = post_comment(page, item.get("commentText"))
             result["commentAttempted"] = bool(comment_result.get("attempted"))
@@ -630,10 +854,154 @@ def scrape_one(page, item, args):
     except Exception as exc:
         return {"ok": False, "url": item["url"], "error": str(exc)}
     finally:
-        try:
-            page.remove_listener("response", on_response)
-        except Exception:
-            pass
+        capture.close()
+
+
+def scrape_one(page, item, args):
+    try:
+        capture = start_scrape(page, item)
+    except Exception as exc:
+        return {"ok": False, "url": item["url"], "error": str(exc)}
+    return finish_scrape(page, item, capture, args, ready_deadline(args))
+
+
+class RateGovernor:
+    # Token bucket shared by every worker tab. Each page navigation spends one
+    # token; a platform risk signal empties the bucket, pauses all tabs at once
+    # and halves the rate for the rest of the run.
+    def __init__(self, per_minute, backoff_ms):
+        self.rate = max(per_minute, 0.1) / 60
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.backoff_s = max(backoff_ms, 0) / 1000
+        self.risks = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def wait_s(self):
+        now = self._refill()
+        return max(self.paused_until - now, (1.0 - self.tokens) / self.rate, 0.0)
+
+    def take(self):
+        # Allowed to go negative so an unplanned retry navigation delays the next start.
+        self._refill()
+        self.tokens -= 1.0
+
+    def report_risk(self):
+        now = self._refill()
+        self.risks += 1
+        self.tokens = 0.0
+        self.rate /= 2
+        self.paused_until = now + self.backoff_s
+
+
+def rate_per_minute(args):
+    if args.rate_per_minute > 0:
+        return args.rate_per_minute
+    return 60000 / max(args.between_ms, 1000)
+
+
+def open_worker_pages(context, args, leave_open):
+    pages = []
+    for index in range(max(args.concurrency, 1)):
+        name = args.worker_tab_name if index == 0 else f"{args.worker_tab_name}-{index}"
+        if leave_open and (args.new_tab or index):
+            pages.append(get_worker_page(context, name))
+        elif leave_open and context.pages:
+            page = context.pages[0]
+            set_window_name(page, name)
+            pages.append(page)
+        else:
+            page = context.new_page()
+            if leave_open:
+                set_window_name(page, name)
+            pages.append(page)
+    return pages
+
+
+def run_concurrent(pages, items, args, report):
+    # Sync Playwright is bound to one thread, so tabs are interleaved instead of
+    # threaded: every tab navigates as soon as the governor allows and is harvested
+    # once it is ready; response events of all tabs keep dispatching meanwhile.
+    governor = RateGovernor(rate_per_minute(args), args.risk_backoff_ms)
+    pending = list(enumerate(items))
+    idle = list(pages)
+    active = []
+    probed = {}
+    stopping = False
+    while active or (pending and not stopping):
+        if pending and idle and not stopping and governor.wait_s() == 0:
+            page = idle.pop(0)
+            index, item = pending.pop(0)
+            governor.take()
+            try:
+                capture = start_scrape(page, item)
+            except Exception as exc:
+                idle.append(page)
+                stopping = report(index, item, {"ok": False, "url": item["url"], "error": str(exc)})
+                continue
+            active.append((ready_deadline(args), index, item, page, capture))
+            continue
+
+        now = time.monotonic()
+        due = [slot for slot in active if slot[0] <= now or response_ready(slot[3], slot[4])]
+        if not due and active:
+            # The DOM probe forces layout, so each poll probes only the tab that has
+            # gone longest without one; with N tabs each is probed every N polls.
+            slot = min(active, key=lambda entry: probed.get(id(entry[3]), 0.0))
+            probed[id(slot[3])] = now
+            if dom_ready(slot[3]):
+                due = [slot]
+        if due:
+            slot = min(due, key=lambda entry: entry[0])
+            active.remove(slot)
+            deadline, index, item, page, capture = slot
+            result = finish_scrape(page, item, capture, args, deadline, governor)
+            idle.append(page)
+            if RISK_ERROR_RE.search(str(result.get("error", ""))):
+                governor.report_risk()
+            if report(index, item, result):
+                stopping = True
+            continue
+
+        deadlines = [slot[0] - now for slot in active]
+        if pending and idle and not stopping:
+            deadlines.append(governor.wait_s())
+        wait_s = min(deadlines) if deadlines else 0.05
+        # Pump the event loop through Playwright; time.sleep would stall response dispatch.
+        (active[0][3] if active else pages[0]).wait_for_timeout(int(min(max(wait_s, 0.05), READY_POLL_MS / 1000) * 1000))
+
+
+def risk_backoff_allowance(args):
+    # Concurrent runs get one backoff by default so --risk-backoff-ms actually
+    # pauses the tabs; a sequential run has nothing to pause and stops at once.
+    if args.concurrency <= 1:
+        return 0
+    if args.risk_backoffs is None:
+        return CONCURRENT_RISK_BACKOFFS
+    return max(args.risk_backoffs, 0)
+
+
+def report_result(state, args, index, item, result):
+    # Prints one JSONL row tagged with the input's seq and returns True when the
+    # run should stop: too many consecutive failures, or a platform risk signal
+    # once the risk_backoff_allowance is spent.
+    result["seq"] = item.get("seq", index)
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+    if result.get("ok"):
+        state["consecutiveFailures"] = 0
+    else:
+        state["consecutiveFailures"] += 1
+    if RISK_ERROR_RE.search(str(result.get("error", ""))):
+        state["risks"] += 1
+        if state["risks"] > risk_backoff_allowance(args):
+            return True
+    return state["consecutiveFailures"] >= args.stop_after_consecutive_failures
 
 
 def get_window_name(page):
@@ -667,7 +1035,6 @@ def main():
 
     from playwright.sync_api import sync_playwright
 
-    consecutive_failures = 0
     with sync_playwright() as playwright:
         leave_open = False
         if args.cdp_url:
@@ -690,25 +1057,20 @@ def main():
             if cookies:
                 context.add_cookies(cookies)
 
-        if leave_open and args.new_tab:
-            page = get_worker_page(context, args.worker_tab_name)
+        state = {"consecutiveFailures": 0, "risks": 0}
+
+        def report(index, item, result):
+            return report_result(state, args, index, item, result)
+
+        pages = open_worker_pages(context, args, leave_open)
+        if args.concurrency > 1:
+            run_concurrent(pages, items, args, report)
         else:
-            page = context.pages[0] if leave_open and context.pages else context.new_page()
-            if leave_open:
-                set_window_name(page, args.worker_tab_name)
-        for index, item in enumerate(items):
-            if index:
-                time.sleep(max(args.between_ms, 0) / 1000)
-            result = scrape_one(page, item, args)
-            if result.get("ok"):
-                consecutive_failures = 0
-            else:
-                consecutive_failures += 1
-            print(json.dumps(result, ensure_ascii=False), flush=True)
-            if re.search(r"platform risk|captcha|verify|异常访问|安全验证", str(result.get("error", "")), re.I):
-                break
-            if consecutive_failures >= args.stop_after_consecutive_failures:
-                break
+            for index, item in enumerate(items):
+                if index:
+                    time.sleep(max(args.between_ms, 0) / 1000)
+                if report(index, item, scrape_one(pages[0], item, args)):
+                    break
 
         if not leave_open:
             context.close()
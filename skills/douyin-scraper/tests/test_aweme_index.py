@@ -0,0 +1,61 @@
+import importlib.util
+import json
+import os
+import ssl
+import unittest
+from unittest import mock
+
+
+HERE = os.path.dirname(__file__)
+SCRIPT = os.path.join(os.path.dirname(HERE), "scripts", "scrape-douyin.py")
+SPEC = importlib.util.spec_from_file_location("scrape_douyin_index", SCRIPT)
+scrape_douyin = importlib.util.module_from_spec(SPEC)
+_default_https_context = ssl._create_default_https_context
+SPEC.loader.exec_module(scrape_douyin)
+ssl._create_default_https_context = _default_https_context
+
+
+def load_fixture():
+    with open(os.path.join(HERE, "fixtures", "aweme_page.json"), encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+class AwemeIndexTests(unittest.TestCase):
+    def setUp(self):
+        fixture = load_fixture()
+        self.index = scrape_douyin.AwemeIndex(fixture["pageData"], *fixture["responses"])
+
+    def test_best_prefers_the_richest_record_for_the_id(self):
+        best = self.index.best("7001")
+
+        self.assertEqual(best["desc"], "目标视频（接口）")
+        self.assertEqual(len(self.index.by_id["7001"]), 2)
+        self.assertIsNone(self.index.best("9999"))
+
+    def test_largest_is_ranked_by_structural_size(self):
+        self.assertEqual(self.index.largest()["aweme_id"], "7002")
+        self.assertEqual(len(self.index.candidates), 3)
+
+    def test_video_url_picks_the_candidates_own_stream(self):
+        self.assertEqual(
+            self.index.video_url(self.index.best("7001")),
+            "https://www.douyin.com/aweme/v1/play/?video_id=v0200fg10000target",
+        )
+        self.assertEqual(self.index.video_url(self.index.largest()),
+                         "https://v26-web.douyinvod.com/related.mp4")
+        self.assertEqual(self.index.video_url({"video": {}}), "")
+
+    def test_stream_urls_are_collected_only_for_requested_candidates(self):
+        with mock.patch.object(scrape_douyin, "collect_video_urls",
+                               wraps=scrape_douyin.collect_video_urls) as collect:
+            index = scrape_douyin.AwemeIndex(load_fixture()["pageData"])
+            self.assertEqual(collect.call_count, 0)
+            aweme = index.best("7001")
+            index.video_url(aweme)
+            index.video_url(aweme)
+
+        self.assertEqual(collect.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import importlib.util
+import json
+import os
+import ssl
+import unittest
+
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "scripts", "scrape-douyin.py"
+)
+SPEC = importlib.util.spec_from_file_location("scrape_douyin_capture", SCRIPT)
+scrape_douyin = importlib.util.module_from_spec(SPEC)
+_default_https_context = ssl._create_default_https_context
+SPEC.loader.exec_module(scrape_douyin)
+ssl._create_default_https_context = _default_https_context
+
+DETAIL = "https://www.douyin.com/aweme/v1/web/aweme/detail/?aweme_id={}"
+
+
+class FakeResponse:
+    def __init__(self, url, body, headers=None):
+        self.url = url
+        self.headers = headers or {}
+        self.body = body
+        self.reads = 0
+
+    def text(self):
+        self.reads += 1
+        return self.body
+
+
+class FakePage:
+    def __init__(self):
+        self.listeners = []
+
+    def on(self, event, handler):
+        self.listeners.append(handler)
+
+    def remove_listener(self, event, handler):
+        self.listeners.remove(handler)
+
+    def respond(self, url, body, headers=None):
+        response = FakeResponse(url, body, headers)
+        for handler in list(self.listeners):
+            handler(response)
+        return response
+
+
+class ResponseCaptureTests(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.capture = scrape_douyin.ResponseCapture(self.page)
+
+    def test_empty_or_null_detail_body_is_not_ready(self):
+        self.page.respond(DETAIL.format(7), "")
+        self.page.respond(DETAIL.format(7), json.dumps({"aweme_detail": None, "status_code": 0}))
+
+        self.assertFalse(self.capture.has_detail("7"))
+
+    def test_ready_once_body_carries_the_matching_aweme(self):
+        self.page.respond(DETAIL.format(7), json.dumps({"aweme_detail": {"aweme_id": "8"}}))
+        self.assertFalse(self.capture.has_detail("7"))
+
+        self.page.respond(DETAIL.format(7), json.dumps({"aweme_detail": {"aweme_id": "7", "desc": "x"}}))
+
+        self.assertTrue(self.capture.has_detail("7"))
+
+    def test_only_the_matching_entry_is_read_and_parsed(self):
+        first = self.page.respond(DETAIL.format(1), json.dumps({"aweme_detail": {"aweme_id": "1"}}))
+        second = self.page.respond(DETAIL.format(2), json.dumps({"aweme_detail": {"aweme_id": "2"}}))
+        self.assertEqual((first.reads, second.reads), (0, 0))
+
+        self.assertTrue(self.capture.has_detail("2"))
+        self.assertTrue(self.capture.has_detail("2"))
+
+        self.assertEqual((first.reads, second.reads), (0, 1))
+        self.assertEqual(len(list(self.capture)), 2)
+        self.assertEqual(first.reads, 1)
+
+    def test_oversized_bodies_are_skipped_without_reading(self):
+        limit = scrape_douyin.MAX_RESPONSE_BYTES
+        declared = self.page.respond(DETAIL.format(3), "{}", {"content-length": str(limit + 1)})
+        self.assertEqual(len(self.capture.responses), 0)
+        self.assertEqual(declared.reads, 0)
+
+        undeclared = self.page.respond(DETAIL.format(3), " " * (limit + 1))
+        self.assertFalse(self.capture.has_detail("3"))
+        self.assertEqual(undeclared.reads, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
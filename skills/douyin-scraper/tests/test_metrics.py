@@ -0,0 +1,74 @@
+import importlib.util
+import os
+import ssl
+import unittest
+
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "scripts", "scrape-douyin.py"
+)
+SPEC = importlib.util.spec_from_file_location("scrape_douyin_metrics", SCRIPT)
+scrape_douyin = importlib.util.module_from_spec(SPEC)
+_default_https_context = ssl._create_default_https_context
+SPEC.loader.exec_module(scrape_douyin)
+ssl._create_default_https_context = _default_https_context
+
+
+class DomMetricsTests(unittest.TestCase):
+    def test_targeted_controls_parse_counts(self):
+        metrics = scrape_douyin.parse_visible_dom_metrics(
+            {"liked": "1.2万", "comment": "3,456", "collect": "78"}
+        )
+
+        self.assertEqual(metrics, {"likedCount": 12000, "commentCount": 3456, "collectedCount": 78})
+
+    def test_only_bare_labels_mean_zero(self):
+        metrics = scrape_douyin.parse_visible_dom_metrics(
+            {"liked": "赞", "comment": "抢首评", "collect": "收藏"}
+        )
+
+        self.assertEqual(metrics, {"likedCount": 0, "commentCount": 0, "collectedCount": 0})
+
+    def test_label_without_a_number_is_unknown(self):
+        metrics = scrape_douyin.parse_visible_dom_metrics(
+            {"liked": "点赞", "comment": "评论", "collect": None}
+        )
+
+        self.assertEqual(metrics, {})
+
+
+class BuildResultRiskTests(unittest.TestCase):
+    URL = "https://www.douyin.com/video/7001"
+
+    def build(self, page_data):
+        return scrape_douyin.build_result(
+            {"url": self.URL}, self.URL, page_data.get("title", ""), page_data, [], "", "/tmp"
+        )
+
+    def test_captcha_page_is_reported_as_risk(self):
+        page_data = {
+            "title": "抖音",
+            "text": "",
+            "riskText": "captcha\n请完成下列验证后继续\n按住左边按钮拖动完成上方拼图",
+            "metrics": {"liked": None, "comment": None, "collect": None},
+        }
+
+        result = self.build(page_data)
+
+        self.assertEqual(result, {"ok": False, "url": self.URL, "error": "platform risk detected"})
+
+    def test_published_caption_outweighs_risk_words_elsewhere(self):
+        page_data = {
+            "title": "目标视频 - 抖音",
+            "text": "目标视频\n发布时间：2026-10-01 12:00",
+            "riskText": "账号安全验证中心\n目标视频\n发布时间：2026-10-01 12:00",
+            "metrics": {"liked": "12", "comment": "3", "collect": "4"},
+        }
+
+        result = self.build(page_data)
+
+        self.assertNotEqual(result.get("error"), "platform risk detected")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import ssl
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "scripts", "scrape-douyin.py"
+)
+SPEC = importlib.util.spec_from_file_location("scrape_douyin_scheduler", SCRIPT)
+scrape_douyin = importlib.util.module_from_spec(SPEC)
+# 脚本导入时会关闭全局证书校验；测试进程里还原，免得影响同一进程的其他测试
+_default_https_context = ssl._create_default_https_context
+SPEC.loader.exec_module(scrape_douyin)
+ssl._create_default_https_context = _default_https_context
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateGovernorTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(scrape_douyin.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_navigation_is_free_then_tokens_refill_at_the_rate(self):
+        governor = scrape_douyin.RateGovernor(per_minute=6, backoff_ms=120000)
+
+        self.assertEqual(governor.wait_s(), 0)
+        governor.take()
+        self.assertAlmostEqual(governor.wait_s(), 10.0)
+        self.clock.now += 4
+        self.assertAlmostEqual(governor.wait_s(), 6.0)
+        self.clock.now += 6
+        self.assertEqual(governor.wait_s(), 0)
+
+    def test_unplanned_take_goes_negative_and_delays_the_next_start(self):
+        governor = scrape_douyin.RateGovernor(per_minute=6, backoff_ms=0)
+
+        governor.take()
+        governor.take()
+
+        self.assertAlmostEqual(governor.wait_s(), 20.0)
+
+    def test_risk_pauses_everyone_and_halves_the_rate(self):
+        governor = scrape_douyin.RateGovernor(per_minute=6, backoff_ms=120000)
+        self.clock.now += 30  # 桶已满，不会超过 1 个令牌
+
+        governor.report_risk()
+
+        self.assertEqual(governor.risks, 1)
+        self.assertAlmostEqual(governor.wait_s(), 120.0)
+        self.clock.now += 119
+        self.assertAlmostEqual(governor.wait_s(), 1.0)
+        self.clock.now += 1
+        self.assertEqual(governor.wait_s(), 0)
+        governor.take()
+        self.assertAlmostEqual(governor.wait_s(), 20.0)  # 速率减半后 1 个令牌要 20 秒
+
+
+class FakeTab:
+    def __init__(self, log, dom_ready_after):
+        self.url = ""
+        self.log = log
+        self.dom_ready_after = dom_ready_after
+        self.dom_probes = 0
+
+    def evaluate(self, script, *args):
+        assert script == scrape_douyin.READY_JS
+        self.dom_probes += 1
+        ready = self.dom_probes >= self.dom_ready_after
+        self.log.append(("dom", self, ready))
+        return ready
+
+    def wait_for_timeout(self, ms):
+        self.log.append(("wait", None, None))
+
+
+class FakeCapture:
+    def __init__(self, ready):
+        self.ready = ready
+
+    def has_detail(self, aweme_id):
+        return self.ready
+
+
+class RunConcurrentTests(unittest.TestCase):
+    def test_response_signal_first_and_one_dom_probe_per_poll(self):
+        log = []
+        fast = FakeTab(log, dom_ready_after=99)
+        slow = [FakeTab(log, dom_ready_after=3), FakeTab(log, dom_ready_after=4)]
+        items = [{"url": f"https://www.douyin.com/video/{n}"} for n in (1, 2, 3)]
+        harvested = []
+
+        def start(page, item):
+            page.url = item["url"]
+            return FakeCapture(ready=page is fast)
+
+        def finish(page, item, capture, args, deadline, governor=None):
+            harvested.append(page)
+            return {"ok": True, "url": item["url"]}
+
+        args = SimpleNamespace(rate_per_minute=600000, between_ms=0, risk_backoff_ms=0, page_wait_ms=60000)
+        with mock.patch.object(scrape_douyin, "start_scrape", start), \
+                mock.patch.object(scrape_douyin, "finish_scrape", finish):
+            scrape_douyin.run_concurrent([fast] + slow, items, args, lambda index, item, result: False)
+
+        self.assertEqual(harvested[0], fast)
+        self.assertEqual(sorted(map(id, harvested)), sorted(map(id, [fast] + slow)))
+        self.assertEqual(fast.dom_probes, 0)
+        # 两次轮询之间最多一次 DOM 探测（除非上一次探测已命中、当轮直接收割）
+        for previous, current in zip(log, log[1:]):
+            if previous[0] == "dom" and current[0] == "dom":
+                self.assertTrue(previous[2])
+
+
+class ReportResultTests(unittest.TestCase):
+    def make_args(self, **overrides):
+        values = {"risk_backoffs": None, "concurrency": 1, "stop_after_consecutive_failures": 3}
+        values.update(overrides)
+        return SimpleNamespace(**values)
+
+    def report(self, state, args, index, item, result):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            stop = scrape_douyin.report_result(state, args, index, item, result)
+        return stop, json.loads(out.getvalue())
+
+    def test_rows_are_tagged_with_input_seq_or_position(self):
+        state = {"consecutiveFailures": 0, "risks": 0}
+        args = self.make_args()
+
+        _, tagged = self.report(state, args, 4, {"url": "u", "seq": 17}, {"ok": True})
+        _, positional = self.report(state, args, 5, {"url": "u"}, {"ok": True})
+
+        self.assertEqual(tagged["seq"], 17)
+        self.assertEqual(positional["seq"], 5)
+
+    def test_stops_after_consecutive_failures_and_success_resets_the_count(self):
+        state = {"consecutiveFailures": 0, "risks": 0}
+        args = self.make_args()
+        failure = {"ok": False, "error": "timeout"}
+
+        stops = [self.report(state, args, i, {}, dict(failure))[0] for i in range(2)]
+        stops.append(self.report(state, args, 2, {}, {"ok": True})[0])
+        stops += [self.report(state, args, i, {}, dict(failure))[0] for i in range(3)]
+
+        self.assertEqual(stops, [False, False, False, False, False, True])
+
+    def test_sequential_run_stops_on_first_risk_signal(self):
+        state = {"consecutiveFailures": 0, "risks": 0}
+        args = self.make_args(risk_backoffs=3, concurrency=1)
+
+        stop, _ = self.report(state, args, 0, {}, {"ok": False, "error": "安全验证"})
+
+        self.assertTrue(stop)
+
+    def test_concurrent_run_backs_off_until_allowance_is_spent(self):
+        state = {"consecutiveFailures": 0, "risks": 0}
+        args = self.make_args(risk_backoffs=1, concurrency=3, stop_after_consecutive_failures=10)
+        risk = {"ok": False, "error": "captcha required"}
+
+        first, _ = self.report(state, args, 0, {}, dict(risk))
+        second, _ = self.report(state, args, 1, {}, dict(risk))
+
+        self.assertFalse(first)
+        self.assertTrue(second)
+        self.assertEqual(state["risks"], 2)
+
+    def test_concurrent_run_backs_off_once_by_default(self):
+        state = {"consecutiveFailures": 0, "risks": 0}
+        args = self.make_args(concurrency=3, stop_after_consecutive_failures=10)
+        risk = {"ok": False, "error": "platform risk detected"}
+
+        stops = [self.report(state, args, i, {}, dict(risk))[0] for i in range(2)]
+
+        self.assertEqual(stops, [False, True])
+        self.assertEqual(scrape_douyin.risk_backoff_allowance(self.make_args(concurrency=3, risk_backoffs=0)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
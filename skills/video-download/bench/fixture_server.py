@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+本地 CDN / 解析接口替身，供 bench/run_bench.py 压测下载链路用。
+
+路由:
+  GET /media/<名字>?size=N       合成的 MP4 字节（同一名字内容固定），size 默认取配置
+  GET /dash/video.m4s            DASH 视频轨（video_size 字节）
+  GET /dash/audio.m4s            DASH 音频轨（audio_size 字节）
+  GET /tikwm/api/?url=...        tikwm 兼容响应，play 指向 /media/tiktok_<id>.mp4
+  GET /resolver?url=...          视频号解析器兼容响应，videoUrl 指向 /media/sph_<id>.mp4
+
+可调项（FixtureConfig）：单连接带宽、首字节延迟、是否支持 Range、按概率注入 500 / 中途断流。
+"""
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+
+class FixtureConfig:
+    """fixture 服务的行为参数；bandwidth 为单连接字节/秒，0 表示不限速。"""
+
+    def __init__(self, size=32 * 1024 * 1024, video_size=None, audio_size=None,
+                 bandwidth=0, latency_s=0.0, ranges=True, fail_rate=0.0,
+                 truncate_rate=0.0, seed=1):
+        self.size = size
+        self.video_size = video_size or size
+        self.audio_size = audio_size or max(size // 8, 1)
+        self.bandwidth = bandwidth
+        self.latency_s = latency_s
+        self.ranges = ranges
+        self.fail_rate = fail_rate
+        self.truncate_rate = truncate_rate
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+_BLOCK = bytes(range(256)) * 256  # 64KB 重复块，按偏移切片生成任意长度的确定性内容
+
+
+def payload_slice(start, end):
+    """合成内容中 [start, end] 区间的字节。"""
+    out = bytearray()
+    offset = start
+    while offset <= end:
+        base = offset % len(_BLOCK)
+        take = min(len(_BLOCK) - base, end - offset + 1)
+        out += _BLOCK[base:base + take]
+        offset += take
+    return bytes(out)
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'video-download-fixture'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        config = server.config
+        with server.stats_lock:
+            server.stats['requests'] += 1
+        if config.latency_s:
+            time.sleep(config.latency_s)
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        if parts.path.startswith('/media/'):
+            size = int(query.get('size', [config.size])[0])
+            return self._send_media(size)
+        if parts.path == '/dash/video.m4s':
+            return self._send_media(config.video_size)
+        if parts.path == '/dash/audio.m4s':
+            return self._send_media(config.audio_size)
+        if parts.path.rstrip('/') == '/tikwm/api':
+            video_id = self._video_id(query)
+            return self._send_json({'code': 0, 'msg': 'success', 'data': {
+                'id': video_id,
+                'play': f'{server.base_url}/media/tiktok_{video_id}.mp4',
+                'duration': 0,
+            }})
+        if parts.path == '/resolver':
+            video_id = self._video_id(query)
+            return self._send_json({'code': 0, 'data': {'feedInfo': {
+                'videoUrl': f'{server.base_url}/media/sph_{video_id}.mp4',
+                'description': f'fixture {video_id}',
+                'nickname': 'bench',
+            }}})
+        self.send_error(404)
+
+    def _video_id(self, query):
+        url = query.get('url', [''])[0]
+        m = re.search(r'(?:/video/|/sph/)([A-Za-z0-9_-]+)', url)
+        return m.group(1) if m else '0'
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _roll(self, rate):
+        if not rate:
+            return False
+        with self.server.stats_lock:
+            return self.server.rng.random() < rate
+
+    def _send_media(self, size):
+        config = self.server.config
+        m = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if m and config.ranges:
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else size - 1, size - 1)
+            # 只对真正的分段请求注入故障，探测用的 bytes=0-0 放行
+            if end > start and self._roll(config.fail_rate):
+                with self.server.stats_lock:
+                    self.server.stats['injected_failures'] += 1
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+            if config.ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', f'"fixture-{size}"')
+        self.end_headers()
+
+        cut_at = None
+        if end > start and self._roll(config.truncate_rate):
+            cut_at = start + (end - start) // 2
+            with self.server.stats_lock:
+                self.server.stats['injected_truncations'] += 1
+        self._write_body(start, end, cut_at)
+
+    def _write_body(self, start, end, cut_at):
+        """按配置的单连接带宽分块写出；cut_at 不为空时写到该处就断开连接。"""
+        config = self.server.config
+        chunk = 64 * 1024
+        began = time.monotonic()
+        sent = 0
+        offset = start
+        try:
+            while offset <= end:
+                stop = min(offset + chunk, end + 1)
+                if cut_at is not None and stop > cut_at:
+                    self.wfile.write(payload_slice(offset, cut_at - 1))
+                    self.close_connection = True
+                    return
+                self.wfile.write(payload_slice(offset, stop - 1))
+                sent += stop - offset
+                offset = stop
+                if config.bandwidth:
+                    ahead = sent / config.bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            with self.server.stats_lock:
+                self.server.stats['bytes_sent'] += offset - start
+
+
+class FixtureServer:
+    """在 127.0.0.1 随机端口后台运行的 fixture 服务，可作为 with 语句使用。"""
+
+    def __init__(self, config=None):
+        self.config = config or FixtureConfig()
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.httpd.rng = random.Random(self.config.seed)
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.stats = {'requests': 0, 'bytes_sent': 0,
+                            'injected_failures': 0, 'injected_truncations': 0}
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.httpd.base_url = self.base_url
+        self._thread = None
+
+    @property
+    def stats(self):
+        with self.httpd.stats_lock:
+            return dict(self.httpd.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name='bench-fixture', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='单独运行 fixture 服务（手动调试用）')
+    parser.add_argument('--size-mb', type=float, default=32)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help='单连接带宽 MB/s，0 不限速')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--no-ranges', action='store_true')
+    args = parser.parse_args()
+    server = FixtureServer(FixtureConfig(
+        size=int(args.size_mb * 1048576), bandwidth=int(args.bandwidth_mbps * 1048576),
+        latency_s=args.latency_ms / 1000, ranges=not args.no_ranges,
+    )).start()
+    print(f'fixture 服务: {server.base_url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
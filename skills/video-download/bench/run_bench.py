@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+video-download 下载链路基准测试：对本地 fixture 服务跑各引擎的传输路径，输出可在提交间 diff 的 JSON。
+
+用法:
+  python3 bench/run_bench.py                                  # 跑全部场景，JSON 打到 stdout
+  python3 bench/run_bench.py -s download_file -s batch --repeat 5 --size-mb 64
+  python3 bench/run_bench.py --bandwidth-mbps 8 --latency-ms 50 --fail-rate 0.05 -o after.json
+  python3 bench/run_bench.py --compare before.json after.json # 对比两次结果
+
+场景:
+  download_file        直链下载（Range 探测 + 分段并发 / 单连接）
+  bilibili_dash        B站 DASH 两路并发，经命名管道喂给合并进程
+  bilibili_dash_files  B站 DASH 两路并发落盘再合并
+  tikwm                TikTok tikwm 兜底：解析接口 + 直链下载
+  batch                batch 模式：视频号条目经解析器接口 + 直链下载，按引擎并发
+
+每个场景在独立子进程里运行，峰值 RSS 与子进程数只算该场景自己的；fixture 服务跑在父进程。
+fixture 给的是合成字节而不是真视频，所以 ffprobe 校验换成固定结果、合并用直通拼接代替 ffmpeg，
+测的是网络、分段、管道与调度开销，不含 ffmpeg/ffprobe 本身的耗时（结果里的 probe / mux 字段注明了这一点）。
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(os.path.dirname(BENCH_DIR), 'scripts', 'download.py')
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import FixtureConfig, FixtureServer  # noqa: E402
+
+SCENARIOS = ('download_file', 'bilibili_dash', 'bilibili_dash_files', 'tikwm', 'batch')
+
+# 直通"合并"：依次读完两路输入拼接到输出，代替 ffmpeg -c copy
+PASSTHROUGH_MUX = (
+    'import shutil, sys\n'
+    'with open(sys.argv[3], "wb") as out:\n'
+    '    for name in sys.argv[1:3]:\n'
+    '        with open(name, "rb") as src:\n'
+    '            shutil.copyfileobj(src, out, 1 << 20)\n'
+)
+
+SYNTHETIC_PROBE = {
+    'has_video': True, 'has_audio': True, 'video_codec': 'h264', 'audio_codec': 'aac',
+    'duration': None, 'bit_rate': None, 'width': 1080, 'height': 1920,
+    'streams': ['video', 'audio'],
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def _max_rss_mb(who):
+    # Linux 的 ru_maxrss 单位是 KB，macOS 是字节
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1048576 if sys.platform == 'darwin' else 1024), 1)
+
+
+# ── 子进程：实际跑一个场景 ────────────────────────────────
+
+def _load_download_module():
+    spec = importlib.util.spec_from_file_location('video_download_bench', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _count_subprocesses():
+    """把 subprocess.Popen 换成计数的子类，返回计数器 dict。"""
+    counter = {'count': 0}
+    base = subprocess.Popen
+
+    class CountingPopen(base):
+        def __init__(self, *args, **kwargs):
+            counter['count'] += 1
+            super().__init__(*args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    return counter
+
+
+def _timed(fn, *args):
+    started = time.monotonic()
+    fn(*args)
+    return time.monotonic() - started
+
+
+def run_scenario(name, base_url, repeat, out_dir):
+    """在当前进程跑一个场景，返回 (各条耗时, 输出字节数, 错误信息列表, 附加信息)。"""
+    vd = _load_download_module()
+    vd.probe_media = lambda path: dict(SYNTHETIC_PROBE)
+
+    def passthrough(video_input, audio_input, output_path):
+        return [sys.executable, '-c', PASSTHROUGH_MUX, video_input, audio_input, output_path]
+
+    vd.dash_mux_command = passthrough
+    latencies, total_bytes, errors = [], 0, []
+    extra = {'probe': 'synthetic', 'mux': 'passthrough'}
+
+    def sized(path):
+        return os.path.getsize(path) if path and os.path.isfile(path) else 0
+
+    if name == 'download_file':
+        for i in range(repeat):
+            path = os.path.join(out_dir, f'file_{i}.mp4')
+            try:
+                latencies.append(_timed(vd.download_file, f'{base_url}/media/file_{i}.mp4',
+                                        path, f'{base_url}/'))
+                total_bytes += sized(path)
+            except Exception as exc:
+                errors.append(str(exc))
+    elif name in ('bilibili_dash', 'bilibili_dash_files'):
+        mux = vd.mux_dash_streaming if name == 'bilibili_dash' else vd.mux_dash_files
+        for i in range(repeat):
+            path = os.path.join(out_dir, f'dash_{i}.mp4')
+            try:
+                latencies.append(_timed(mux, f'{base_url}/dash/video.m4s',
+                                        f'{base_url}/dash/audio.m4s', path, f'{base_url}/'))
+                total_bytes += sized(path)
+            except Exception as exc:
+                errors.append(str(exc))
+    elif name == 'tikwm':
+        for i in range(repeat):
+            url = f'https://www.tiktok.com/@bench/video/{7000000000000000000 + i}'
+            try:
+                started = time.monotonic()
+                path = vd.download_tiktok_tikwm(url, f'tiktok_{i}.mp4')
+                latencies.append(time.monotonic() - started)
+                total_bytes += sized(path)
+            except Exception as exc:
+                errors.append(str(exc))
+    elif name == 'batch':
+        items = vd.read_batch_items(
+            f'https://weixin.qq.com/sph/bench{i:04d}' for i in range(repeat)
+        )
+        results = vd.run_batch(items, lambda result: None)
+        for result in results:
+            latencies.append(result['elapsed_s'])
+            if result['ok']:
+                total_bytes += sized(result['output_path'])
+            else:
+                errors.append(result['error'])
+        extra['workers'] = vd.BATCH_DEFAULT_WORKERS
+        extra['engine_limit'] = vd.BATCH_DEFAULT_LIMITS['wechat_channels']
+    else:
+        raise SystemExit(f'未知场景: {name}')
+    return latencies, total_bytes, errors, extra
+
+
+def child_main(args):
+    counter = _count_subprocesses()
+    with tempfile.TemporaryDirectory(prefix='vd_bench_') as out_dir:
+        os.environ['VIDEO_DOWNLOAD_OUTPUT_DIR'] = out_dir
+        started = time.monotonic()
+        latencies, total_bytes, errors, extra = run_scenario(
+            args.child, args.base_url, args.repeat, out_dir)
+        wall = time.monotonic() - started
+    result = {
+        'items': args.repeat,
+        'failed': len(errors),
+        'bytes': total_bytes,
+        'wall_s': round(wall, 4),
+        'mb_per_s': round(total_bytes / 1048576 / wall, 2) if wall > 0 else None,
+        'latency_p50_s': percentile(latencies, 50),
+        'latency_p95_s': percentile(latencies, 95),
+        'latency_max_s': round(max(latencies), 4) if latencies else None,
+        'peak_rss_mb': _max_rss_mb(resource.RUSAGE_SELF),
+        'children_peak_rss_mb': _max_rss_mb(resource.RUSAGE_CHILDREN),
+        'subprocesses': counter['count'],
+        'errors': errors[:5],
+        **extra,
+    }
+    with open(args.result_file, 'w', encoding='utf-8') as handle:
+        json.dump(result, handle)
+    return 0
+
+
+# ── 父进程：起 fixture、逐个场景起子进程、汇总 ────────────
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_child(scenario, server, args):
+    with tempfile.TemporaryDirectory(prefix='vd_bench_home_') as home:
+        result_file = os.path.join(home, 'result.json')
+        env = dict(
+            os.environ,
+            HOME=home,  # 不读写用户真实的 Cookie、记分板与缓存
+            VIDEO_DOWNLOAD_CACHE='0',
+            VIDEO_DOWNLOAD_ADAPTIVE_ENGINES='0',
+            VIDEO_DOWNLOAD_DAEMON='0',
+            VIDEO_DOWNLOAD_TIKWM_API=f'{server.base_url}/tikwm/api/',
+            WECHAT_CHANNELS_RESOLVER_URL=f'{server.base_url}/resolver',
+        )
+        env.pop('WECHAT_CHANNELS_RESOLVER_API_KEY', None)
+        if args.connections:
+            env['VIDEO_DOWNLOAD_CONNECTIONS'] = str(args.connections)
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', scenario,
+               '--base-url', server.base_url, '--repeat', str(args.repeat),
+               '--result-file', result_file]
+        before = server.stats
+        proc = subprocess.run(cmd, env=env, timeout=args.timeout,
+                              stdout=None if args.verbose else subprocess.DEVNULL,
+                              stderr=None if args.verbose else subprocess.PIPE, text=True)
+        after = server.stats
+        if proc.returncode != 0 or not os.path.exists(result_file):
+            tail = (proc.stderr or '').strip().splitlines()[-5:]
+            return {'crashed': True, 'exit_code': proc.returncode, 'stderr_tail': tail}
+        with open(result_file, encoding='utf-8') as handle:
+            result = json.load(handle)
+    result['fixture'] = {key: after[key] - before[key] for key in after}
+    return result
+
+
+def bench_main(args):
+    config = FixtureConfig(
+        size=int(args.size_mb * 1048576),
+        audio_size=int(args.size_mb * 1048576 / 8),
+        bandwidth=int(args.bandwidth_mbps * 1048576),
+        latency_s=args.latency_ms / 1000,
+        ranges=not args.no_ranges,
+        fail_rate=args.fail_rate,
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+    )
+    report = {
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'config': dict(config.as_dict(), repeat=args.repeat, connections=args.connections),
+        'scenarios': {},
+    }
+    with FixtureServer(config) as server:
+        for scenario in args.scenario or SCENARIOS:
+            print(f'[bench] {scenario} ...', file=sys.stderr)
+            report['scenarios'][scenario] = run_child(scenario, server, args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(text + '\n')
+        print(f'[bench] 结果已写入 {args.output}', file=sys.stderr)
+    else:
+        print(text)
+    failed = [name for name, r in report['scenarios'].items() if r.get('crashed') or r.get('failed')]
+    return 1 if failed else 0
+
+
+COMPARE_KEYS = ('mb_per_s', 'latency_p50_s', 'latency_p95_s', 'peak_rss_mb', 'subprocesses', 'failed')
+
+
+def compare_main(old_path, new_path):
+    """逐场景对比两份结果的关键指标，输出 JSON（含相对变化）。"""
+    with open(old_path, encoding='utf-8') as handle:
+        old = json.load(handle)
+    with open(new_path, encoding='utf-8') as handle:
+        new = json.load(handle)
+    diff = {'old': old.get('revision'), 'new': new.get('revision'), 'scenarios': {}}
+    for name in new.get('scenarios', {}):
+        before = old.get('scenarios', {}).get(name, {})
+        after = new['scenarios'][name]
+        rows = {}
+        for key in COMPARE_KEYS:
+            a, b = before.get(key), after.get(key)
+            row = {'old': a, 'new': b}
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+                row['change_pct'] = round((b - a) / a * 100, 1)
+            rows[key] = row
+        diff['scenarios'][name] = rows
+    print(json.dumps(diff, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='video-download 下载链路基准测试（本地 fixture 服务）')
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS,
+                        help='只跑指定场景，可重复；默认全部')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的条目数（默认 3）')
+    parser.add_argument('--size-mb', type=float, default=32, help='单个文件大小 MB（默认 32）')
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help='单连接带宽 MB/s，0 不限速')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个请求的首字节延迟')
+    parser.add_argument('--no-ranges', action='store_true', help='fixture 不支持 Range')
+    parser.add_argument('--fail-rate', type=float, default=0, help='分段请求返回 500 的概率')
+    parser.add_argument('--truncate-rate', type=float, default=0, help='响应中途断流的概率')
+    parser.add_argument('--seed', type=int, default=1, help='故障注入的随机种子')
+    parser.add_argument('--connections', type=int, default=0,
+                        help='覆盖 VIDEO_DOWNLOAD_CONNECTIONS（默认沿用脚本默认值）')
+    parser.add_argument('--timeout', type=float, default=600, help='单个场景的超时秒数')
+    parser.add_argument('-o', '--output', help='把 JSON 结果写入文件而不是 stdout')
+    parser.add_argument('-v', '--verbose', action='store_true', help='显示下载脚本自身的输出')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两份结果 JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.compare:
+        return compare_main(*args.compare)
+    if args.child:
+        return child_main(args)
+    return bench_main(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
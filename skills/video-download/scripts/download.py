@@ -5,6 +5,9 @@
   python3 download.py <分享链接或文本> [输出文件名]
   python3 download.py resolve <视频号分享链接>  # 仅解析视频号元数据和临时直链
   python3 download.py login <平台>    # 登录并保存 cookie（bilibili/douyin/xiaohongshu）
+  python3 download.py batch [文件|-]   # 批量下载（每行一条分享文本或 JSONL），逐条输出 JSON 结果
+  python3 download.py plan [文件|-]    # 只打印批处理执行计划（短链展开、去重、按引擎分组）
+  python3 download.py serve [--port N] # 常驻下载服务（运行时单条下载会自动转发给它）
 
 支持平台:
   - 微信视频号: weixin.qq.com/sph/xxx                        [自托管解析器]
@@ -19,15 +22,35 @@ import re
 import os
 import ssl
 import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+import collections
 import subprocess
-import urllib.request
+import asyncio
 import urllib.parse
+import urllib.request
+import socket
+import base64
+import errno
+import hashlib
+import sqlite3
 import shutil
+import atexit
+import hmac
+import signal
+import secrets
+import http.server
 import tempfile
 import functools
+import concurrent.futures
 from datetime import datetime
-
-ssl._create_default_https_context = ssl._create_unverified_context
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，状态文件只做进程内互斥
+    fcntl = None
 
 UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 COOKIE_DIR = os.path.expanduser('~/.config/video-download')
@@ -38,22 +61,142 @@ def get_cookie_path(platform):
     """获取平台 cookie 文件路径"""
     return os.path.join(COOKIE_DIR, f'{platform}_cookies.json')
 
-def load_cookies(platform):
-    """加载已保存的 cookie，返回 list 或 None"""
-    path = get_cookie_path(platform)
-    if os.path.exists(path):
+class CookieStore:
+    """进程内的平台 Cookie 缓存。
+
+    每个平台的 JSON 只在文件 (mtime, size) 变化时重新解析；给 yt-dlp 用的 Netscape 导出放在
+    私有目录（0700，进程退出时删除），源文件不变就一直复用同一份。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._export_dir = None
+
+    def _stamp(self, path):
         try:
-            with open(path, 'r') as f:
-                cookies = json.load(f)
-            # 检查关键 cookie 是否过期
-            if cookies_expired(platform, cookies):
-                print(f"  {platform} cookie 已过期")
-                return None
-            print(f"  已加载 {platform} 登录态 ({len(cookies)} cookies)")
-            return cookies
-        except Exception:
+            st = os.stat(path)
+        except OSError:
             return None
-    return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _entry(self, platform):
+        # 调用方持有 self._lock
+        path = get_cookie_path(platform)
+        stamp = self._stamp(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry
+        cookies = error = None
+        if stamp is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    cookies = json.load(f)
+            except (OSError, ValueError) as exc:
+                error = exc
+        entry = {'stamp': stamp, 'cookies': cookies, 'error': error,
+                 'export': None, 'export_stamp': None, 'export_expires': None}
+        self._entries[path] = entry
+        return entry
+
+    def get(self, platform):
+        """返回平台 Cookie 列表；文件不存在或无法解析时返回 None。"""
+        with self._lock:
+            return self._entry(platform)['cookies']
+
+    def stamp(self, platform):
+        """该平台 Cookie 文件当前的 (mtime_ns, size)，文件不存在时为 None；用来判断下游缓存是否过期。"""
+        return self._stamp(get_cookie_path(platform))
+
+    def error(self, platform):
+        """最近一次读取该平台 Cookie 文件时的异常（没有则为 None）。"""
+        with self._lock:
+            return self._entry(platform)['error']
+
+    def invalidate(self, platform):
+        with self._lock:
+            entry = self._entries.pop(get_cookie_path(platform), None)
+        if entry and entry['export'] and os.path.exists(entry['export']):
+            os.remove(entry['export'])
+
+    def netscape_path(self, platform):
+        """返回该平台 Cookie 的 Netscape 导出路径（0600）；没有可用 Cookie 时返回 None。
+
+        源文件变化、导出文件被外部改写（yt-dlp 退出时会回写）或其中有 Cookie 过期时才重新生成。
+        """
+        with self._lock:
+            entry = self._entry(platform)
+            now = time.time()
+            export = entry['export']
+            if (export and self._stamp(export) == entry['export_stamp']
+                    and (entry['export_expires'] is None or entry['export_expires'] > now)):
+                return export
+            valid = []
+            for cookie in entry['cookies'] or []:
+                expires = cookie.get('expires', 0) or 0
+                if expires > 0 and expires < now:
+                    continue
+                if not all(cookie.get(key) for key in ('domain', 'name')):
+                    continue
+                valid.append(cookie)
+            if not valid:
+                entry['export'] = None
+                return None
+            if self._export_dir is None or not os.path.isdir(self._export_dir):
+                self._export_dir = tempfile.mkdtemp(prefix='video_download_cookies_')
+            export = os.path.join(self._export_dir, f'{platform}.cookies.txt')
+            write_netscape_cookies(export, valid)
+            expiries = [c['expires'] for c in valid if (c.get('expires', 0) or 0) > 0]
+            entry.update(export=export, export_stamp=self._stamp(export),
+                         export_expires=min(expiries) if expiries else None)
+            return export
+
+    def close(self):
+        with self._lock:
+            export_dir, self._export_dir = self._export_dir, None
+            self._entries.clear()
+        if export_dir:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+cookie_store = CookieStore()
+atexit.register(cookie_store.close)
+
+def write_netscape_cookies(path, cookies):
+    """把 Playwright 格式的 Cookie 原子写成 Netscape 文件（权限 0600）。"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        os.chmod(tmp_path, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+            handle.write('# Netscape HTTP Cookie File\n')
+            for cookie in cookies:
+                domain = str(cookie['domain']).replace('\t', '').replace('\n', '')
+                include_subdomains = 'TRUE' if domain.startswith('.') else 'FALSE'
+                cookie_path = str(cookie.get('path') or '/').replace('\t', '').replace('\n', '')
+                secure = 'TRUE' if cookie.get('secure') else 'FALSE'
+                raw_expires = int(cookie.get('expires', 0) or 0)
+                expires = raw_expires if raw_expires > 0 else 0
+                name = str(cookie['name']).replace('\t', '').replace('\n', '')
+                value = str(cookie.get('value', '')).replace('\t', '').replace('\n', '')
+                handle.write(
+                    f'{domain}\t{include_subdomains}\t{cookie_path}\t{secure}\t{expires}\t{name}\t{value}\n'
+                )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_cookies(platform):
+    """加载已保存的 cookie，返回 list 或 None"""
+    cookies = cookie_store.get(platform)
+    if cookies is None:
+        return None
+    # 检查关键 cookie 是否过期
+    if cookies_expired(platform, cookies):
+        print(f"  {platform} cookie 已过期")
+        return None
+    print(f"  已加载 {platform} 登录态 ({len(cookies)} cookies)")
+    return cookies
 
 def cookies_expired(platform, cookies):
     """检查平台关键 cookie 是否过期"""
@@ -82,14 +225,8 @@ def check_login_required(platform):
     B站必须登录才能获取高清，其他平台可选。"""
     # B站: 没有有效 cookie 时提示登录
     if platform == 'bilibili':
-        path = get_cookie_path(platform)
-        if not os.path.exists(path):
-            return True
-        cookies = None
-        try:
-            with open(path, 'r') as f:
-                cookies = json.load(f)
-        except Exception:
+        cookies = cookie_store.get(platform)
+        if cookies is None:
             return True
         if cookies_expired(platform, cookies):
             return True
@@ -101,6 +238,7 @@ def save_cookies(platform, cookies):
     path = get_cookie_path(platform)
     with open(path, 'w') as f:
         json.dump(cookies, f, indent=2, ensure_ascii=False)
+    cookie_store.invalidate(platform)
     print(f"  已保存 {len(cookies)} 个 cookie 到 {path}")
 
 def do_login(platform, signal_file=None):
@@ -187,65 +325,595 @@ def do_login(platform, signal_file=None):
 
 # ── 平台识别 ──────────────────────────────────────────────
 
-def detect_platform(text):
-    """返回 ('platform', url) 或 (None, None)"""
+# 平台识别规则，按优先级排列：(平台, 正则)。同一段文本命中多条时取优先级最高的一条。
+PLATFORM_PATTERNS = [
     # 微信视频号分享链接
-    m = re.search(r'https?://weixin\.qq\.com/sph/[A-Za-z0-9_-]+', text)
-    if m:
-        return 'wechat_channels', m.group(0)
+    ('wechat_channels', r'https?://weixin\.qq\.com/sph/[A-Za-z0-9_-]+'),
     # 微信视频号分享预览页
-    m = re.search(
-        r'https?://channels\.weixin\.qq\.com/finder-preview/pages/sph\?[^\s"\']*\bid=[A-Za-z0-9_-]+[^\s"\']*',
-        text,
-    )
-    if m:
-        return 'wechat_channels', m.group(0)
+    ('wechat_channels',
+     r'https?://channels\.weixin\.qq\.com/finder-preview/pages/sph\?[^\s"\']*\bid=[A-Za-z0-9_-]+[^\s"\']*'),
     # 抖音短链
-    m = re.search(r'https?://v\.douyin\.com/[A-Za-z0-9_\-/]+', text)
-    if m:
-        return 'douyin', m.group(0)
+    ('douyin', r'https?://v\.douyin\.com/[A-Za-z0-9_\-/]+'),
     # 抖音完整链接
-    m = re.search(r'https?://www\.douyin\.com/video/\d+', text)
-    if m:
-        return 'douyin', m.group(0)
-    # 抖音精选/推荐页 modal_id 格式
-    m = re.search(r'https?://www\.douyin\.com/[^\s]*[?&]modal_id=(\d+)', text)
-    if m:
-        return 'douyin', f'https://www.douyin.com/video/{m.group(1)}'
+    ('douyin', r'https?://www\.douyin\.com/video/\d+'),
+    # 抖音精选/推荐页 modal_id 格式（归一成 /video/<id>）
+    ('douyin', r'https?://www\.douyin\.com/[^\s]*[?&]modal_id=(?P<modal_id>\d+)'),
     # 小红书完整链接
-    m = re.search(r'https?://www\.xiaohongshu\.com/(?:discovery/item|explore)/[a-f0-9]+[^\s"\']*', text)
-    if m:
-        return 'xiaohongshu', m.group(0)
+    ('xiaohongshu', r'https?://www\.xiaohongshu\.com/(?:discovery/item|explore)/[a-f0-9]+[^\s"\']*'),
     # 小红书短链
-    m = re.search(r'https?://xhslink\.com/[A-Za-z0-9/]+', text)
-    if m:
-        return 'xiaohongshu', m.group(0)
+    ('xiaohongshu', r'https?://xhslink\.com/[A-Za-z0-9/]+'),
     # B站完整链接
-    m = re.search(r'https?://www\.bilibili\.com/video/[A-Za-z0-9]+[^\s"\']*', text)
-    if m:
-        return 'bilibili', m.group(0)
+    ('bilibili', r'https?://www\.bilibili\.com/video/[A-Za-z0-9]+[^\s"\']*'),
     # B站短链
-    m = re.search(r'https?://b23\.tv/[A-Za-z0-9]+', text)
-    if m:
-        return 'bilibili', m.group(0)
+    ('bilibili', r'https?://b23\.tv/[A-Za-z0-9]+'),
     # TikTok 完整链接
-    m = re.search(r'https?://(?:www\.)?tiktok\.com/@[^/\s]+/video/\d+[^\s"\']*', text)
-    if m:
-        return 'tiktok', m.group(0)
+    ('tiktok', r'https?://(?:www\.)?tiktok\.com/@[^/\s]+/video/\d+[^\s"\']*'),
     # TikTok 短链
-    m = re.search(r'https?://(?:vm|vt)\.tiktok\.com/[A-Za-z0-9/]+', text)
-    if m:
-        return 'tiktok', m.group(0)
-    return None, None
+    ('tiktok', r'https?://(?:vm|vt)\.tiktok\.com/[A-Za-z0-9/]+'),
+]
+
+# 所有规则合成一个正则，一次扫描即可；分组名 r<序号> 对应 PLATFORM_PATTERNS 的下标
+_PLATFORM_RE = re.compile('|'.join(
+    f'(?P<r{index}>{pattern})' for index, (_, pattern) in enumerate(PLATFORM_PATTERNS)
+))
+
+def detect_platform(text):
+    """返回 ('platform', url) 或 (None, None)"""
+    best = None
+    for m in _PLATFORM_RE.finditer(text):
+        index = next(i for i in range(len(PLATFORM_PATTERNS)) if m.group(f'r{i}') is not None)
+        if best is None or index < best[0]:
+            best = (index, m)
+        if index == 0:
+            break
+    if best is None:
+        return None, None
+    index, m = best
+    if m.group('modal_id'):
+        return 'douyin', f"https://www.douyin.com/video/{m.group('modal_id')}"
+    return PLATFORM_PATTERNS[index][0], m.group(f'r{index}')
 
 # ── 通用工具 ──────────────────────────────────────────────
 
+# ── HTTP 核心（asyncio，后台事件循环 + 同步包装） ─────────────
+
+# 同时在用的 socket 总数、单 host 上限；空闲 keep-alive 连接超过 HTTP_IDLE_TIMEOUT_S 就丢弃
+HTTP_MAX_CONNECTIONS = int(os.environ.get('VIDEO_DOWNLOAD_HTTP_MAX_CONNECTIONS', '64') or 64)
+HTTP_MAX_PER_HOST = int(os.environ.get('VIDEO_DOWNLOAD_HTTP_MAX_PER_HOST', '16') or 16)
+HTTP_CONNECT_TIMEOUT_S = 15
+HTTP_IDLE_TIMEOUT_S = 30
+HTTP_CHUNK_SIZE = 256 * 1024
+# 阻塞写（文件 pwrite、ffmpeg 管道）用的专用线程数：每个在用 socket 同时最多一个写，按 socket 上限配，
+# 卡住的管道不会占满 asyncio 默认线程池、拖住 getaddrinfo
+HTTP_IO_WORKERS = HTTP_MAX_CONNECTIONS
+REDIRECT_MAX_HOPS = 10
+# 重定向响应体不大时读完丢弃以便复用连接，否则直接关掉连接
+_REDIRECT_DRAIN_MAX = 64 * 1024
+
+@functools.lru_cache(maxsize=2)
+def http_ssl_context(verify=True):
+    """HTTPS 用的 SSL 上下文，只作用于本脚本自己的请求（不改全局默认）。
+
+    默认正常校验证书；verify=False 的上下文只给 tls_verify_for() 放行的 host 用。
+    """
+    ctx = ssl.create_default_context()
+    if not verify:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+def tls_verify_for(host):
+    """host 是否校验证书：只有 VIDEO_DOWNLOAD_INSECURE_TLS_HOSTS（逗号分隔的域名，含子域）里显式列出的才跳过。"""
+    host = (host or '').lower().rstrip('.')
+    for entry in os.environ.get('VIDEO_DOWNLOAD_INSECURE_TLS_HOSTS', '').split(','):
+        entry = entry.strip().lower().strip('.')
+        if entry and (host == entry or host.endswith('.' + entry)):
+            return False
+    return True
+
+@functools.lru_cache(maxsize=1)
+def http_io_executor():
+    """后台事件循环把阻塞写交给的专用线程池（见 HTTP_IO_WORKERS）。"""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max(1, HTTP_IO_WORKERS),
+                                                 thread_name_prefix='video-download-io')
+
+def http_proxy_for(key):
+    """按 urllib 的规则（HTTP_PROXY / HTTPS_PROXY / NO_PROXY，macOS 上读系统设置）返回该目标走的代理。
+
+    返回 (host, port, Proxy-Authorization 头或 None)，直连时返回 None。只支持 HTTP 代理。
+    """
+    scheme, host, port = key
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    parts = urllib.parse.urlsplit(proxy)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise RuntimeError(f'不支持的代理: {proxy}（只支持 http:// 代理）')
+    auth = None
+    if parts.username is not None:
+        creds = f'{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or "")}'
+        auth = 'Basic ' + base64.b64encode(creds.encode('utf-8')).decode('ascii')
+    return parts.hostname, parts.port or 80, auth
+
+def _open_tunnel(proxy, key, timeout):
+    """经 HTTP 代理 CONNECT 到目标，返回已打通隧道的阻塞 socket（TLS 由调用方在其上建立）。"""
+    proxy_host, proxy_port, auth = proxy
+    _, host, port = key
+    authority = f'[{host}]:{port}' if ':' in host else f'{host}:{port}'
+    lines = [f'CONNECT {authority} HTTP/1.1', f'Host: {authority}']
+    if auth:
+        lines.append(f'Proxy-Authorization: {auth}')
+    sock = socket.create_connection((proxy_host, proxy_port), timeout=timeout)
+    try:
+        sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        head = b''
+        while b'\r\n\r\n' not in head:
+            # 逐字节读，隧道建立后目标端的字节不能被这里吞掉
+            byte = sock.recv(1)
+            if not byte or len(head) > 64 * 1024:
+                raise ConnectionError('代理未完成 CONNECT 响应')
+            head += byte
+        status = head.split(b'\r\n', 1)[0].decode('latin-1')
+        code = status.split(' ', 2)[1] if status.count(' ') else ''
+        if code != '200':
+            raise ConnectionError(f'代理拒绝 CONNECT {authority}: {status}')
+        sock.settimeout(None)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+class HttpStatusError(RuntimeError):
+    """服务端返回了不接受的状态码（默认 >= 400）。"""
+
+    def __init__(self, status, url):
+        super().__init__(f'HTTP {status}: {url}')
+        self.status = status
+        self.url = url
+
+class HttpResponse:
+    """一次 HTTP 响应：status / reason / headers（键为小写）/ url（跟随重定向后的地址）/ body。"""
+
+    def __init__(self, status, reason, headers, url, body=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.url = url
+        self.body = body
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def json(self):
+        return json.loads((self.body or b'').decode('utf-8'))
+
+class _HttpConnection:
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = time.monotonic()
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+class HttpStream(HttpResponse):
+    """已读完响应头、响应体还在连接上的响应；用 iter_chunks() / read() 取响应体。"""
+
+    def __init__(self, status, reason, headers, url, conn, method, timeout, keep_alive):
+        super().__init__(status, reason, headers, url)
+        self._conn = conn
+        self._timeout = timeout
+        self._keep_alive = keep_alive
+        self.consumed = method == 'HEAD' or status in (204, 304) or 100 <= status < 200
+        self.bytes_read = 0
+
+    async def _read(self, coro):
+        return await asyncio.wait_for(coro, self._timeout)
+
+    async def iter_chunks(self):
+        if self.consumed:
+            return
+        reader = self._conn.reader
+        encoding = self.header('transfer-encoding', '').lower()
+        length = self.header('content-length')
+        if 'chunked' in encoding:
+            while True:
+                size_line = await self._read(reader.readline())
+                size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+                if size == 0:
+                    while (await self._read(reader.readline())) not in (b'\r\n', b'\n', b''):
+                        pass  # 跳过 trailer
+                    break
+                remaining = size
+                while remaining:
+                    chunk = await self._read(reader.read(min(remaining, HTTP_CHUNK_SIZE)))
+                    if not chunk:
+                        raise ConnectionError('chunked 响应体不完整')
+                    remaining -= len(chunk)
+                    self.bytes_read += len(chunk)
+                    yield chunk
+                await self._read(reader.readline())
+        elif length is not None:
+            remaining = int(length)
+            while remaining:
+                chunk = await self._read(reader.read(min(remaining, HTTP_CHUNK_SIZE)))
+                if not chunk:
+                    raise ConnectionError(f'响应体不完整（还差 {remaining} 字节）')
+                remaining -= len(chunk)
+                self.bytes_read += len(chunk)
+                yield chunk
+        else:
+            self._keep_alive = False  # 没有长度信息：读到连接关闭为止
+            while True:
+                chunk = await self._read(reader.read(HTTP_CHUNK_SIZE))
+                if not chunk:
+                    break
+                self.bytes_read += len(chunk)
+                yield chunk
+        self.consumed = True
+
+    async def read(self, limit=None):
+        parts = []
+        async for chunk in self.iter_chunks():
+            parts.append(chunk)
+            if limit is not None and self.bytes_read > limit:
+                raise RuntimeError(f'响应体超过 {limit} 字节上限')
+        self.body = b''.join(parts)
+        return self.body
+
+    async def write_to(self, sink):
+        """把响应体逐块交给阻塞的 sink(chunk)（写文件/管道），在专用线程池里执行，不阻塞事件循环。"""
+        loop = asyncio.get_running_loop()
+        async for chunk in self.iter_chunks():
+            await loop.run_in_executor(http_io_executor(), sink, chunk)
+        return self.bytes_read
+
+    @property
+    def reusable(self):
+        return self.consumed and self._keep_alive
+
+class HttpClient:
+    """跑在单个事件循环里的 HTTP/1.1 客户端。
+
+    按 (scheme, host, port) 保留 keep-alive 连接池；正在使用的 socket 总数和单 host 数都有上限，
+    超出时排队等待。连接超时 HTTP_CONNECT_TIMEOUT_S，之后每次读写等待不超过请求的 timeout。
+    配了 HTTP(S)_PROXY 时经代理连接（https 用 CONNECT 隧道），NO_PROXY 里的 host 直连。
+    必须在事件循环线程里创建和使用（见 get_http_client / run_http）。
+    """
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_per_host=HTTP_MAX_PER_HOST):
+        self.max_per_host = max(1, max_per_host)
+        self._sockets = asyncio.Semaphore(max(1, max_connections))
+        self._host_limits = {}
+        self._idle = collections.defaultdict(list)
+        self.connections_opened = 0
+
+    def _host_limit(self, key):
+        sem = self._host_limits.get(key)
+        if sem is None:
+            sem = self._host_limits[key] = asyncio.Semaphore(self.max_per_host)
+        return sem
+
+    async def _connect(self, key, proxy=None):
+        scheme, host, port = key
+        tls = scheme == 'https'
+        if proxy is None:
+            opening = asyncio.open_connection(
+                host, port,
+                ssl=http_ssl_context(tls_verify_for(host)) if tls else None,
+                server_hostname=host if tls else None,
+                limit=HTTP_CHUNK_SIZE,
+            )
+        elif tls:
+            async def through_tunnel():
+                sock = await asyncio.get_running_loop().run_in_executor(
+                    None, _open_tunnel, proxy, key, HTTP_CONNECT_TIMEOUT_S)
+                try:
+                    return await asyncio.open_connection(
+                        sock=sock, ssl=http_ssl_context(tls_verify_for(host)), server_hostname=host,
+                        limit=HTTP_CHUNK_SIZE)
+                except BaseException:
+                    sock.close()
+                    raise
+            opening = through_tunnel()
+        else:
+            opening = asyncio.open_connection(proxy[0], proxy[1], limit=HTTP_CHUNK_SIZE)
+        reader, writer = await asyncio.wait_for(opening, HTTP_CONNECT_TIMEOUT_S)
+        self.connections_opened += 1
+        return _HttpConnection(key, reader, writer)
+
+    def _take_idle(self, key):
+        idle = self._idle[key]
+        now = time.monotonic()
+        while idle:
+            conn = idle.pop()
+            if now - conn.idle_since < HTTP_IDLE_TIMEOUT_S and not conn.reader.at_eof():
+                return conn
+            conn.close()
+        return None
+
+    def _release(self, conn, reusable):
+        idle = self._idle[conn.key]
+        if reusable and len(idle) < self.max_per_host:
+            conn.idle_since = time.monotonic()
+            idle.append(conn)
+        else:
+            conn.close()
+
+    async def _send(self, key, method, target, headers, timeout, body=None):
+        """发请求并读响应头；复用的连接已被对端关闭时换新连接重发一次（仅 GET/HEAD）。"""
+        proxy = http_proxy_for(key)
+        if proxy is not None and key[0] == 'http':
+            # 明文 HTTP 走代理：请求行用绝对 URL，认证头发给代理
+            target = f'http://{_host_header(key)}{target}'
+            if proxy[2]:
+                headers = {**headers, 'Proxy-Authorization': proxy[2]}
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {_host_header(key)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+        retryable = method in ('GET', 'HEAD')
+        for attempt in range(2):
+            conn = self._take_idle(key) if attempt == 0 else None
+            reused = conn is not None
+            if conn is None:
+                conn = await self._connect(key, proxy)
+            try:
+                conn.writer.write(payload)
+                await asyncio.wait_for(conn.writer.drain(), timeout)
+                status_line = await asyncio.wait_for(conn.reader.readline(), timeout)
+                if not status_line:
+                    raise ConnectionError('连接被对端关闭')
+                raw_headers = []
+                while True:
+                    line = await asyncio.wait_for(conn.reader.readline(), timeout)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    raw_headers.append(line)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if reused and retryable:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            return conn, status_line, raw_headers
+        raise ConnectionError('无法建立连接')
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, headers=None, timeout=30, follow_redirects=True,
+                     expect=None, body=None):
+        """发起请求，产出读完响应头的 HttpStream；响应体读完且可复用时连接回到池里。
+
+        expect 为可接受的状态码集合（默认 < 400），不在其中时抛 HttpStatusError。
+        follow_redirects 时自动跟随 3xx（最多 REDIRECT_MAX_HOPS 跳），stream.url 是最终地址。
+        """
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', UA)
+        headers.setdefault('Accept', '*/*')
+        for _ in range(REDIRECT_MAX_HOPS + 1):
+            key, target = _split_url(url)
+            async with self._sockets, self._host_limit(key):
+                conn, status_line, raw_headers = await self._send(
+                    key, method, target, headers, timeout, body)
+                resp = None
+                try:
+                    # 响应头解析失败也要走 finally：连接直接关掉，不留在池外泄漏
+                    resp = _parse_head(status_line, raw_headers, url, conn, method, timeout)
+                    location = resp.header('location')
+                    redirect = follow_redirects and resp.status in (301, 302, 303, 307, 308) and location
+                    if redirect:
+                        length = resp.header('content-length')
+                        if length is not None and int(length) <= _REDIRECT_DRAIN_MAX:
+                            await resp.read()
+                    else:
+                        if (resp.status >= 400) if expect is None else (resp.status not in expect):
+                            raise HttpStatusError(resp.status, url)
+                        yield resp
+                finally:
+                    self._release(conn, resp is not None and resp.reusable)
+            if not redirect:
+                return
+            url = urllib.parse.urljoin(url, location)
+            if resp.status == 303:
+                method, body = 'GET', None
+        raise RuntimeError(f'重定向次数过多: {url}')
+
+    async def request(self, method, url, headers=None, timeout=30, follow_redirects=True,
+                      expect=None, read_body=True, limit=None, body=None):
+        """发请求并（默认）读完整个响应体，返回 HttpResponse；大文件请用 stream()。"""
+        async with self.stream(method, url, headers, timeout, follow_redirects, expect, body) as resp:
+            if read_body:
+                await resp.read(limit)
+            return HttpResponse(resp.status, resp.reason, resp.headers, resp.url, resp.body)
+
+    def close(self):
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+def _split_url(url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise RuntimeError(f'不支持的 URL: {url}')
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+    return (parts.scheme, parts.hostname, port), target
+
+def _host_header(key):
+    scheme, host, port = key
+    if ':' in host:
+        host = f'[{host}]'
+    return host if port == (443 if scheme == 'https' else 80) else f'{host}:{port}'
+
+def _parse_head(status_line, raw_headers, url, conn, method, timeout):
+    version, _, rest = status_line.decode('latin-1').strip().partition(' ')
+    code, _, reason = rest.partition(' ')
+    if not version.startswith('HTTP/') or not (len(code) == 3 and code.isdigit()):
+        raise ConnectionError(f'无效的响应状态行: {status_line[:80]!r}')
+    headers = {}
+    for line in raw_headers:
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f'{headers[name]}, {value}' if name in headers else value
+    connection = headers.get('connection', '').lower()
+    keep_alive = ('keep-alive' in connection) if version == 'HTTP/1.0' else ('close' not in connection)
+    return HttpStream(int(code), reason, headers, url, conn, method, timeout, keep_alive)
+
+_http_loop = None
+_http_client = None
+_http_loop_lock = threading.Lock()
+
+def _http_loop_thread():
+    """返回后台事件循环（首次调用时起一个 daemon 线程运行它，并在其中创建 HttpClient）。"""
+    global _http_loop, _http_client
+    with _http_loop_lock:
+        if _http_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='video-download-http', daemon=True).start()
+
+            async def make_client():
+                return HttpClient()
+
+            _http_client = asyncio.run_coroutine_threadsafe(make_client(), loop).result()
+            _http_loop = loop
+    return _http_loop
+
+def get_http_client():
+    """后台事件循环里的共享 HttpClient；只能在该循环里的协程中使用。"""
+    _http_loop_thread()
+    return _http_client
+
+def run_http(coro):
+    """在后台事件循环里执行协程并阻塞等待结果（同步入口用）；调用线程被中断时取消该协程。"""
+    future = asyncio.run_coroutine_threadsafe(coro, _http_loop_thread())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+def http_request(method, url, **kwargs):
+    """同步发请求并读完响应体，参数同 HttpClient.request。"""
+    async def go():
+        return await get_http_client().request(method, url, **kwargs)
+    return run_http(go())
+
+def close_http_client():
+    global _http_loop, _http_client
+    with _http_loop_lock:
+        loop, client = _http_loop, _http_client
+        _http_loop = _http_client = None
+    if loop is None:
+        return
+    try:
+        loop.call_soon_threadsafe(client.close)
+        loop.call_soon_threadsafe(loop.stop)
+    except RuntimeError:
+        pass
+
+atexit.register(close_http_client)
+
+# 短链解析结果的缓存有效期（秒），默认 7 天
+SHORT_LINK_TTL_S = int(os.environ.get('VIDEO_DOWNLOAD_SHORT_LINK_TTL', str(7 * 86400)) or 0)
+HTTP_ANY_STATUS = range(100, 600)
+# 进程内短链缓存按 LRU 只保留最近的这么多条；serve 常驻时不随解析过的短链无限增长
+SHORT_LINK_MEMO_MAX = 4096
+_short_link_memo = collections.OrderedDict()
+_short_link_memo_lock = threading.Lock()
+
+def _short_link_memo_get(url):
+    with _short_link_memo_lock:
+        final_url = _short_link_memo.get(url)
+        if final_url is not None:
+            _short_link_memo.move_to_end(url)
+        return final_url
+
+def _short_link_memo_put(url, final_url):
+    with _short_link_memo_lock:
+        _short_link_memo[url] = final_url
+        _short_link_memo.move_to_end(url)
+        while len(_short_link_memo) > SHORT_LINK_MEMO_MAX:
+            _short_link_memo.popitem(last=False)
+
+def _request_head(url, method):
+    """对 url 发一次 HEAD/GET，只读状态和响应头；GET 不读 body，连接随即作废。"""
+    resp = http_request(method, url, timeout=30, follow_redirects=False,
+                        expect=HTTP_ANY_STATUS, read_body=False)
+    return resp.status, resp.header('location')
+
+def _follow_redirects(url):
+    """逐跳跟随重定向，不下载任何响应体；服务端不接受 HEAD 时改发 GET 但只读响应头。"""
+    method = 'HEAD'
+    for _ in range(REDIRECT_MAX_HOPS):
+        status, location = _request_head(url, method)
+        if status in (301, 302, 303, 307, 308) and location:
+            url = urllib.parse.urljoin(url, location)
+            continue
+        if method == 'HEAD' and status in (400, 403, 405, 501):
+            method = 'GET'
+            continue
+        return url
+    raise RuntimeError(f'重定向次数过多: {url}')
+
+def _short_link_cache_get(url):
+    if not download_cache_enabled():
+        return None
+    try:
+        with _download_cache_lock:
+            conn = _download_cache_db()
+            if conn is None:
+                return None
+            with contextlib.closing(conn):
+                row = conn.execute(
+                    'SELECT final_url, resolved_at FROM short_links WHERE url = ?', (url,)
+                ).fetchone()
+    except sqlite3.Error:
+        return None
+    if row and time.time() - row[1] < SHORT_LINK_TTL_S:
+        return row[0]
+    return None
+
+def _short_link_cache_put(url, final_url):
+    if not download_cache_enabled():
+        return
+    try:
+        with _download_cache_lock:
+            conn = _download_cache_db(create=True)
+            with contextlib.closing(conn), conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO short_links VALUES (?, ?, ?)',
+                    (url, final_url, time.time()),
+                )
+    except (OSError, sqlite3.Error) as exc:
+        print(f"  警告: 写入短链缓存失败: {exc}")
+
 def resolve_redirect(url):
-    """跟踪重定向获取最终 URL"""
-    req = urllib.request.Request(url)
-    req.add_header('User-Agent', UA)
-    resp = urllib.request.urlopen(req)
-    return resp.url
+    """跟踪重定向获取最终 URL。
+
+    只发 HEAD（或不读 body 的 GET），按 host 复用连接；结果先查进程内 LRU（SHORT_LINK_MEMO_MAX 条），
+    再查下载缓存索引里的 short_links 表（有效期 SHORT_LINK_TTL_S），批处理里重复短链不再联网。
+    """
+    with span('resolve', url=url) as sp:
+        cached = _short_link_memo_get(url) or _short_link_cache_get(url)
+        sp['cached'] = bool(cached)
+        if cached:
+            _short_link_memo_put(url, cached)
+            return cached
+        final_url = _follow_redirects(url)
+        _short_link_memo_put(url, final_url)
+        _short_link_cache_put(url, final_url)
+        return final_url
 
 def clean_filename(title, fallback='video'):
     """清理字符串为安全文件名"""
@@ -257,21 +925,86 @@ def clean_filename(title, fallback='video'):
         title = title[:60]
     return title or fallback
 
-def get_media_duration_seconds(file_path):
-    """返回媒体总时长（秒，float）或 None。"""
-    result = subprocess.run(
-        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-         '-of', 'default=nw=1:nk=1', file_path],
-        text=True, capture_output=True
-    )
+PROBE_CACHE_MAX = 1024
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+
+def _to_float(value):
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return None
+    return v if v > 0 else None
+
+def probe_media(file_path):
+    """ffprobe 一次读出全部流和容器信息，按 (路径, 大小, mtime) 缓存，同一文件后续校验不再起子进程。
+
+    返回 dict：has_video / has_audio / video_codec / audio_codec / duration（秒）/
+    bit_rate（bps）/ width / height / streams（各流 codec_type 列表）。
+    ffprobe 读不了该文件时返回 None；未安装 ffprobe 抛 RuntimeError。
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    key = (os.path.realpath(file_path), st.st_size, st.st_mtime_ns)
+    with _probe_cache_lock:
+        if key in _probe_cache:
+            return _probe_cache[key]
+
+    try:
+        with span('probe', bytes=st.st_size):
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', file_path],
+                text=True, capture_output=True
+            )
+    except FileNotFoundError as exc:
+        raise RuntimeError('未安装 ffprobe，无法校验下载结果') from exc
     if result.returncode != 0:
         return None
     try:
-        v = float((result.stdout or '').strip())
-        return v if v > 0 else None
+        data = json.loads(result.stdout or '{}')
     except ValueError:
         return None
 
+    streams = data.get('streams') or []
+    fmt = data.get('format') or {}
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    duration = _to_float(fmt.get('duration'))
+    if duration is None:
+        durations = [d for d in (_to_float(st.get('duration')) for st in streams) if d]
+        duration = max(durations) if durations else None
+    bit_rate = _to_float(fmt.get('bit_rate'))
+    info = {
+        'has_video': video is not None,
+        'has_audio': audio is not None,
+        'video_codec': (video or {}).get('codec_name'),
+        'audio_codec': (audio or {}).get('codec_name'),
+        'duration': duration,
+        'bit_rate': int(bit_rate) if bit_rate else None,
+        'width': (video or {}).get('width'),
+        'height': (video or {}).get('height'),
+        'streams': [st.get('codec_type') for st in streams],
+    }
+    with _probe_cache_lock:
+        if len(_probe_cache) >= PROBE_CACHE_MAX:
+            _probe_cache.clear()
+        _probe_cache[key] = info
+    return info
+
+def get_media_duration_seconds(file_path):
+    """返回媒体总时长（秒，float）或 None。"""
+    info = probe_media(file_path)
+    return info['duration'] if info else None
+
+def media_summary(info):
+    """probe_media 结果里适合写进 .meta.json 的字段。"""
+    if not info:
+        return None
+    return {key: info[key] for key in
+            ('video_codec', 'audio_codec', 'width', 'height', 'bit_rate', 'duration')}
+
 def write_tiktok_meta(output_path, source, target_video_id=None, resolved_video_id=None,
                       expected_duration=None, actual_duration=None,
                       validation=None, note=None):
@@ -286,6 +1019,7 @@ def write_tiktok_meta(output_path, source, target_video_id=None, resolved_video_
         'actual_duration': actual_duration,
         'validation': validation or {},
         'note': note,
+        'media': media_summary(probe_media(output_path)),
         'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'output_path': output_path,
     }
@@ -299,44 +1033,661 @@ def write_tiktok_meta(output_path, source, target_video_id=None, resolved_video_
     print(f"[TikTok/META] {meta_path}")
     return meta_path
 
+# ── 结构化事件（--events JSONL） ─────────────────────────────
+
+_event_sink = None
+_event_lock = threading.Lock()
+_event_local = threading.local()
+
+def open_event_sink(path):
+    """把之后的事件追加写到 path（JSONL）；没打开时 emit_event 直接返回。"""
+    global _event_sink
+    close_event_sink()
+    _event_sink = open(path, 'a', encoding='utf-8', buffering=1)
+
+def close_event_sink():
+    global _event_sink
+    with _event_lock:
+        sink, _event_sink = _event_sink, None
+    if sink is not None:
+        sink.close()
+
+atexit.register(close_event_sink)
+
+def current_event_context():
+    """当前线程的事件上下文字段（platform / engine / seq 等）的副本。"""
+    return dict(getattr(_event_local, 'fields', None) or {})
+
+@contextlib.contextmanager
+def event_context(**fields):
+    """给当前线程之后写出的事件附加字段，可嵌套；值为 None 的字段忽略。"""
+    saved = getattr(_event_local, 'fields', None)
+    merged = dict(saved or {})
+    merged.update({k: v for k, v in fields.items() if v is not None})
+    _event_local.fields = merged
+    try:
+        yield
+    finally:
+        _event_local.fields = saved
+
+def call_with_event_context(fields, fn, *args, **kwargs):
+    """在另一个线程里带着调用方的事件上下文执行 fn（线程池/辅助线程用）。"""
+    with event_context(**fields):
+        return fn(*args, **kwargs)
+
+def emit_event(event, **fields):
+    """写一条事件。ts 是 time.monotonic()，同一进程内的事件可直接相减。"""
+    if _event_sink is None:
+        return
+    record = {'ts': round(time.monotonic(), 6), 'event': event, 'pid': os.getpid()}
+    record.update(current_event_context())
+    record.update(fields)
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    with _event_lock:
+        if _event_sink is not None:
+            _event_sink.write(line)
+
+@contextlib.contextmanager
+def span(phase, **fields):
+    """给一个阶段计时，结束时写一条 span 事件（start / end / duration_s / ok / error）。
+
+    产出一个 dict，阶段内可往里补字段；补了 bytes 时顺带算出 bytes_per_s。
+    """
+    extra = dict(fields)
+    start = time.monotonic()
+    error = None
+    try:
+        yield extra
+    except BaseException as exc:
+        error = exc
+        raise
+    finally:
+        if _event_sink is not None:
+            end = time.monotonic()
+            record = {'phase': phase, 'start': round(start, 6), 'end': round(end, 6),
+                      'duration_s': round(end - start, 6), 'ok': error is None}
+            record.update(extra)
+            if isinstance(error, SystemExit):
+                record['error'] = f'exit {error.code}'
+            elif error is not None:
+                record['error'] = f'{type(error).__name__}: {error}'
+            if record.get('bytes') and end > start:
+                record['bytes_per_s'] = int(record['bytes'] / (end - start))
+            emit_event('span', **record)
+
+def traced_engine(name):
+    """下载引擎的装饰器：引擎内的事件带上 engine=name，并整体记一条 phase=engine 的 span。"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with event_context(engine=name), span('engine'):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+_state_file_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _state_file_flock(path):
+    """对 path 旁的 .lock 文件加排他 flock，让多个进程（serve、并行批处理）的读-改-写互不覆盖。"""
+    if fcntl is None:
+        yield
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(f'{path}.lock', 'a')
+    except OSError:
+        yield
+        return
+    with handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+def _read_state(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+def read_state_file(name):
+    """只读地取 COOKIE_DIR 下的状态文件（不存在或损坏时为空 dict）。"""
+    with _state_file_lock:
+        return _read_state(os.path.join(COOKIE_DIR, name))
+
+def update_state_file(name, update_fn):
+    """读-改-写 COOKIE_DIR 下的小型 JSON 状态文件（原子替换）。
+
+    update_fn 接收当前 dict（文件不存在或损坏时为空 dict）并原地修改。
+    进程内用 _state_file_lock、跨进程用 <name>.lock 上的 flock 串行化，并发更新不会丢计数。
+    这类文件只用于统计/调优，写失败只告警，不影响下载本身。
+    """
+    path = os.path.join(COOKIE_DIR, name)
+    with _state_file_lock, _state_file_flock(path):
+        state = _read_state(path)
+        update_fn(state)
+        try:
+            os.makedirs(COOKIE_DIR, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(state, handle, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            print(f"  警告: 无法写入 {path}: {exc}")
+    return state
+
+CAPTURE_STATS_FILE = 'capture_stats.json'
+CAPTURE_STATS_SAMPLES = 200
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def record_capture_timing(platform, seconds):
+    """记录一次抓流的「首个命中耗时」（秒）；seconds=None 表示等到上限也没命中。
+
+    按平台保留最近 CAPTURE_STATS_SAMPLES 个样本及 p50/p95/max，用来调整等待上限。
+    """
+    def update(state):
+        entry = state.setdefault(platform or 'generic', {})
+        entry['captures'] = entry.get('captures', 0) + 1
+        if seconds is None:
+            entry['misses'] = entry.get('misses', 0) + 1
+        else:
+            samples = (entry.get('samples') or []) + [round(seconds, 3)]
+            entry['samples'] = samples[-CAPTURE_STATS_SAMPLES:]
+        samples = entry.get('samples') or []
+        entry['p50'] = _percentile(samples, 50)
+        entry['p95'] = _percentile(samples, 95)
+        entry['max'] = max(samples) if samples else None
+
+    update_state_file(CAPTURE_STATS_FILE, update)
+
+# ── 引擎记分板（回退顺序自适应） ──────────────────────────
+
+ENGINE_SCORES_FILE = 'engine_scores.json'
+# 指数滑动平均里新样本的权重；没有样本时的先验成功率和耗时
+ENGINE_SCORE_DECAY = 0.3
+ENGINE_PRIOR_SUCCESS = 0.8
+ENGINE_PRIOR_LATENCY_S = 30.0
+# 窗口内连续失败这么多次就冷却一段时间，期间不再尝试
+ENGINE_FAILURE_STREAK = int(os.environ.get('VIDEO_DOWNLOAD_ENGINE_FAILURE_STREAK', '3') or 3)
+ENGINE_FAILURE_WINDOW_S = 15 * 60
+ENGINE_COOLDOWN_S = int(os.environ.get('VIDEO_DOWNLOAD_ENGINE_COOLDOWN', '600') or 0)
+
+def adaptive_engines_enabled():
+    """VIDEO_DOWNLOAD_ADAPTIVE_ENGINES=0 时按固定顺序尝试，也不记分。"""
+    return os.environ.get('VIDEO_DOWNLOAD_ADAPTIVE_ENGINES', '1').strip() != '0'
+
+def record_engine_result(platform, engine, ok, seconds):
+    """记录一次引擎尝试：成功率、成功/失败耗时做滑动平均，维护连续失败次数和冷却截止时间。"""
+    if not adaptive_engines_enabled():
+        return
+    now = time.time()
+    alpha = ENGINE_SCORE_DECAY
+
+    def update(state):
+        entry = state.setdefault(platform, {}).setdefault(engine, {})
+        entry['attempts'] = entry.get('attempts', 0) + 1
+        prev_rate = entry.get('success_rate', ENGINE_PRIOR_SUCCESS)
+        entry['success_rate'] = round(alpha * (1.0 if ok else 0.0) + (1 - alpha) * prev_rate, 4)
+        key = 'latency_ok_s' if ok else 'latency_fail_s'
+        prev = entry.get(key)
+        entry[key] = round(seconds if prev is None else alpha * seconds + (1 - alpha) * prev, 3)
+        if ok:
+            entry['consecutive_failures'] = 0
+            entry.pop('cooldown_until', None)
+            return
+        streak = entry.get('consecutive_failures', 0)
+        if now - (entry.get('last_failure_at') or 0) > ENGINE_FAILURE_WINDOW_S:
+            streak = 0
+        entry['consecutive_failures'] = streak + 1
+        entry['last_failure_at'] = round(now, 3)
+        if entry['consecutive_failures'] >= ENGINE_FAILURE_STREAK and ENGINE_COOLDOWN_S > 0:
+            entry['cooldown_until'] = round(now + ENGINE_COOLDOWN_S, 3)
+
+    update_state_file(ENGINE_SCORES_FILE, update)
+
+def expected_time_to_success(entry):
+    """一个引擎「尝试到成功」的预期耗时：单次尝试的期望耗时 / 成功率。
+
+    按这个值从小到大依次尝试，能让整条回退链的期望总耗时最小。
+    """
+    p = max(entry.get('success_rate', ENGINE_PRIOR_SUCCESS), 0.05)
+    ok_s = entry.get('latency_ok_s', ENGINE_PRIOR_LATENCY_S)
+    fail_s = entry.get('latency_fail_s', ok_s)
+    return (p * ok_s + (1 - p) * fail_s) / p
+
+def order_engines(platform, engines):
+    """按记分板给 engines 排序，返回 (依次尝试的引擎, 冷却中跳过的引擎)。
+
+    分数相同（如都没有样本）时保持传入的默认顺序；全部在冷却时不跳过，按默认顺序全试。
+    """
+    if not adaptive_engines_enabled():
+        return list(engines), []
+    scores = read_state_file(ENGINE_SCORES_FILE).get(platform) or {}
+    now = time.time()
+    skipped = [e for e in engines if (scores.get(e) or {}).get('cooldown_until', 0) > now]
+    ready = [e for e in engines if e not in skipped]
+    if not ready:
+        return list(engines), []
+    ready.sort(key=lambda e: expected_time_to_success(scores.get(e) or {}))
+    return ready, skipped
+
+def run_engine_attempts(platform, attempts, label):
+    """依次执行 attempts（[(尝试名, 引擎, 无参函数)]），返回第一个成功的结果，并把每次结果计入记分板。
+
+    引擎里的 sys.exit 也按失败处理，好让后面的引擎接着试；全部失败抛 RuntimeError（各次错误拼在一起）。
+    """
+    errors = []
+    for name, engine, fn in attempts:
+        print(f"[{label}] 尝试 {name} ...")
+        started = time.monotonic()
+        try:
+            result = fn()
+        except (Exception, SystemExit) as exc:
+            record_engine_result(platform, engine, False, time.monotonic() - started)
+            reason = f'exit {exc.code}' if isinstance(exc, SystemExit) else str(exc)
+            errors.append(f'{name}={reason}')
+            print(f"[{label}] {name} 失败: {reason}")
+            continue
+        record_engine_result(platform, engine, True, time.monotonic() - started)
+        return result
+    raise RuntimeError('; '.join(errors) or '没有可用的下载引擎')
+
+def engine_attempts(platform, engines, label):
+    """把 {引擎: 无参函数}（按默认顺序）排成 run_engine_attempts 的尝试列表，并打印被跳过的引擎。"""
+    order, skipped = order_engines(platform, list(engines))
+    if skipped:
+        print(f"[{label}] 跳过冷却中的引擎: {', '.join(skipped)}")
+    return [(name, name, engines[name]) for name in order]
+
+def wait_until(page, is_done, timeout_s, poll_ms=100):
+    """最多等待 timeout_s 秒，is_done() 一为真就返回 True；超时返回 False。
+
+    用 page.wait_for_timeout 小步轮询，保证等待期间 Playwright 照常派发 response 事件。
+    """
+    deadline = time.monotonic() + timeout_s
+    while not is_done():
+        remaining_ms = (deadline - time.monotonic()) * 1000
+        if remaining_ms <= 0:
+            return False
+        page.wait_for_timeout(min(poll_ms, remaining_ms))
+    return True
+
+_output_dir_local = threading.local()
+
 def output_dir():
-    """下载目录：默认 ~/Downloads，可用 VIDEO_DOWNLOAD_OUTPUT_DIR 覆盖（批处理场景常用）。"""
-    d = os.path.expanduser(os.environ.get('VIDEO_DOWNLOAD_OUTPUT_DIR', '~/Downloads'))
+    """下载目录：默认 ~/Downloads，可用 VIDEO_DOWNLOAD_OUTPUT_DIR 覆盖（批处理场景常用）。
+
+    当前线程处在 output_dir_override 里时优先用它（常驻服务按任务指定目录）。
+    """
+    d = getattr(_output_dir_local, 'path', None) or os.path.expanduser(
+        os.environ.get('VIDEO_DOWNLOAD_OUTPUT_DIR', '~/Downloads'))
     os.makedirs(d, exist_ok=True)
     return d
 
-def download_file(cdn_url, output_path, referer, extra_headers=None):
-    """下载文件到本地，支持大文件流式写入"""
-    req = urllib.request.Request(cdn_url)
-    req.add_header('Referer', referer)
-    req.add_header('User-Agent', UA)
-    if extra_headers:
-        for k, v in extra_headers.items():
-            req.add_header(k, v)
-    with urllib.request.urlopen(req) as resp:
-        with open(output_path, 'wb') as f:
-            while True:
-                chunk = resp.read(1024 * 1024)
-                if not chunk:
+@contextlib.contextmanager
+def output_dir_override(path):
+    """在当前线程内临时改变 output_dir()；path 为空时不改变。"""
+    saved = getattr(_output_dir_local, 'path', None)
+    if path:
+        _output_dir_local.path = os.path.expanduser(path)
+    try:
+        yield
+    finally:
+        _output_dir_local.path = saved
+
+# 分段下载：每个 Range 段的大小、默认并发连接数、单段重试次数
+DOWNLOAD_SEGMENT_SIZE = 4 * 1024 * 1024
+DOWNLOAD_CONNECTIONS = int(os.environ.get('VIDEO_DOWNLOAD_CONNECTIONS', '4') or 4)
+DOWNLOAD_SEGMENT_RETRIES = 3
+DOWNLOAD_TIMEOUT_S = 60
+
+def _content_range_total(resp):
+    """从 206 响应的 Content-Range（bytes 0-0/12345）取文件总长度，取不到返回 None。"""
+    m = re.match(r'bytes\s+\d+-\d+/(\d+)', resp.header('content-range') or '')
+    return int(m.group(1)) if m else None
+
+def _load_part_state(state_path, total, validator):
+    """读取断点续传的分段记录；文件大小或 ETag/Last-Modified 对不上时作废。"""
+    try:
+        with open(state_path, encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if state.get('size') != total or state.get('segment_size') != DOWNLOAD_SEGMENT_SIZE:
+        return None
+    if validator and state.get('validator') and state['validator'] != validator:
+        return None
+    return state
+
+async def _download_ranges(url, headers, part_path, state_path, total, validator, connections):
+    """最多 connections 个连接并发下载各 Range 段，写入预分配的 .part 文件，每完成一段就更新分段记录。"""
+    segments = [
+        (index, start, min(start + DOWNLOAD_SEGMENT_SIZE, total) - 1)
+        for index, start in enumerate(range(0, total, DOWNLOAD_SEGMENT_SIZE))
+    ]
+    state = _load_part_state(state_path, total, validator) if os.path.exists(part_path) else None
+    if state is None:
+        state = {'size': total, 'segment_size': DOWNLOAD_SEGMENT_SIZE,
+                 'validator': validator, 'done': []}
+        with open(part_path, 'wb') as handle:
+            handle.truncate(total)
+    done = set(state['done'])
+    todo = [seg for seg in segments if seg[0] not in done]
+    if done:
+        print(f"  断点续传: 已完成 {len(done)}/{len(segments)} 段")
+    client = get_http_client()
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max(1, min(connections, len(todo))))
+    fd = os.open(part_path, os.O_RDWR)
+
+    async def fetch(segment):
+        index, start, end = segment
+        last_err = None
+        async with slots:
+            for _ in range(DOWNLOAD_SEGMENT_RETRIES):
+                offset = start
+                try:
+                    async with client.stream('GET', url, {**headers, 'Range': f'bytes={start}-{end}'},
+                                             timeout=DOWNLOAD_TIMEOUT_S, expect=(206,)) as resp:
+                        async for chunk in resp.iter_chunks():
+                            if offset + len(chunk) > end + 1:
+                                raise RuntimeError(f'分段 {index} 超出请求范围')
+                            await loop.run_in_executor(http_io_executor(), os.pwrite, fd, chunk, offset)
+                            offset += len(chunk)
+                    if offset != end + 1:
+                        raise RuntimeError(f'分段 {index} 长度不完整')
                     break
-                f.write(chunk)
-    return os.path.getsize(output_path)
+                except HttpStatusError as exc:
+                    last_err = RuntimeError(f'分段请求未返回 206 (status={exc.status})')
+                except (OSError, RuntimeError, ValueError, asyncio.TimeoutError) as exc:
+                    last_err = exc
+            else:
+                raise RuntimeError(f'分段 {index} 下载失败: {last_err}')
+        state['done'].append(index)
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(state, handle)
+        os.replace(tmp_path, state_path)
 
-def validate_video_file(file_path):
-    """用 ffprobe 确认文件至少包含一条视频轨。"""
     try:
-        result = subprocess.run(
-            ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type',
-             '-of', 'default=nw=1:nk=1', file_path],
-            text=True, capture_output=True
+        # 某段失败时其余段照常下完并记入分段记录，重跑只补失败的段
+        results = await asyncio.gather(*(fetch(seg) for seg in todo), return_exceptions=True)
+    finally:
+        os.close(fd)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+async def download_file_async(cdn_url, output_path, referer, extra_headers=None, connections=None):
+    """download_file 的协程版本，在后台事件循环里执行；返回 (字节数, 是否分段下载)。"""
+    headers = {'Referer': referer, 'User-Agent': UA}
+    headers.update(extra_headers or {})
+    part_path = output_path + '.part'
+    state_path = output_path + '.part.json'
+    connections = connections or DOWNLOAD_CONNECTIONS
+    client = get_http_client()
+
+    async with client.stream('GET', cdn_url, {**headers, 'Range': 'bytes=0-0'},
+                             timeout=DOWNLOAD_TIMEOUT_S) as resp:
+        status = resp.status
+        total = _content_range_total(resp) if status == 206 else None
+        final_url = resp.url
+        validator = resp.header('etag') or resp.header('last-modified')
+        if status != 206:
+            with open(part_path, 'wb') as handle:
+                await resp.write_to(handle.write)
+        else:
+            await resp.read()  # 只有 1 字节，读完好让连接复用
+
+    if status == 206 and total is None:
+        # 支持 Range 但不给总长度：退回普通单连接 GET
+        async with client.stream('GET', final_url, headers, timeout=DOWNLOAD_TIMEOUT_S) as resp:
+            with open(part_path, 'wb') as handle:
+                await resp.write_to(handle.write)
+    elif total is not None:
+        await _download_ranges(final_url, headers, part_path, state_path, total, validator, connections)
+
+    os.replace(part_path, output_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return os.path.getsize(output_path), total is not None
+
+def download_file(cdn_url, output_path, referer, extra_headers=None, connections=None):
+    """下载文件到本地。
+
+    先发一个 Range: bytes=0-0 的 GET 探测（签名 CDN 常拒绝 HEAD）：返回 206 时按固定大小分段、
+    多连接并发写入预分配的 <输出>.part，分段进度记在 <输出>.part.json，中断后重跑会续传；
+    服务端不支持 Range（返回 200）时直接把这次响应单连接流式写完。完成后改名为输出文件。
+    实际传输跑在共享的后台事件循环里（见 HttpClient），连接按 host 复用。
+    """
+    connections = connections or DOWNLOAD_CONNECTIONS
+    with span('transfer', ranged=False) as sp:
+        size, ranged = run_http(
+            download_file_async(cdn_url, output_path, referer, extra_headers, connections)
         )
-    except FileNotFoundError as exc:
-        raise RuntimeError('未安装 ffprobe，无法校验视频号下载结果') from exc
-    streams = [line.strip() for line in (result.stdout or '').splitlines()]
-    if result.returncode != 0 or 'video' not in streams:
+        if ranged:
+            sp.update(ranged=True, connections=connections)
+        sp['bytes'] = size
+    return size
+
+async def stream_url_to(url, headers, sink):
+    """把 url 的响应体逐块交给阻塞的 sink(chunk)，返回字节数（边下边合并时写命名管道用）。"""
+    async with get_http_client().stream('GET', url, headers, timeout=DOWNLOAD_TIMEOUT_S) as resp:
+        return await resp.write_to(sink)
+
+def validate_video_file(file_path):
+    """用 ffprobe 确认文件至少包含一条视频轨（结果走 probe_media 缓存）。"""
+    info = probe_media(file_path)
+    if not info or not info['has_video']:
         raise RuntimeError('ffprobe 校验失败：下载结果不包含有效视频轨')
     return True
 
+# ── 下载缓存（按平台视频 ID 去重） ─────────────────────────
+
+# 缓存目录与容量：对象按 sha256 存放，索引用 SQLite；超出容量按最近使用时间淘汰
+DOWNLOAD_CACHE_DIR = os.path.expanduser(
+    os.environ.get('VIDEO_DOWNLOAD_CACHE_DIR', '~/.cache/video-download')
+)
+DOWNLOAD_CACHE_MAX_BYTES = int(
+    os.environ.get('VIDEO_DOWNLOAD_CACHE_MAX_BYTES', str(20 * 1024 ** 3)) or 0
+)
+_download_cache_lock = threading.Lock()
+
+def download_cache_enabled():
+    return os.environ.get('VIDEO_DOWNLOAD_CACHE', '1').strip() != '0'
+
+def _download_cache_db(create=False):
+    """打开缓存索引；create=False 且索引不存在时返回 None（查缓存不应凭空建库）。"""
+    path = os.path.join(DOWNLOAD_CACHE_DIR, 'index.sqlite3')
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(DOWNLOAD_CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS entries ('
+        ' platform TEXT NOT NULL, video_id TEXT NOT NULL, sha256 TEXT NOT NULL,'
+        ' size INTEGER NOT NULL, ext TEXT NOT NULL, filename TEXT NOT NULL,'
+        ' probe TEXT, meta TEXT, created_at REAL NOT NULL, last_used REAL NOT NULL,'
+        ' PRIMARY KEY (platform, video_id))'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS short_links ('
+        ' url TEXT PRIMARY KEY, final_url TEXT NOT NULL, resolved_at REAL NOT NULL)'
+    )
+    return conn
+
+def _download_cache_object(sha256, ext):
+    return os.path.join(DOWNLOAD_CACHE_DIR, 'objects', sha256[:2], sha256 + ext)
+
+def download_cache_link_enabled():
+    return os.environ.get('VIDEO_DOWNLOAD_CACHE_LINK', '1').strip() != '0'
+
+def _link_or_copy(src, dst):
+    """优先硬链接（同盘零拷贝），跨盘、不支持或 VIDEO_DOWNLOAD_CACHE_LINK=0 时复制。
+
+    先写到同目录的临时名再改名，dst 上不会出现写了一半的文件。
+    """
+    tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        try:
+            if not download_cache_link_enabled():
+                raise OSError('link disabled')
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download_cache_lookup(platform, video_id, output_name=None):
+    """命中缓存时把文件放到输出目录并返回路径，未命中返回 None。
+
+    输出文件名优先用 output_name，否则沿用首次下载时的文件名；首次下载生成的
+    .meta.json 也一并恢复（output_path 改成新路径）。
+    """
+    if not video_id or not download_cache_enabled():
+        return None
+    try:
+        with _download_cache_lock:
+            conn = _download_cache_db()
+            if conn is None:
+                return None
+            with contextlib.closing(conn), conn:
+                row = conn.execute(
+                    'SELECT sha256, size, ext, filename, meta FROM entries'
+                    ' WHERE platform = ? AND video_id = ?', (platform, video_id)
+                ).fetchone()
+                if row is None:
+                    return None
+                sha256, size, ext, filename, meta = row
+                obj = _download_cache_object(sha256, ext)
+                if not os.path.isfile(obj) or os.path.getsize(obj) != size:
+                    conn.execute('DELETE FROM entries WHERE platform = ? AND video_id = ?',
+                                 (platform, video_id))
+                    return None
+                conn.execute('UPDATE entries SET last_used = ? WHERE platform = ? AND video_id = ?',
+                             (time.time(), platform, video_id))
+
+        if output_name and not os.path.splitext(output_name)[1]:
+            output_name += ext
+        output_path = os.path.join(output_dir(), output_name or filename)
+        if os.path.lexists(output_path):
+            # 已有文件：是缓存对象本身或内容相同就直接用；别的文件不归缓存管，不覆盖
+            if not (os.path.isfile(output_path) and (
+                    os.path.samefile(output_path, obj)
+                    or (os.path.getsize(output_path) == size and _file_sha256(output_path) == sha256))):
+                print(f"  警告: {output_path} 已存在且不是缓存中的文件，不用缓存覆盖它")
+                return None
+        else:
+            _link_or_copy(obj, output_path)
+        if meta:
+            payload = json.loads(meta)
+            payload['output_path'] = output_path
+            with open(output_path + '.meta.json', 'w', encoding='utf-8') as handle:
+                json.dump(payload, handle, ensure_ascii=False, indent=2)
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"  警告: 读取下载缓存失败: {exc}")
+        return None
+    print(f"[缓存] 命中 {platform}:{video_id} → {output_path} ({size / 1048576:.1f}MB)")
+    emit_event('cache_hit', platform=platform, video_id=video_id, bytes=size)
+    return output_path
+
+def download_cache_has(platform, video_id):
+    """只查索引，不放置文件；供批处理计划估算用。"""
+    if not video_id or not download_cache_enabled():
+        return False
+    try:
+        with _download_cache_lock:
+            conn = _download_cache_db()
+            if conn is None:
+                return False
+            with contextlib.closing(conn):
+                return conn.execute(
+                    'SELECT 1 FROM entries WHERE platform = ? AND video_id = ?', (platform, video_id)
+                ).fetchone() is not None
+    except sqlite3.Error:
+        return False
+
+def download_cache_store(platform, video_id, output_path):
+    """把刚下载完成的文件登记进缓存（硬链接进对象目录），之后按容量做 LRU 淘汰。
+
+    output_path 不是文件（例如 yt-dlp 只返回了目录）时跳过；缓存出错只告警。
+    """
+    if not video_id or not download_cache_enabled():
+        return
+    if not isinstance(output_path, str) or not os.path.isfile(output_path):
+        return
+    try:
+        sha256 = _file_sha256(output_path)
+        ext = os.path.splitext(output_path)[1] or '.mp4'
+        obj = _download_cache_object(sha256, ext)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            _link_or_copy(output_path, obj)
+        try:
+            probe = media_summary(probe_media(obj))
+        except RuntimeError:
+            probe = None
+        meta = None
+        if os.path.exists(output_path + '.meta.json'):
+            with open(output_path + '.meta.json', encoding='utf-8') as handle:
+                meta = handle.read()
+        now = time.time()
+        with _download_cache_lock:
+            conn = _download_cache_db(create=True)
+            with contextlib.closing(conn), conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (platform, video_id, sha256, os.path.getsize(obj), ext,
+                     os.path.basename(output_path), json.dumps(probe) if probe else None,
+                     meta, now, now),
+                )
+                _evict_download_cache(conn)
+    except (OSError, ValueError, sqlite3.Error) as exc:
+        print(f"  警告: 写入下载缓存失败: {exc}")
+
+def _evict_download_cache(conn):
+    """按 last_used 从旧到新淘汰，直到缓存对象总大小不超过 DOWNLOAD_CACHE_MAX_BYTES。"""
+    rows = conn.execute(
+        'SELECT platform, video_id, sha256, size, ext FROM entries ORDER BY last_used DESC'
+    ).fetchall()
+    objects = {}
+    for _, _, sha256, size, ext in rows:
+        objects.setdefault((sha256, ext), size)
+    total = sum(objects.values())
+    for platform, video_id, sha256, size, ext in reversed(rows):
+        if total <= DOWNLOAD_CACHE_MAX_BYTES:
+            break
+        conn.execute('DELETE FROM entries WHERE platform = ? AND video_id = ?', (platform, video_id))
+        still_used = conn.execute(
+            'SELECT 1 FROM entries WHERE sha256 = ? AND ext = ?', (sha256, ext)
+        ).fetchone()
+        if still_used is None:
+            try:
+                os.remove(_download_cache_object(sha256, ext))
+            except OSError:
+                pass
+            total -= objects.pop((sha256, ext), 0)
+
 # ── 微信视频号下载 ────────────────────────────────────────
 
 def _find_nonempty_key(node, names):
@@ -418,19 +1769,19 @@ def resolve_wechat_channels(url, resolver_url=None, api_key=None):
     request_url = urllib.parse.urlunparse(
         parsed._replace(query=urllib.parse.urlencode(query))
     )
-    request = urllib.request.Request(request_url, headers={
+    headers = {
         'User-Agent': UA,
         'Accept': 'application/json',
-    })
+    }
     api_key = api_key if api_key is not None else os.environ.get(
         'WECHAT_CHANNELS_RESOLVER_API_KEY', ''
     ).strip()
     if api_key:
-        request.add_header('X-API-Key', api_key)
+        headers['X-API-Key'] = api_key
 
     try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            payload = json.loads(response.read().decode('utf-8'))
+        with span('resolve', resolver=parsed.netloc):
+            payload = http_request('GET', request_url, headers=headers, timeout=30).json()
     except Exception as exc:
         raise RuntimeError(f'请求视频号解析器失败: {exc}') from exc
     return parse_wechat_channels_resolver_response(payload)
@@ -442,9 +1793,16 @@ def _wechat_channels_id(url):
     query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
     return (query.get('id') or ['unknown'])[0]
 
+@traced_engine('wechat_channels')
 def download_wechat_channels(url, output_name=None):
     """解析并下载微信视频号，下载后写出不含临时直链的元数据。"""
     print(f'[1/4] 解析微信视频号链接: {url}')
+    channels_id = _wechat_channels_id(url)
+    cached = download_cache_lookup(
+        'wechat_channels', channels_id if channels_id != 'unknown' else None, output_name
+    )
+    if cached:
+        return cached
     metadata = resolve_wechat_channels(url)
     print('[2/4] 已取得临时视频地址，开始下载...')
 
@@ -454,7 +1812,7 @@ def download_wechat_channels(url, output_name=None):
             metadata.get('description', '')[:40],
         ]))
         output_name = clean_filename(
-            label, f'wechat_channels_{_wechat_channels_id(url)}'
+            label, f'wechat_channels_{channels_id}'
         ) + '.mp4'
     elif not output_name.lower().endswith('.mp4'):
         output_name += '.mp4'
@@ -492,6 +1850,8 @@ def download_wechat_channels(url, output_name=None):
 
     print(f'[4/4] 视频号下载完成: {output_path} ({size / 1048576:.1f}MB)')
     print(f'       元数据: {output_path}.meta.json')
+    if channels_id != 'unknown':
+        download_cache_store('wechat_channels', channels_id, output_path)
     return output_path
 
 
@@ -514,83 +1874,531 @@ def wrap_engine_errors(what):
     return decorate
 
 
-@wrap_engine_errors('无头浏览器抓取失败')
-def launch_browser_and_capture(page_url, video_filter_fn, wait_s=10, extra_wait_s=5, platform=None):
-    """
-    无头浏览器访问页面，通过 video_filter_fn 过滤网络请求捕获视频 CDN URL。
-    返回 (video_cdn_url, page_title)
+# ── 共享浏览器池 ──────────────────────────────────────────
+
+# 同一页面复用多少次后关掉重开，避免长跑批处理时页面内存和监听器越积越多
+BROWSER_PAGE_MAX_USES = int(os.environ.get('VIDEO_DOWNLOAD_PAGE_MAX_USES', '20') or 20)
+
+SHARED_BROWSER_START_TIMEOUT_S = 30
+
+def shared_browser_enabled():
+    return os.environ.get('VIDEO_DOWNLOAD_SHARED_BROWSER', '1').strip() != '0'
+
+@contextlib.contextmanager
+def _launch_shared_chromium(profile_dir):
+    """用 Playwright 启动共享浏览器（带 Playwright 自己的启动参数），另开一个 CDP 端口给其他线程连。
+
+    产出 wait_closed(timeout_s)：最多等 timeout_s 秒，浏览器已退出时返回 True。
+    浏览器归 Playwright 驱动进程管，本进程崩溃、驱动随之退出时浏览器也会被回收。
     """
-    from playwright.sync_api import sync_playwright
+    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+    with sync_playwright() as playwright:
+        context = playwright.chromium.launch_persistent_context(
+            profile_dir, headless=True, args=['--remote-debugging-port=0', '--mute-audio'])
+        closed = []
+        context.on('close', lambda _: closed.append(True))
+
+        def wait_closed(timeout_s):
+            if not closed:
+                try:
+                    context.wait_for_event('close', timeout=timeout_s * 1000)
+                except PlaywrightTimeoutError:
+                    pass
+            return bool(closed)
 
-    video_cdn_url = None
-    cookies = load_cookies(platform) if platform else None
+        try:
+            yield wait_closed
+        finally:
+            with contextlib.suppress(Exception):
+                context.close()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent=UA, viewport={'width': 1280, 'height': 720})
-        if cookies:
-            context.add_cookies(cookies)
-        page = context.new_page()
+class SharedChromium:
+    """进程内所有线程共用的一个无头 Chromium。
 
-        def on_response(response):
-            nonlocal video_cdn_url
-            if video_cdn_url is None and video_filter_fn(response):
-                video_cdn_url = response.url
+    Playwright 同步 API 的对象不能跨线程使用：一个属主线程用 Playwright 启动浏览器并一直持有，
+    其他线程各起一个 Playwright 驱动，通过 CDP 连到这同一个浏览器、各建自己的 context。
+    浏览器退出后下一次 endpoint() 重新启动。
+    """
 
-        page.on('response', on_response)
+    def __init__(self, launcher=_launch_shared_chromium):
+        self._launcher = launcher
+        self._lock = threading.Lock()
+        self._owner = None
+        self._stop = None
+        self._endpoint = None
+        self._profile_dir = None
+
+    def endpoint(self):
+        """返回共享浏览器的 CDP 地址；浏览器不在时（首次或已退出）先启动。"""
+        with self._lock:
+            if self._owner is not None and self._owner.is_alive() and self._endpoint:
+                return self._endpoint
+            self._stop_locked()
+            self._profile_dir = tempfile.mkdtemp(prefix='video_download_chromium_')
+            self._stop = threading.Event()
+            ready = threading.Event()
+            state = {}
+            self._owner = threading.Thread(
+                target=self._own, args=(self._profile_dir, self._stop, ready, state),
+                name='video-download-chromium', daemon=True)
+            self._owner.start()
+            if not ready.wait(SHARED_BROWSER_START_TIMEOUT_S + 5) or 'error' in state:
+                self._stop_locked()
+                raise RuntimeError(f"共享浏览器启动失败: {state.get('error', '超时')}")
+            self._endpoint = state['endpoint']
+            return self._endpoint
+
+    def _own(self, profile_dir, stop, ready, state):
+        try:
+            with self._launcher(profile_dir) as wait_closed:
+                state['endpoint'] = self._wait_endpoint(profile_dir)
+                ready.set()
+                while not stop.is_set() and not wait_closed(1.0):
+                    pass
+        except BaseException as exc:
+            state.setdefault('error', f'{type(exc).__name__}: {exc}')
+        finally:
+            ready.set()
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+    @staticmethod
+    def _wait_endpoint(profile_dir):
+        # Chromium 选好端口后把「端口\n路径」写进 profile 目录的 DevToolsActivePort
+        marker = os.path.join(profile_dir, 'DevToolsActivePort')
+        deadline = time.monotonic() + SHARED_BROWSER_START_TIMEOUT_S
+        while time.monotonic() < deadline:
+            try:
+                with open(marker, encoding='utf-8') as handle:
+                    lines = handle.read().split()
+            except OSError:
+                lines = []
+            if len(lines) >= 2:
+                return f'ws://127.0.0.1:{lines[0]}{lines[1]}'
+            time.sleep(0.05)
+        raise RuntimeError(f'共享浏览器 {SHARED_BROWSER_START_TIMEOUT_S}s 内未就绪')
+
+    def _stop_locked(self):
+        owner, self._owner, self._endpoint = self._owner, None, None
+        if owner is not None:
+            self._stop.set()
+            owner.join(timeout=10)
+        self._profile_dir = None
+
+    def close(self):
+        with self._lock:
+            self._stop_locked()
+
+shared_chromium = SharedChromium()
+
+class BrowserPool:
+    """一个线程内长期复用的浏览器连接。
+
+    默认连到进程共享的 Chromium（见 SharedChromium），VIDEO_DOWNLOAD_SHARED_BROWSER=0 时本线程自己启动一个；
+    每个平台一个 context，Cookie 在创建 context 时注入，Cookie 文件变化后重建该 context；
+    每个平台保留一个页面，用满 page_max_uses 次或出错后关掉重开。
+    Playwright 同步 API 绑定创建它的线程，所以池按线程各持一份（见 get_browser_pool）。
+    """
 
+    def __init__(self, page_max_uses=BROWSER_PAGE_MAX_USES):
+        self.page_max_uses = max(1, page_max_uses)
+        self._playwright = None
+        self._browser = None
+        self._contexts = {}
+        self._context_stamps = {}
+        self._pages = {}
+
+    def _ensure_browser(self):
+        if self._browser is not None and self._browser.is_connected():
+            return self._browser
+        from playwright.sync_api import sync_playwright
+        shared = shared_browser_enabled()
+        with span('browser_launch', mode='shared' if shared else 'headless'):
+            if self._playwright is None:
+                self._playwright = sync_playwright().start()
+            self._contexts.clear()
+            self._context_stamps.clear()
+            self._pages.clear()
+            chromium = self._playwright.chromium
+            if shared:
+                self._browser = chromium.connect_over_cdp(shared_chromium.endpoint())
+            else:
+                self._browser = chromium.launch(headless=True)
+        return self._browser
+
+    def context(self, platform=None):
+        key = platform or ''
+        stamp = cookie_store.stamp(platform) if platform else None
+        ctx = self._contexts.get(key)
+        if ctx is not None and self._context_stamps.get(key) != stamp:
+            # Cookie 文件变了（重新登录、别的进程刷新）：旧 context 连同它的页面一起丢掉
+            self._pages.pop(key, None)
+            self._contexts.pop(key, None)
+            try:
+                ctx.close()
+            except Exception:
+                pass
+            ctx = None
+        if ctx is None:
+            ctx = self._ensure_browser().new_context(
+                user_agent=UA, viewport={'width': 1280, 'height': 720}
+            )
+            cookies = load_cookies(platform) if platform else None
+            if cookies:
+                ctx.add_cookies(cookies)
+            self._contexts[key] = ctx
+            self._context_stamps[key] = stamp
+        return ctx
+
+    @contextlib.contextmanager
+    def page(self, platform=None):
+        """借出该平台的复用页面；正常归还时回到 about:blank，出错或用满则关闭。"""
+        key = platform or ''
+        ctx = self.context(platform)
+        entry = self._pages.pop(key, None)
+        if entry is None or entry['page'].is_closed():
+            entry = {'page': ctx.new_page(), 'uses': 0}
+        entry['uses'] += 1
+        page = entry['page']
+        healthy = False
         try:
-            page.goto(page_url, wait_until='domcontentloaded', timeout=30000)
-            page.wait_for_timeout(wait_s * 1000)
-        except Exception as e:
-            print(f"  警告: 页面加载异常: {e}")
+            yield page
+            healthy = True
+        finally:
+            if healthy and entry['uses'] < self.page_max_uses:
+                try:
+                    # 停掉上一条视频的播放和后续请求，页面留给下一次用
+                    page.goto('about:blank', timeout=10000)
+                    self._pages[key] = entry
+                except Exception:
+                    healthy = False
+            if not (healthy and self._pages.get(key) is entry):
+                try:
+                    page.close()
+                except Exception:
+                    pass
 
-        if not video_cdn_url:
-            print("  等待视频流加载...")
-            page.wait_for_timeout(extra_wait_s * 1000)
+    def close(self):
+        for ctx in list(self._contexts.values()):
+            try:
+                ctx.close()
+            except Exception:
+                pass
+        self._contexts.clear()
+        self._context_stamps.clear()
+        self._pages.clear()
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+_browser_pools = threading.local()
+
+def get_browser_pool():
+    """当前线程的浏览器池（按需创建）。"""
+    pool = getattr(_browser_pools, 'pool', None)
+    if pool is None:
+        pool = BrowserPool()
+        _browser_pools.pool = pool
+    return pool
+
+def close_browser_pool():
+    """关闭当前线程的浏览器池；批处理 worker 退出前和主线程 atexit 时调用。"""
+    pool = getattr(_browser_pools, 'pool', None)
+    if pool is not None:
+        _browser_pools.pool = None
+        pool.close()
+
+# atexit 后注册先执行：先断开本线程的连接，再关共享浏览器进程
+atexit.register(shared_chromium.close)
+atexit.register(close_browser_pool)
+
+# 抓流页面的请求拦截：图片、字体、统计上报一律中止；视频请求只记下 URL、不下载正文。
+# 各平台额外的统计/监控域名（只拦纯上报，不碰风控签名相关的脚本）。
+CAPTURE_BLOCK_TYPES = ('image', 'font')
+CAPTURE_BLOCK_HOSTS = {
+    '*': ('google-analytics.com', 'googletagmanager.com', 'hm.baidu.com', 'cnzz.com'),
+    'douyin': ('mcs.zijieapi.com', 'mon.zijieapi.com', 'mcs.snssdk.com', 'mon.snssdk.com'),
+    'xiaohongshu': ('apm-fe.xiaohongshu.com', 't2.xiaohongshu.com', 'lng.xiaohongshu.com'),
+    'bilibili': ('data.bilibili.com', 'cm.bilibili.com', 'api.bilibili.com/x/click-interface'),
+}
+# 只取页面内嵌数据、不需要抓流的平台：视频请求也直接中止
+CAPTURE_BLOCK_ALL_MEDIA = ('bilibili',)
+
+def capture_routing_enabled():
+    return os.environ.get('VIDEO_DOWNLOAD_BLOCK_ASSETS', '1').strip() != '0'
+
+def should_block_request(platform, resource_type, url):
+    """抓流页面上这个请求是否可以直接中止（不影响拿到视频地址）。"""
+    if resource_type in CAPTURE_BLOCK_TYPES:
+        return True
+    if resource_type == 'media' and platform in CAPTURE_BLOCK_ALL_MEDIA:
+        return True
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or ''
+    for pattern in CAPTURE_BLOCK_HOSTS['*'] + CAPTURE_BLOCK_HOSTS.get(platform, ()):
+        # 模式是域名（含子域名），或「域名/路径前缀」
+        domain, _, path = pattern.partition('/')
+        if (host == domain or host.endswith('.' + domain)) and parts.path.startswith('/' + path):
+            return True
+    return False
 
-        page_title = ""
+@contextlib.contextmanager
+def capture_routing(page, platform, on_media=None):
+    """在借出的页面上临时装一个拦截路由，退出时卸掉（页面会被下一次抓取复用）。
+
+    on_media(request) 返回真时表示这是要抓的视频请求：URL 已被调用方记下，正文直接中止。
+    产出一个计数 dict（blocked / media），供 capture span 记录。
+    """
+    counts = {'blocked': 0, 'media': 0}
+    if not capture_routing_enabled():
+        yield counts
+        return
+
+    def handle(route):
+        request = route.request
         try:
-            page_title = page.title()
-        except:
+            if on_media is not None and on_media(request):
+                counts['media'] += 1
+                route.abort('blockedbyclient')
+            elif should_block_request(platform, request.resource_type, request.url):
+                counts['blocked'] += 1
+                route.abort('blockedbyclient')
+            else:
+                route.continue_()
+        except Exception:
+            pass  # 页面已跳走或关闭时路由可能已失效
+
+    page.route('**/*', handle)
+    try:
+        yield counts
+    finally:
+        try:
+            page.unroute('**/*', handle)
+        except Exception:
             pass
 
-        browser.close()
+@wrap_engine_errors('无头浏览器抓取失败')
+def launch_browser_and_capture(page_url, video_url_fn, wait_s=10, extra_wait_s=5, platform=None,
+                               video_response_fn=None):
+    """
+    无头浏览器访问页面，捕获视频 CDN URL。
+    video_url_fn(url) 只看 URL：拦截路由里请求还没有响应头，只能据此认出视频请求（只记 URL、正文直接中止）；
+    video_response_fn(response) 可选，用于只能靠响应头（如 content-type）认出的视频响应，正文会照常下载。
+    使用当前线程的共享浏览器池，不再每次启动 Chromium。
+    返回 (video_cdn_url, page_title)
+    """
+    video_cdn_url = None
+    matched_at = None
+
+    with get_browser_pool().page(platform) as page:
+        def on_response(response):
+            nonlocal video_cdn_url, matched_at
+            if video_cdn_url is not None:
+                return
+            if video_url_fn(response.url) or (video_response_fn is not None and video_response_fn(response)):
+                video_cdn_url = response.url
+                matched_at = time.monotonic()
+
+        def on_media(request):
+            # 拦截路由里先看到视频请求：记下 URL 即可，正文不必下载
+            nonlocal video_cdn_url, matched_at
+            if not video_url_fn(request.url):
+                return False
+            if video_cdn_url is None:
+                video_cdn_url = request.url
+                matched_at = time.monotonic()
+            return True
+
+        page.on('response', on_response)
+        started = time.monotonic()
+        try:
+            # wait_s / extra_wait_s 只是上限：一命中视频流就结束等待
+            with span('capture') as capture_span, \
+                    capture_routing(page, platform, on_media) as routed:
+                try:
+                    with span('page_load', url=page_url):
+                        page.goto(page_url, wait_until='domcontentloaded', timeout=30000)
+                    wait_until(page, lambda: video_cdn_url, wait_s)
+                except Exception as e:
+                    print(f"  警告: 页面加载异常: {e}")
+
+                if not video_cdn_url:
+                    print("  等待视频流加载...")
+                    wait_until(page, lambda: video_cdn_url, extra_wait_s)
+                capture_span.update(hit=bool(video_cdn_url), **routed)
+            record_capture_timing(platform, matched_at - started if matched_at else None)
+
+            page_title = ""
+            try:
+                page_title = page.title()
+            except:
+                pass
+        finally:
+            page.remove_listener('response', on_response)
 
     return video_cdn_url, page_title
 
 @wrap_engine_errors('无头浏览器执行失败')
 def launch_browser_and_eval(page_url, js_code, wait_s=5, platform=None):
-    """无头浏览器访问页面并执行 JS，返回 (result, page_title)"""
-    from playwright.sync_api import sync_playwright
-    cookies = load_cookies(platform) if platform else None
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent=UA, viewport={'width': 1280, 'height': 720})
-        if cookies:
-            context.add_cookies(cookies)
-        page = context.new_page()
-
+    """无头浏览器访问页面并执行 JS（共享浏览器池），返回 (result, page_title)"""
+    with get_browser_pool().page(platform) as page, capture_routing(page, platform) as routed:
+        result = None
         try:
-            page.goto(page_url, wait_until='domcontentloaded', timeout=30000)
-            page.wait_for_timeout(wait_s * 1000)
+            with span('page_load', url=page_url):
+                page.goto(page_url, wait_until='domcontentloaded', timeout=30000)
+            # wait_s 只是上限：js_code 一返回有效结果就不再等
+            with span('capture', mode='eval') as capture_span:
+                deadline = time.monotonic() + wait_s
+                while time.monotonic() < deadline:
+                    try:
+                        result = page.evaluate(js_code)
+                    except Exception:
+                        result = None  # 页面还在跳转，执行上下文可能被销毁
+                    if result:
+                        break
+                    page.wait_for_timeout(250)
+                capture_span.update(hit=bool(result), **routed)
         except Exception as e:
             print(f"  警告: 页面加载异常: {e}")
 
-        result = page.evaluate(js_code)
+        if not result:
+            result = page.evaluate(js_code)
         page_title = ""
         try:
             page_title = page.title()
         except:
             pass
 
-        browser.close()
-
     return result, page_title
 
+# ── 页面内嵌数据直取（不启动浏览器的快速路径） ──────────────
+
+# 页面 HTML 的读取上限；内嵌状态都在前几百 KB 内
+PAGE_STATE_MAX_BYTES = 8 * 1024 * 1024
+PAGE_STATE_TIMEOUT_S = 15
+
+def page_fast_path_enabled():
+    return os.environ.get('VIDEO_DOWNLOAD_PAGE_FAST_PATH', '1').strip() != '0'
+
+def cookie_header(platform, url):
+    """已保存的平台 Cookie 中适用于 url 主机且未过期的部分，拼成 Cookie 请求头；没有返回 None。"""
+    host = urllib.parse.urlsplit(url).hostname or ''
+    now = time.time()
+    pairs = []
+    for c in cookie_store.get(platform) or []:
+        domain = (c.get('domain') or host).lstrip('.')
+        expires = c.get('expires') or -1
+        if (host == domain or host.endswith('.' + domain)) and not (0 < expires < now):
+            pairs.append(f"{c['name']}={c['value']}")
+    return '; '.join(pairs) or None
+
+def fetch_page_html(url, platform, referer=None):
+    """带上已保存的平台 Cookie 直接 GET 页面，返回 HTML 文本。"""
+    headers = {
+        'User-Agent': UA,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+    }
+    if referer:
+        headers['Referer'] = referer
+    cookie = cookie_header(platform, url)
+    if cookie:
+        headers['Cookie'] = cookie
+    with span('page_load', url=url, mode='http'):
+        resp = http_request('GET', url, headers=headers, timeout=PAGE_STATE_TIMEOUT_S,
+                            limit=PAGE_STATE_MAX_BYTES)
+    return resp.body.decode('utf-8', 'replace')
+
+def _iter_dicts(node):
+    """深度优先遍历嵌套 JSON 里的所有 dict。"""
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            yield item
+            stack.extend(reversed(list(item.values())))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+
+def _https(url):
+    return 'https:' + url if url.startswith('//') else url
+
+def extract_douyin_play_url(html, video_id):
+    """从抖音页面的 RENDER_DATA（或分享页的 _ROUTER_DATA）里取 (播放地址, 标题)；取不到返回 (None, None)。"""
+    states = []
+    m = re.search(r'<script id="RENDER_DATA" type="application/json">(.*?)</script>', html, re.S)
+    if m:
+        states.append(urllib.parse.unquote(m.group(1)))
+    m = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})\s*</script>', html, re.S)
+    if m:
+        states.append(m.group(1))
+    for raw in states:
+        try:
+            state = json.loads(raw)
+        except ValueError:
+            continue
+        for node in _iter_dicts(state):
+            if str(node.get('awemeId') or node.get('aweme_id') or '') != video_id:
+                continue
+            video = node.get('video')
+            if not isinstance(video, dict):
+                continue
+            candidates = [a.get('src') for a in video.get('playAddr') or [] if isinstance(a, dict)]
+            candidates += (video.get('play_addr') or {}).get('url_list') or []
+            for url in candidates:
+                if isinstance(url, str) and url:
+                    # 分享页给的是带水印的 playwm 地址，换成 play 即无水印版本
+                    return _https(url).replace('/playwm/', '/play/'), node.get('desc') or ''
+    return None, None
+
+def extract_xhs_video_url(html, note_id):
+    """从小红书笔记页的 __INITIAL_STATE__ 里取 (视频地址, 标题)；取不到返回 (None, None)。"""
+    m = re.search(r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*</script>', html, re.S)
+    if not m:
+        return None, None
+    # 内嵌的是 JS 对象字面量，值里会出现 undefined
+    raw = re.sub(r'(?<=[:\[,])undefined(?=[,}\]])', 'null', m.group(1))
+    try:
+        state = json.loads(raw)
+    except ValueError:
+        return None, None
+    for node in _iter_dicts(state):
+        if node.get('noteId') != note_id or not isinstance(node.get('video'), dict):
+            continue
+        video = node['video']
+        stream = (video.get('media') or {}).get('stream') or {}
+        for codec in ('h264', 'h265', 'av1'):
+            for item in stream.get(codec) or []:
+                url = item.get('masterUrl') or next(iter(item.get('backupUrls') or []), None)
+                if url:
+                    return _https(url), node.get('title') or node.get('desc') or ''
+        key = (video.get('consumer') or {}).get('originVideoKey')
+        if key:
+            return f'https://sns-video-bd.xhscdn.com/{key}', node.get('title') or node.get('desc') or ''
+    return None, None
+
+def download_validated(cdn_url, output_path, referer):
+    """下载直链并用 ffprobe 确认有视频轨；不合格时删掉文件并抛 RuntimeError。返回字节数。"""
+    try:
+        size = download_file(cdn_url, output_path, referer)
+        validate_video_file(output_path)
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return size
+
 # ── 抖音下载 ──────────────────────────────────────────────
 
+@traced_engine('douyin')
 def download_douyin(url, output_name=None):
     print(f"[1/4] 解析抖音链接: {url}")
 
@@ -601,40 +2409,59 @@ def download_douyin(url, output_name=None):
         final = resolve_redirect(url)
         m = re.search(r'/video/(\d+)', final)
         if not m:
-            print(f"错误: 无法解析视频ID, 最终URL: {final}")
-            sys.exit(1)
-        video_id = m.group(1)
-
-    page_url = f"https://www.douyin.com/video/{video_id}"
-    print(f"[2/4] 视频ID: {video_id}, 启动无头浏览器...")
-
-    def is_douyin_video(resp):
-        u = resp.url
-        return 'douyinvod.com' in u and 'video_mp4' in u
-
-    try:
-        cdn_url, page_title = launch_browser_and_capture(page_url, is_douyin_video, platform='douyin')
-    except RuntimeError as exc:
-        print(f"  Playwright 失败: {exc}")
-        cdn_url = None
+            print(f"错误: 无法解析视频ID, 最终URL: {final}")
+            sys.exit(1)
+        video_id = m.group(1)
 
-    if not cdn_url:
-        print("  改用 yt-dlp...")
-        return download_ytdlp(page_url, output_name, platform='douyin')
+    cached = download_cache_lookup('douyin', video_id, output_name)
+    if cached:
+        return cached
 
-    print(f"[3/4] 捕获到视频地址，开始下载...")
+    page_url = f"https://www.douyin.com/video/{video_id}"
 
-    if not output_name:
-        title = page_title.replace(' - 抖音', '').strip()
-        output_name = clean_filename(title, f"douyin_{video_id}") + '.mp4'
+    def is_douyin_video_url(u):
+        return 'douyinvod.com' in u and 'video_mp4' in u
 
-    output_path = os.path.join(output_dir(), output_name)
-    size = download_file(cdn_url, output_path, 'https://www.douyin.com/')
-    print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
-    return output_path
+    def via_http():
+        print(f"[2/4] 视频ID: {video_id}, 直接请求页面读取内嵌数据...")
+        cdn_url, title = extract_douyin_play_url(fetch_page_html(page_url, 'douyin'), video_id)
+        if not cdn_url:
+            raise RuntimeError('页面内嵌数据里没有播放地址')
+        print(f"[3/4] 取得播放地址，开始下载...")
+        name = output_name or clean_filename(title, f"douyin_{video_id}") + '.mp4'
+        output_path = os.path.join(output_dir(), name)
+        size = download_validated(cdn_url, output_path, 'https://www.douyin.com/')
+        print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
+        return output_path
+
+    def via_playwright():
+        print(f"[2/4] 视频ID: {video_id}, 启动无头浏览器...")
+        cdn_url, page_title = launch_browser_and_capture(page_url, is_douyin_video_url, platform='douyin')
+        if not cdn_url:
+            raise RuntimeError('未捕获到视频地址')
+        print(f"[3/4] 捕获到视频地址，开始下载...")
+        name = output_name
+        if not name:
+            title = page_title.replace(' - 抖音', '').strip()
+            name = clean_filename(title, f"douyin_{video_id}") + '.mp4'
+        output_path = os.path.join(output_dir(), name)
+        size = download_file(cdn_url, output_path, 'https://www.douyin.com/')
+        print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
+        return output_path
+
+    # 默认 页面直取 → Playwright → yt-dlp，实际顺序由引擎记分板决定
+    engines = {'http': via_http} if page_fast_path_enabled() else {}
+    engines.update({
+        'playwright': via_playwright,
+        'ytdlp': lambda: download_ytdlp(page_url, output_name, platform='douyin'),
+    })
+    result = run_engine_attempts('douyin', engine_attempts('douyin', engines, '抖音'), '抖音')
+    download_cache_store('douyin', video_id, result)
+    return result
 
 # ── 小红书下载 ────────────────────────────────────────────
 
+@traced_engine('xiaohongshu')
 def download_xiaohongshu(url, output_name=None):
     print(f"[1/4] 解析小红书链接: {url}")
 
@@ -645,41 +2472,163 @@ def download_xiaohongshu(url, output_name=None):
     m = re.search(r'/(?:discovery/item|explore)/([a-f0-9]+)', url)
     note_id = m.group(1) if m else 'unknown'
 
-    print(f"[2/4] 笔记ID: {note_id}, 启动无头浏览器...")
+    def is_xhs_video_url(u):
+        return bool(re.search(r'sns-(video|bak)[^.]*\.xhscdn\.com.*\.mp4', u))
+
+    def is_xhs_video_response(resp):
+        # 其他 xhscdn 地址只有响应头的 content-type 能说明是视频
+        return 'xhscdn.com' in resp.url and 'video' in resp.headers.get('content-type', '')
+
+    def via_http():
+        print(f"[2/4] 笔记ID: {note_id}, 直接请求页面读取内嵌数据...")
+        cdn_url, title = extract_xhs_video_url(fetch_page_html(url, 'xiaohongshu'), note_id)
+        if not cdn_url:
+            raise RuntimeError('页面内嵌数据里没有视频地址')
+        print(f"[3/4] 取得视频地址，开始下载...")
+        name = output_name or clean_filename(title, f"xiaohongshu_{note_id}") + '.mp4'
+        output_path = os.path.join(output_dir(), name)
+        size = download_validated(cdn_url, output_path, 'https://www.xiaohongshu.com/')
+        print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
+        return output_path
+
+    def via_playwright():
+        print(f"[2/4] 笔记ID: {note_id}, 启动无头浏览器...")
+        cdn_url, page_title = launch_browser_and_capture(
+            url, is_xhs_video_url, platform='xiaohongshu', video_response_fn=is_xhs_video_response)
+        if not cdn_url:
+            raise RuntimeError('未捕获到视频地址')
+        print(f"[3/4] 捕获到视频地址，开始下载...")
+        name = output_name
+        if not name:
+            title = page_title.replace(' - 小红书', '').strip()
+            title = re.sub(r'小红书\s*[-–—]\s*你的生活兴趣社区', '', title).strip()
+            name = clean_filename(title, f"xiaohongshu_{note_id}") + '.mp4'
+        output_path = os.path.join(output_dir(), name)
+        size = download_file(cdn_url, output_path, 'https://www.xiaohongshu.com/')
+        print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
+        return output_path
+
+    engines = {'http': via_http} if page_fast_path_enabled() and note_id != 'unknown' else {}
+    engines.update({
+        'playwright': via_playwright,
+        'ytdlp': lambda: download_ytdlp(url, output_name, platform='xiaohongshu'),
+    })
+    return run_engine_attempts('xiaohongshu', engine_attempts('xiaohongshu', engines, '小红书'), '小红书')
 
-    def is_xhs_video(resp):
-        u = resp.url
-        ct = resp.headers.get('content-type', '')
-        if 'video' in ct and 'xhscdn.com' in u:
-            return True
-        if re.search(r'sns-(video|bak)[^.]*\.xhscdn\.com.*\.mp4', u):
-            return True
-        return False
+# ── B站下载 ───────────────────────────────────────────────
 
-    try:
-        cdn_url, page_title = launch_browser_and_capture(url, is_xhs_video, platform='xiaohongshu')
-    except RuntimeError as exc:
-        print(f"  Playwright 失败: {exc}")
-        cdn_url = None
+def dash_mux_command(video_input, audio_input, output_path):
+    """ffmpeg 无损合并 DASH 音视频的命令行。"""
+    return ['ffmpeg', '-y', '-loglevel', 'error', '-i', video_input, '-i', audio_input,
+            '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', 'copy', output_path]
 
-    if not cdn_url:
-        print("  改用 yt-dlp...")
-        return download_ytdlp(url, output_name, platform='xiaohongshu')
+def dash_streaming_mux_available():
+    """命名管道只在 POSIX 上可用；VIDEO_DOWNLOAD_STREAM_MUX=0 可强制先落盘再合并。"""
+    return hasattr(os, 'mkfifo') and os.environ.get('VIDEO_DOWNLOAD_STREAM_MUX', '1').strip() != '0'
 
-    print(f"[3/4] 捕获到视频地址，开始下载...")
+def _open_fifo_for_writing(fifo_path, proc, timeout_s=60):
+    """等 ffmpeg 打开管道读端后再打开写端；ffmpeg 提前退出时不会永远阻塞。"""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as exc:
+            if getattr(exc, 'errno', None) != errno.ENXIO:
+                raise
+            if proc.poll() is not None:
+                raise RuntimeError(f'ffmpeg 已退出 (exit {proc.returncode})')
+            if time.monotonic() > deadline:
+                raise RuntimeError('等待 ffmpeg 打开管道超时')
+            time.sleep(0.05)
+            continue
+        os.set_blocking(fd, True)
+        return os.fdopen(fd, 'wb')
 
-    if not output_name:
-        title = page_title.replace(' - 小红书', '').strip()
-        title = re.sub(r'小红书\s*[-–—]\s*你的生活兴趣社区', '', title).strip()
-        output_name = clean_filename(title, f"xiaohongshu_{note_id}") + '.mp4'
+def mux_dash_streaming(video_url, audio_url, output_path, referer, extra_headers=None):
+    """音视频两路并发下载，经命名管道直接喂给 ffmpeg 合并。
 
-    output_path = os.path.join(output_dir(), output_name)
-    size = download_file(cdn_url, output_path, 'https://www.xiaohongshu.com/')
-    print(f"[4/4] 下载完成: {output_path} ({size / 1048576:.1f}MB)")
+    合并与下载重叠，总耗时接近 max(视频, 音频)，磁盘只写最终文件一份。失败抛 RuntimeError。
+    """
+    headers = {'Referer': referer, 'User-Agent': UA}
+    headers.update(extra_headers or {})
+    tmp_dir = tempfile.mkdtemp(prefix='bili_mux_')
+    fifos = {'video': os.path.join(tmp_dir, 'video.m4s'), 'audio': os.path.join(tmp_dir, 'audio.m4s')}
+    urls = {'video': video_url, 'audio': audio_url}
+    try:
+        for fifo_path in fifos.values():
+            os.mkfifo(fifo_path, 0o600)
+        try:
+            proc = subprocess.Popen(
+                dash_mux_command(fifos['video'], fifos['audio'], output_path),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError as exc:
+            raise RuntimeError('未安装 ffmpeg') from exc
+
+        errors = {}
+
+        def feed(kind):
+            try:
+                with span('transfer', track=kind, streaming=True) as sp:
+                    with _open_fifo_for_writing(fifos[kind], proc) as sink:
+                        sp['bytes'] = run_http(stream_url_to(urls[kind], headers, sink.write))
+            except Exception as exc:
+                errors[kind] = exc
+
+        with span('mux', mode='stream'):
+            context = current_event_context()
+            feeders = [
+                threading.Thread(target=call_with_event_context, args=(context, feed, kind), daemon=True)
+                for kind in fifos
+            ]
+            for t in feeders:
+                t.start()
+            for t in feeders:
+                t.join()
+            if errors:
+                proc.kill()
+            _, stderr = proc.communicate()
+        if errors or proc.returncode != 0:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            detail = '; '.join(f'{k}: {v}' for k, v in errors.items()) or (
+                stderr or b'').decode('utf-8', 'replace')[:300]
+            raise RuntimeError(f'边下边合并失败: {detail}')
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
     return output_path
 
-# ── B站下载 ───────────────────────────────────────────────
+def mux_dash_files(video_url, audio_url, output_path, referer, extra_headers=None):
+    """音视频两路并发下载到临时文件（各自分段续传），再用 ffmpeg 合并。失败抛 RuntimeError。"""
+    tmp_dir = tempfile.mkdtemp(prefix='bili_dl_')
+    video_path = os.path.join(tmp_dir, 'video.m4s')
+    audio_path = os.path.join(tmp_dir, 'audio.m4s')
+    try:
+        context = current_event_context()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            vs = pool.submit(call_with_event_context, dict(context, track='video'),
+                             download_file, video_url, video_path, referer, extra_headers)
+            aus = pool.submit(call_with_event_context, dict(context, track='audio'),
+                              download_file, audio_url, audio_path, referer, extra_headers)
+            print(f"       视频: {vs.result() / 1048576:.1f}MB")
+            print(f"       音频: {aus.result() / 1048576:.1f}MB")
+
+        print(f"       ffmpeg 合并音视频...")
+        try:
+            with span('mux', mode='files'):
+                result = subprocess.run(
+                    dash_mux_command(video_path, audio_path, output_path),
+                    capture_output=True, text=True
+                )
+        except FileNotFoundError as exc:
+            raise RuntimeError('未安装 ffmpeg') from exc
+        if result.returncode != 0:
+            raise RuntimeError((result.stderr or '')[:300])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return output_path
 
+@traced_engine('bilibili_playwright')
 def download_bilibili_playwright(url, output_name=None):
     print(f"[1/5] 解析B站链接: {url}")
 
@@ -740,65 +2689,79 @@ def download_bilibili_playwright(url, output_name=None):
     print(f"[3/5] 视频: {best_video.get('width','?')}x{best_video.get('height','?')} {best_video['codecs']}")
     print(f"       音频: {best_audio['codecs']}")
 
-    # 下载视频流和音频流到临时目录
-    tmp_dir = tempfile.mkdtemp(prefix='bili_dl_')
-    video_path = os.path.join(tmp_dir, 'video.m4s')
-    audio_path = os.path.join(tmp_dir, 'audio.m4s')
-
-    referer = 'https://www.bilibili.com/'
-    headers = {'Origin': 'https://www.bilibili.com'}
-
-    print(f"[3/5] 下载视频流...")
-    vs = download_file(best_video['baseUrl'], video_path, referer, headers)
-    print(f"       视频: {vs / 1048576:.1f}MB")
-
-    print(f"[4/5] 下载音频流...")
-    aus = download_file(best_audio['baseUrl'], audio_path, referer, headers)
-    print(f"       音频: {aus / 1048576:.1f}MB")
-
     # 确定输出文件名
     if not output_name:
         title = page_title.replace('_哔哩哔哩_bilibili', '').strip()
         output_name = clean_filename(title, f"bilibili_{bvid}") + '.mp4'
 
     output_path = os.path.join(output_dir(), output_name)
+    referer = 'https://www.bilibili.com/'
+    headers = {'Origin': 'https://www.bilibili.com'}
 
-    # ffmpeg 合并
-    print(f"[5/5] ffmpeg 合并音视频...")
-    result = subprocess.run(
-        ['ffmpeg', '-y', '-i', video_path, '-i', audio_path,
-         '-c:v', 'copy', '-c:a', 'copy', output_path],
-        capture_output=True, text=True
-    )
-
-    # 清理临时文件
+    # 音视频两路同时下载；能用命名管道时 ffmpeg 边收边合并，不落临时文件
     try:
-        os.remove(video_path)
-        os.remove(audio_path)
-        os.rmdir(tmp_dir)
-    except:
-        pass
-
-    if result.returncode != 0:
-        print(f"ffmpeg 合并失败: {result.stderr[:300]}")
+        if dash_streaming_mux_available():
+            print(f"[4/5] 并发下载音视频流，ffmpeg 边下边合并...")
+            try:
+                mux_dash_streaming(best_video['baseUrl'], best_audio['baseUrl'],
+                                   output_path, referer, headers)
+            except RuntimeError as exc:
+                print(f"  边下边合并失败，改为先落盘再合并: {exc}")
+                mux_dash_files(best_video['baseUrl'], best_audio['baseUrl'],
+                               output_path, referer, headers)
+        else:
+            print(f"[4/5] 并发下载音视频流...")
+            mux_dash_files(best_video['baseUrl'], best_audio['baseUrl'],
+                           output_path, referer, headers)
+    except RuntimeError as exc:
+        print(f"ffmpeg 合并失败: {exc}")
         print("提示: 请确保已安装 ffmpeg (brew install ffmpeg)")
         sys.exit(1)
 
     size = os.path.getsize(output_path) / 1048576
-    print(f"下载完成: {output_path} ({size:.1f}MB)")
+    print(f"[5/5] 下载完成: {output_path} ({size:.1f}MB)")
     return output_path
 
 def download_bilibili(url, output_name=None):
-    """优先使用 yt-dlp；失败时回退现有 Playwright 解析链路。"""
-    print("[B站] 优先使用 yt-dlp...")
-    try:
-        return download_ytdlp(url, output_name, platform='bilibili')
-    except RuntimeError as exc:
-        print(f"[B站] yt-dlp 失败，回退 Playwright: {exc}")
-        return download_bilibili_playwright(url, output_name)
+    """默认先 yt-dlp、失败回退 Playwright（顺序由引擎记分板调整）。命中下载缓存时两者都跳过。"""
+    if 'b23.tv' in url:
+        url = resolve_redirect(url)
+        print(f"  跳转到: {url}")
+    m = re.search(r'/video/(BV[A-Za-z0-9]+)', url)
+    bvid = m.group(1) if m else None
+    cached = download_cache_lookup('bilibili', bvid, output_name)
+    if cached:
+        return cached
+
+    result = run_engine_attempts('bilibili', engine_attempts('bilibili', {
+        'ytdlp': lambda: download_ytdlp(url, output_name, platform='bilibili'),
+        'playwright': lambda: download_bilibili_playwright(url, output_name),
+    }, 'B站'), 'B站')
+    download_cache_store('bilibili', bvid, result)
+    return result
 
 # ── TikTok 下载（CDP 优先，失败回退 yt-dlp） ────────────────
 
+def save_captured_tiktok_media(ctx, page, hit, output_path):
+    """把 CDP 抓到的 TikTok 视频响应写到磁盘，返回字节数。
+
+    带上浏览器里该 URL 的 Cookie 和页面 UA，经 download_file 分段流式回放，内存占用与视频大小无关。
+    不退回读取浏览器里已缓冲的响应体（那会把整段视频读进内存）；CDN 拒绝回放时直接报错，交给下一个引擎。
+    """
+    cookies = ctx.cookies(hit['url'])
+    headers = {}
+    if cookies:
+        headers['Cookie'] = '; '.join(f"{c['name']}={c['value']}" for c in cookies)
+    try:
+        headers['User-Agent'] = page.evaluate('() => navigator.userAgent') or UA
+    except Exception:
+        pass
+    try:
+        return download_file(hit['url'], output_path, 'https://www.tiktok.com/', headers)
+    except Exception as exc:
+        raise RuntimeError(f'回放抓到的视频地址失败: {exc}') from exc
+
+@traced_engine('tiktok_cdp')
 def download_tiktok_cdp(url, output_name=None):
     """通过已登录的真实浏览器 CDP 抓取 TikTok 视频（活动 tab、先播放、强校验）。"""
     from playwright.sync_api import sync_playwright
@@ -840,7 +2803,8 @@ def download_tiktok_cdp(url, output_name=None):
         try:
             print(f"[TikTok/CDP] 尝试连接: {endpoint}")
             with sync_playwright() as p:
-                browser = p.chromium.connect_over_cdp(endpoint)
+                with span('browser_launch', mode='cdp', endpoint=endpoint):
+                    browser = p.chromium.connect_over_cdp(endpoint)
                 if not browser.contexts:
                     raise RuntimeError('CDP 未发现可用浏览器上下文')
                 ctx = browser.contexts[0]
@@ -856,7 +2820,8 @@ def download_tiktok_cdp(url, output_name=None):
                     target_page = ctx.new_page()
                     created_new_page = True
 
-                target_page.goto(url, wait_until='domcontentloaded', timeout=60000)
+                with span('page_load', url=url):
+                    target_page.goto(url, wait_until='domcontentloaded', timeout=60000)
 
                 # 跳转后先做 URL 级校验，避免被重定向到别的帖子
                 current_url = target_page.url or ''
@@ -866,7 +2831,12 @@ def download_tiktok_cdp(url, output_name=None):
                     )
 
                 # 从页面数据读取当前视频 ID 和时长；拿不到则视为不安全，不继续下载
-                target_page.wait_for_timeout(1500)
+                try:
+                    target_page.wait_for_function(
+                        '() => !!(window.__UNIVERSAL_DATA__ || window.SIGI_STATE)', timeout=1500
+                    )
+                except Exception:
+                    pass
                 video_meta = target_page.evaluate("""() => {
                   try {
                     const s = window.__UNIVERSAL_DATA__?.__DEFAULT_SCOPE__;
@@ -921,10 +2891,11 @@ def download_tiktok_cdp(url, output_name=None):
                         f'页面视频ID不匹配: expected={expected_vid}, actual={actual_vid}'
                     )
 
-                # 监听响应并直接取 response.body()，避免 requestId 失效
-                hit = {'url': None, 'bytes': None}
+                # 只记下命中的视频 URL，从不读 body()：
+                # 视频体随后用页面 Cookie 回放 URL 流式落盘，内存不随视频大小增长
+                hit = {'url': None, 'at': None}
                 def on_response(resp):
-                    if hit['bytes'] is not None:
+                    if hit['url'] is not None:
                         return
                     try:
                         status = resp.status
@@ -939,11 +2910,8 @@ def download_tiktok_cdp(url, output_name=None):
                             return
                         if 'video' not in ct and '.mp4' not in u:
                             return
-                        body = resp.body()
-                        if not body:
-                            return
                         hit['url'] = u
-                        hit['bytes'] = body
+                        hit['at'] = time.monotonic()
                     except Exception:
                         return
                 target_page.on('response', on_response)
@@ -958,41 +2926,41 @@ def download_tiktok_cdp(url, output_name=None):
                     target_page.keyboard.press('Space')
                 except Exception:
                     pass
-                target_page.wait_for_timeout(12000)
-
-                # 未抓到时再刷新一次重试
-                if not hit['bytes']:
-                    target_page.reload(wait_until='domcontentloaded', timeout=60000)
-                    target_page.wait_for_timeout(2000)
-                    try:
-                        target_page.mouse.click(640, 360)
-                        target_page.keyboard.press('Space')
-                    except Exception:
-                        pass
-                    target_page.wait_for_timeout(10000)
-
-                raw_bytes = hit['bytes']
-                if not raw_bytes:
-                    raise RuntimeError('捕获到空响应体')
+                # 12s / 2s / 10s 都只是上限：抓到视频响应体立即结束等待
+                with span('capture') as capture_span:
+                    play_started = time.monotonic()
+                    wait_until(target_page, lambda: hit['url'] is not None, 12)
+
+                    # 未抓到时再刷新一次重试
+                    if not hit['url']:
+                        capture_span['reloaded'] = True
+                        target_page.reload(wait_until='domcontentloaded', timeout=60000)
+                        play_started = time.monotonic()
+                        if not wait_until(target_page, lambda: hit['url'] is not None, 2):
+                            try:
+                                target_page.mouse.click(640, 360)
+                                target_page.keyboard.press('Space')
+                            except Exception:
+                                pass
+                            wait_until(target_page, lambda: hit['url'] is not None, 10)
+                    capture_span['hit'] = bool(hit['url'])
+                record_capture_timing(
+                    'tiktok', max(0.0, hit['at'] - play_started) if hit['url'] else None
+                )
 
-                with open(output_path, 'wb') as f:
-                    f.write(raw_bytes)
+                if not hit['url']:
+                    raise RuntimeError('未捕获到视频响应')
+                size = save_captured_tiktok_media(ctx, target_page, hit, output_path)
 
                 # 强校验：必须存在视频轨；若能读到页面时长，则时长要接近
-                probe = subprocess.run(
-                    ['ffprobe', '-v', 'error',
-                     '-show_entries', 'stream=codec_type,duration',
-                     '-of', 'default=nw=1:nk=1', output_path],
-                    text=True, capture_output=True
-                )
-                if probe.returncode != 0:
+                media = probe_media(output_path)
+                if media is None:
                     raise RuntimeError('ffprobe 校验失败')
-                lines = [x.strip() for x in (probe.stdout or '').splitlines() if x.strip()]
-                has_video = any(x == 'video' for x in lines)
+                has_video = media['has_video']
                 if not has_video:
                     raise RuntimeError('下载结果无视频轨，已中止')
 
-                actual_duration = get_media_duration_seconds(output_path)
+                actual_duration = media['duration']
                 duration_ok = None
                 if expected_duration:
                     try:
@@ -1021,7 +2989,7 @@ def download_tiktok_cdp(url, output_name=None):
                 if expected_duration:
                     print(f"[TikTok/CDP] 页面时长: {expected_duration}s")
                 print(f"[TikTok/CDP] 捕获成功: {hit['url']}")
-                print(f"下载完成: {output_path} ({len(raw_bytes) / 1048576:.1f}MB)")
+                print(f"下载完成: {output_path} ({size / 1048576:.1f}MB)")
                 write_tiktok_meta(
                     output_path=output_path,
                     source='cdp',
@@ -1043,6 +3011,10 @@ def download_tiktok_cdp(url, output_name=None):
 
     raise RuntimeError(f"CDP 下载失败: {last_err}")
 
+# tikwm 解析接口地址；基准测试时指向本地 fixture
+TIKWM_API = os.environ.get('VIDEO_DOWNLOAD_TIKWM_API', 'https://www.tikwm.com/api/')
+
+@traced_engine('tiktok_tikwm')
 def download_tiktok_tikwm(url, output_name=None):
     """通过 tikwm API 兜底解析 TikTok 视频（用于 app-only / shop 场景）。"""
     import math
@@ -1059,15 +3031,16 @@ def download_tiktok_tikwm(url, output_name=None):
         except Exception as e:
             raise RuntimeError(f'解析 TikTok 短链失败: {e}')
 
-    api_url = 'https://www.tikwm.com/api/?url=' + urllib.parse.quote(url, safe='')
-    req = urllib.request.Request(api_url, headers={
+    api_url = TIKWM_API + '?url=' + urllib.parse.quote(url, safe='')
+    headers = {
         'User-Agent': UA,
         'Referer': 'https://www.tikwm.com/',
         'Accept': 'application/json,text/plain,*/*',
-    })
+    }
     try:
-        raw = urllib.request.urlopen(req, timeout=30).read().decode('utf-8', 'ignore')
-        data = json.loads(raw)
+        with span('resolve', resolver='tikwm'):
+            resp = http_request('GET', api_url, headers=headers, timeout=30)
+        data = json.loads(resp.body.decode('utf-8', 'ignore'))
     except Exception as e:
         raise RuntimeError(f'tikwm API 请求失败: {e}')
 
@@ -1090,33 +3063,17 @@ def download_tiktok_tikwm(url, output_name=None):
         output_name += '.mp4'
     output_path = os.path.join(output_dir(), output_name)
 
-    req2 = urllib.request.Request(play_url, headers={
-        'User-Agent': UA,
-        'Referer': 'https://www.tikwm.com/',
-    })
-    with urllib.request.urlopen(req2, timeout=90) as resp:
-        with open(output_path, 'wb') as f:
-            while True:
-                chunk = resp.read(1024 * 1024)
-                if not chunk:
-                    break
-                f.write(chunk)
+    download_file(play_url, output_path, 'https://www.tikwm.com/')
 
     # 兜底校验：必须有视频轨；若可读到期望时长，则做时长近似校验
-    probe = subprocess.run(
-        ['ffprobe', '-v', 'error',
-         '-show_entries', 'stream=codec_type',
-         '-of', 'default=nw=1:nk=1', output_path],
-        text=True, capture_output=True
-    )
-    if probe.returncode != 0:
+    media = probe_media(output_path)
+    if media is None:
         raise RuntimeError('ffprobe 校验失败')
-    stream_lines = [x.strip() for x in (probe.stdout or '').splitlines() if x.strip()]
-    if 'video' not in stream_lines:
+    if not media['has_video']:
         raise RuntimeError('下载结果无视频轨，已中止')
 
     expected_duration = node.get('duration')
-    actual_duration = get_media_duration_seconds(output_path)
+    actual_duration = media['duration']
     duration_ok = None
     if expected_duration:
         try:
@@ -1147,33 +3104,48 @@ def download_tiktok_tikwm(url, output_name=None):
         validation={
             'id_ok': (got_vid == expected_vid) if (got_vid and expected_vid) else None,
             'duration_ok': duration_ok,
-            'video_track_ok': ('video' in stream_lines),
+            'video_track_ok': media['has_video'],
         },
         note='tikwm fallback parse/download',
     )
     return output_path
 
 def download_tiktok(url, output_name=None):
+    if 'vm.tiktok.com' in url or 'vt.tiktok.com' in url:
+        try:
+            url = resolve_redirect(url)
+            print(f"  跳转到: {url}")
+        except Exception as e:
+            raise RuntimeError(f'解析 TikTok 短链失败: {e}')
+    m = re.search(r'/video/(\d+)', url)
+    video_id = m.group(1) if m else None
+    cached = download_cache_lookup('tiktok', video_id, output_name)
+    if cached:
+        return cached
+
+    result = _download_tiktok_uncached(url, output_name)
+    download_cache_store('tiktok', video_id, result)
+    return result
+
+def _download_tiktok_uncached(url, output_name=None):
     disable_tikwm = os.environ.get('VIDEO_DOWNLOAD_TIKTOK_DISABLE_TIKWM', '').strip() == '1'
-    attempts = []
-    # 第一轮：主路径
-    attempts.append(('cdp', download_tiktok_cdp))
-    if not disable_tikwm:
-        attempts.append(('tikwm', download_tiktok_tikwm))
-    # 第二轮重试：换路径重试一次
+    engines = {'cdp': download_tiktok_cdp}
     if not disable_tikwm:
-        attempts.append(('tikwm-retry', download_tiktok_tikwm))
-    attempts.append(('cdp-retry', download_tiktok_cdp))
+        engines['tikwm'] = download_tiktok_tikwm
+    # 第一轮按记分板顺序（默认 cdp → tikwm），第二轮倒过来各重试一次；冷却中的引擎两轮都跳过
+    order, skipped = order_engines('tiktok', list(engines))
+    if skipped:
+        print(f"[TikTok] 跳过冷却中的引擎: {', '.join(skipped)}")
+    attempts = [(name, name, functools.partial(engines[name], url, output_name)) for name in order]
+    attempts += [
+        (f'{name}-retry', name, functools.partial(engines[name], url, output_name))
+        for name in reversed(order)
+    ]
 
-    errors = []
-    for name, fn in attempts:
-        try:
-            if 'tikwm' in name:
-                print(f"[TikTok] 尝试 {name} ...")
-            return fn(url, output_name)
-        except Exception as e:
-            errors.append(f'{name}={e}')
-            print(f"[TikTok] {name} 失败: {e}")
+    try:
+        return run_engine_attempts('tiktok', attempts, 'TikTok')
+    except RuntimeError as exc:
+        errors = [str(exc)]
 
     allow_fallback = os.environ.get('VIDEO_DOWNLOAD_TIKTOK_ALLOW_YTDLP_FALLBACK', '').strip() == '1'
     if allow_fallback:
@@ -1186,8 +3158,9 @@ def download_tiktok(url, output_name=None):
 
 # ── yt-dlp 通用下载（YouTube / Twitter / Instagram 等） ──
 
+@functools.lru_cache(maxsize=1)
 def get_ytdlp_command():
-    """返回可用的 yt-dlp 命令前缀，例如 ['yt-dlp'] 或 ['python3', '-m', 'yt_dlp']"""
+    """返回可用的 yt-dlp 命令前缀，例如 ['yt-dlp'] 或 ['python3', '-m', 'yt_dlp']（进程内只探测一次）"""
     if shutil.which('yt-dlp'):
         return ['yt-dlp']
     try:
@@ -1201,78 +3174,169 @@ def extract_url(text):
     m = re.search(r'https?://[^\s"\'<>\]]+', text)
     return m.group(0).rstrip('.,;!?)') if m else text.strip()
 
-def create_ytdlp_cookie_file(platform):
-    """把本 Skill 保存的单平台 Playwright Cookie 临时转成 Netscape 格式。"""
+def ytdlp_cookie_file(platform):
+    """返回本 Skill 保存的单平台 Cookie 的 Netscape 导出（复用，源文件变化才重建）。"""
     if not platform:
         return None
-
-    source_path = get_cookie_path(platform)
-    if not os.path.exists(source_path):
+    if not os.path.exists(get_cookie_path(platform)):
+        return None
+    path = cookie_store.netscape_path(platform)
+    error = cookie_store.error(platform)
+    if error is not None:
+        print(f"  警告: 无法读取 {platform} Cookie: {error}")
+    return path
+
+@functools.lru_cache(maxsize=1)
+def _load_yt_dlp():
+    """能 import yt_dlp 时返回模块（只导入一次），否则 None；VIDEO_DOWNLOAD_YTDLP_INPROCESS=0 强制走子进程。"""
+    if os.environ.get('VIDEO_DOWNLOAD_YTDLP_INPROCESS', '1').strip() == '0':
         return None
-
     try:
-        with open(source_path, encoding='utf-8') as handle:
-            cookies = json.load(handle)
-    except (OSError, ValueError) as exc:
-        print(f"  警告: 无法读取 {platform} Cookie: {exc}")
+        import yt_dlp
+    except ImportError:
         return None
+    return yt_dlp
 
-    now = datetime.now().timestamp()
-    valid_cookies = []
-    for cookie in cookies:
-        expires = cookie.get('expires', 0) or 0
-        if expires > 0 and expires < now:
-            continue
-        if not all(cookie.get(key) for key in ('domain', 'name')):
-            continue
-        valid_cookies.append(cookie)
+YTDLP_FORMAT = 'bv*+ba/b'
+YTDLP_IDLE_MAX = 8  # 空闲实例上限；按输出模板分组后，逐条指定文件名的批次不至于无限堆积
 
-    if not valid_cookies:
-        return None
+class YtdlpEngine:
+    """进程内复用的 yt_dlp.YoutubeDL 实例池。
 
-    handle = tempfile.NamedTemporaryFile(
-        mode='w',
-        encoding='utf-8',
-        prefix=f'video_download_{platform}_',
-        suffix='.cookies.txt',
-        delete=False,
-    )
-    try:
-        os.chmod(handle.name, 0o600)
-        handle.write('# Netscape HTTP Cookie File\n')
-        for cookie in valid_cookies:
-            domain = str(cookie['domain']).replace('\t', '').replace('\n', '')
-            include_subdomains = 'TRUE' if domain.startswith('.') else 'FALSE'
-            path = str(cookie.get('path') or '/').replace('\t', '').replace('\n', '')
-            secure = 'TRUE' if cookie.get('secure') else 'FALSE'
-            raw_expires = int(cookie.get('expires', 0) or 0)
-            expires = raw_expires if raw_expires > 0 else 0
-            name = str(cookie['name']).replace('\t', '').replace('\n', '')
-            value = str(cookie.get('value', '')).replace('\t', '').replace('\n', '')
-            handle.write(
-                f'{domain}\t{include_subdomains}\t{path}\t{secure}\t{expires}\t{name}\t{value}\n'
-            )
-    except Exception:
-        handle.close()
-        if os.path.exists(handle.name):
-            os.remove(handle.name)
-        raise
-    else:
-        handle.close()
-    return handle.name
+    实例按 (平台, 该平台 Cookie 文件 mtime, 输出模板) 分组复用：extractor 初始化和 Cookie 解析只做一次，
+    Cookie 文件变了才建新实例。输出模板在建实例时传入、之后不再改 params。
+    YoutubeDL 不是线程安全的，每个实例同一时间只借给一个线程。
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self._idle = []  # [(key, entry)]，越靠后越新
+        self._lock = threading.Lock()
+
+    def _cookie_key(self, platform):
+        if not platform:
+            return (None, None)
+        return (platform, cookie_store.stamp(platform))
+
+    def _new_instance(self, platform, outtmpl):
+        state = {}
+        params = {
+            'format': YTDLP_FORMAT,
+            'outtmpl': {'default': outtmpl},
+            'merge_output_format': 'mp4',
+            'noplaylist': True,
+            'no_warnings': True,
+            'quiet': True,
+            'noprogress': True,
+            'progress_hooks': [lambda d: self._on_progress(state, d)],
+        }
+        cookie_path = ytdlp_cookie_file(platform)
+        if cookie_path:
+            params['cookiefile'] = cookie_path
+        ydl = self.module.YoutubeDL(params)
+        if cookie_path:
+            try:
+                ydl.cookiejar  # 建实例时一次性载入 Cookie
+            finally:
+                # 置空 cookiefile，避免 yt-dlp 退出时把 Cookie 写回导出文件
+                ydl.params['cookiefile'] = None
+            print(f"  已注入 {platform} 的已保存 Cookie")
+        return ydl, state
+
+    def _on_progress(self, state, d):
+        if d.get('status') == 'finished':
+            state['bytes'] = state.get('bytes', 0) + (d.get('total_bytes') or d.get('downloaded_bytes') or 0)
+        if d.get('status') != 'downloading':
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if not total:
+            return
+        percent = int(d.get('downloaded_bytes', 0) * 100 / total)
+        if percent >= state.get('next_report', 0):
+            state['next_report'] = percent - percent % 10 + 10
+            speed = d.get('speed') or 0
+            print(f"  [yt-dlp] {percent}% ({speed / 1048576:.1f}MB/s)")
+            emit_event('progress', engine='ytdlp', downloaded=d.get('downloaded_bytes', 0),
+                       total=total, speed=d.get('speed'))
+
+    def download(self, url, outtmpl, platform=None):
+        """下载并返回最终文件路径；失败抛 RuntimeError。"""
+        key = (self._cookie_key(platform), outtmpl)
+        entry = None
+        with self._lock:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == key:
+                    entry = self._idle.pop(i)[1]
+                    break
+        if entry is None:
+            entry = self._new_instance(platform, outtmpl)
+        ydl, state = entry
+        state.clear()
+        healthy = False
+        try:
+            with span('transfer', tool='yt_dlp') as sp:
+                info = ydl.extract_info(url, download=True)
+                if state.get('bytes'):
+                    sp['bytes'] = state['bytes']
+            healthy = True
+        except self.module.utils.DownloadError as exc:
+            healthy = True  # 单个链接失败不影响实例复用
+            raise RuntimeError(f"yt-dlp 下载失败: {exc}") from exc
+        except Exception as exc:
+            raise RuntimeError(f"yt-dlp 下载失败: {type(exc).__name__}: {exc}") from exc
+        finally:
+            if healthy:
+                with self._lock:
+                    self._idle.append((key, entry))
+                    del self._idle[:-YTDLP_IDLE_MAX]
+        downloads = (info or {}).get('requested_downloads') or []
+        paths = [d.get('filepath') for d in downloads if d.get('filepath')]
+        return paths[-1] if paths else (info or {}).get('filepath')
+
+_ytdlp_engine = None
+_ytdlp_engine_lock = threading.Lock()
+
+def get_ytdlp_engine():
+    """进程内 yt-dlp 引擎（单例）；yt_dlp 无法导入时返回 None，调用方退回子进程。"""
+    global _ytdlp_engine
+    module = _load_yt_dlp()
+    if module is None:
+        return None
+    with _ytdlp_engine_lock:
+        if _ytdlp_engine is None:
+            _ytdlp_engine = YtdlpEngine(module)
+    return _ytdlp_engine
 
+@traced_engine('ytdlp')
 def download_ytdlp(url, output_name=None, platform=None):
-    """使用 yt-dlp 下载；可仅注入本 Skill 保存的对应平台 Cookie。"""
+    """使用 yt-dlp 下载；可仅注入本 Skill 保存的对应平台 Cookie。
+
+    yt_dlp 可导入时在进程内复用 YoutubeDL 实例，否则每次起一个 yt-dlp 子进程。
+    """
+    url = extract_url(url)
+    out_dir = output_dir()
+    if output_name and not output_name.endswith('.mp4'):
+        output_name += '.mp4'
+    outtmpl = os.path.join(out_dir, output_name or '%(title).80s.%(ext)s')
+
+    engine = get_ytdlp_engine()
+    if engine is not None:
+        print(f"[1/2] 使用 yt-dlp（进程内）下载: {url}")
+        print(f"[2/2] 开始下载...")
+        final_path = engine.download(url, outtmpl, platform=platform)
+        print(f"下载完成，文件保存在 {out_dir}/")
+        if final_path and os.path.isfile(final_path):
+            return final_path
+        return os.path.join(out_dir, output_name) if output_name else out_dir
+
     ytdlp_cmd = get_ytdlp_command()
     if not ytdlp_cmd:
         raise RuntimeError("未安装 yt-dlp；请执行 brew install yt-dlp 或 pip3 install yt-dlp")
 
-    url = extract_url(url)
-    out_dir = output_dir()
     print(f"[1/2] 使用 yt-dlp 下载: {url}")
 
     cmd = ytdlp_cmd + [
-        '-f', 'bv*+ba/b',
+        '-f', YTDLP_FORMAT,
         '--merge-output-format', 'mp4',
         '--no-playlist',
         '--no-warnings',
@@ -1280,44 +3344,1047 @@ def download_ytdlp(url, output_name=None, platform=None):
         '--newline',
     ]
 
-    cookie_path = create_ytdlp_cookie_file(platform)
+    cookie_path = ytdlp_cookie_file(platform)
+    private_cookie = None
     if cookie_path:
-        cmd += ['--cookies', cookie_path]
+        # yt-dlp CLI 退出时会把 Cookie 回写到 --cookies 文件；每个子进程给一份私有副本，
+        # 并发的几条下载不会互相覆盖，也不会改动共享导出
+        fd, private_cookie = tempfile.mkstemp(prefix=f'{platform}.', suffix='.cookies.txt',
+                                              dir=os.path.dirname(cookie_path))
+        with os.fdopen(fd, 'wb') as dst, open(cookie_path, 'rb') as src:
+            shutil.copyfileobj(src, dst)
+        cmd += ['--cookies', private_cookie]
         print(f"  已注入 {platform} 的已保存 Cookie")
 
-    if output_name:
-        if not output_name.endswith('.mp4'):
-            output_name += '.mp4'
-        cmd += ['-o', os.path.join(out_dir, output_name)]
-    else:
-        cmd += ['-o', os.path.join(out_dir, '%(title).80s.%(ext)s')]
+    cmd += ['-o', outtmpl]
+
+    # 让 yt-dlp 把最终文件路径写到临时文件，便于返回真实路径（下载缓存需要）
+    fd, filepath_log = tempfile.mkstemp(prefix='video_download_ytdlp_', suffix='.txt')
+    os.close(fd)
+    cmd += ['--print-to-file', 'after_move:filepath', filepath_log]
 
     cmd.append(url)
 
     print(f"[2/2] 开始下载...")
-    try:
-        result = subprocess.run(cmd, text=True)
-    finally:
-        if cookie_path and os.path.exists(cookie_path):
-            os.remove(cookie_path)
+    with span('transfer', tool='yt-dlp-cli') as sp:
+        try:
+            result = subprocess.run(cmd, text=True)
+        finally:
+            try:
+                with open(filepath_log, encoding='utf-8') as handle:
+                    final_paths = [line.strip() for line in handle if line.strip()]
+                os.remove(filepath_log)
+            except OSError:
+                final_paths = []
+            if private_cookie:
+                try:
+                    os.remove(private_cookie)
+                except OSError:
+                    pass
+        sp['exit_code'] = result.returncode
+        if final_paths and os.path.isfile(final_paths[-1]):
+            sp['bytes'] = os.path.getsize(final_paths[-1])
 
     if result.returncode != 0:
         raise RuntimeError(f"yt-dlp 下载失败 (exit {result.returncode})")
 
     print(f"下载完成，文件保存在 {out_dir}/")
+    if final_paths and os.path.isfile(final_paths[-1]):
+        return final_paths[-1]
     if output_name:
         return os.path.join(out_dir, output_name)
     return out_dir
 
+# ── 下载后处理（一次 ffmpeg 解码产出多个派生文件） ────────
+
+# faststart：moov 前置的无损重封装（.mp4/.mov 原地替换）；proxy：短边不超过 DERIVE_PROXY_MAX
+# 的 H.264 代理；poster：封面帧；sheet：3x3 联系表。纯软件编码，不依赖硬件加速。
+DERIVE_KINDS = ('faststart', 'proxy', 'poster', 'sheet')
+DERIVE_PROXY_MAX = int(os.environ.get('VIDEO_DOWNLOAD_PROXY_MAX', '720') or 720)
+DERIVE_PROXY_PRESET = os.environ.get('VIDEO_DOWNLOAD_PROXY_PRESET', 'veryfast')
+DERIVE_PROXY_CRF = os.environ.get('VIDEO_DOWNLOAD_PROXY_CRF', '28')
+DERIVE_SHEET_GRID = 3
+DERIVE_SHEET_TILE_WIDTH = 320
+DERIVE_POSTER_AT = 0.1  # 取总时长 10% 处的画面，避开片头黑场
+FASTSTART_IN_PLACE_EXTS = ('.mp4', '.m4v', '.mov')
+
+_derive_kinds = ()
+_derive_local = threading.local()
+
+def parse_derive_spec(spec):
+    """'proxy,poster' / 'all' / 列表 → 按 DERIVE_KINDS 顺序的元组；有未知项抛 RuntimeError。"""
+    if not spec:
+        return ()
+    names = spec.split(',') if isinstance(spec, str) else list(spec)
+    names = {str(name).strip() for name in names} - {''}
+    if 'all' in names:
+        return DERIVE_KINDS
+    unknown = names - set(DERIVE_KINDS)
+    if unknown:
+        raise RuntimeError(
+            f"无效的 --derive '{','.join(sorted(unknown))}'；可选: {', '.join(DERIVE_KINDS)}, all"
+        )
+    return tuple(kind for kind in DERIVE_KINDS if kind in names)
+
+def set_derive_kinds(spec):
+    """进程级默认的后处理项（--derive）；未设置时读 VIDEO_DOWNLOAD_DERIVE。"""
+    global _derive_kinds
+    _derive_kinds = parse_derive_spec(spec)
+
+def derive_kinds():
+    override = getattr(_derive_local, 'kinds', None)
+    if override is not None:
+        return override
+    return _derive_kinds or parse_derive_spec(os.environ.get('VIDEO_DOWNLOAD_DERIVE', ''))
+
+@contextlib.contextmanager
+def derive_override(kinds):
+    """在当前线程内临时指定后处理项（常驻服务按任务指定）；kinds 为 None 时不改变。"""
+    saved = getattr(_derive_local, 'kinds', None)
+    if kinds is not None:
+        _derive_local.kinds = parse_derive_spec(kinds)
+    try:
+        yield
+    finally:
+        _derive_local.kinds = saved
+
+def derivative_paths(output_path, kinds):
+    """各派生文件的目标路径。"""
+    stem, ext = os.path.splitext(output_path)
+    paths = {
+        'faststart': output_path if ext.lower() in FASTSTART_IN_PLACE_EXTS else f'{stem}.faststart.mp4',
+        'proxy': f'{stem}.proxy.mp4',
+        'poster': f'{stem}.poster.jpg',
+        'sheet': f'{stem}.sheet.jpg',
+    }
+    return {kind: paths[kind] for kind in kinds}
+
+def derive_command(src, targets, info):
+    """一条 ffmpeg 命令：解码一次，split 给需要画面的各路输出，faststart 直接拷贝流。
+
+    targets 是 kind → 写入路径；info 是 probe_media 结果（取时长和有无视频轨）。
+    """
+    duration = (info or {}).get('duration') or 0
+    decoded = [kind for kind in ('proxy', 'poster', 'sheet') if kind in targets]
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', src]
+    inputs = {kind: '[0:v:0]' for kind in decoded}
+    graph = []
+    if len(decoded) > 1:
+        inputs = {kind: f'[{kind}_in]' for kind in decoded}
+        graph.append(f'[0:v:0]split={len(decoded)}' + ''.join(inputs.values()))
+    cap = DERIVE_PROXY_MAX
+    chains = {
+        'proxy': (f"scale=w='if(lte(iw,ih),2*trunc(min(iw,{cap})/2),-2)'"
+                  f":h='if(lte(iw,ih),-2,2*trunc(min(ih,{cap})/2))'"),
+        'poster': f"select='gte(t,{duration * DERIVE_POSTER_AT:.3f})'",
+        'sheet': (f'fps={DERIVE_SHEET_GRID ** 2 / duration if duration else 1:.6f},'
+                  f'scale={DERIVE_SHEET_TILE_WIDTH}:-2,tile={DERIVE_SHEET_GRID}x{DERIVE_SHEET_GRID}'),
+    }
+    for kind in decoded:
+        graph.append(f'{inputs[kind]}{chains[kind]}[{kind}]')
+    if graph:
+        cmd += ['-filter_complex', ';'.join(graph)]
+
+    for kind, path in targets.items():
+        if kind == 'faststart':
+            cmd += ['-map', '0:v?', '-map', '0:a?', '-c', 'copy', '-movflags', '+faststart', path]
+        elif kind == 'proxy':
+            cmd += ['-map', '[proxy]', '-map', '0:a:0?', '-c:v', 'libx264',
+                    '-preset', DERIVE_PROXY_PRESET, '-crf', DERIVE_PROXY_CRF, '-pix_fmt', 'yuv420p',
+                    '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart', path]
+        else:
+            cmd += ['-map', f'[{kind}]', '-frames:v', '1', '-q:v', '2' if kind == 'poster' else '3', path]
+    return cmd
+
+def update_media_meta(output_path, **fields):
+    """把字段合并进 <输出>.meta.json；没有时新建（带 output_path / generated_at）。"""
+    meta_path = output_path + '.meta.json'
+    try:
+        with open(meta_path, encoding='utf-8') as handle:
+            payload = json.load(handle)
+    except (OSError, ValueError):
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    payload.setdefault('output_path', output_path)
+    payload.setdefault('generated_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    payload.update(fields)
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(payload, handle, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+    return payload
+
+def derive_media(output_path, kinds):
+    """对下载结果跑一次 ffmpeg，产出所选派生文件并记进 .meta.json 的 derivatives。
+
+    返回 kind → 路径；没有视频轨时只做 faststart。失败抛 RuntimeError，已写出的半成品会删掉。
+    """
+    info = probe_media(output_path)
+    if info is None:
+        raise RuntimeError(f'无法读取媒体信息: {output_path}')
+    if not info['has_video']:
+        kinds = [kind for kind in kinds if kind == 'faststart']
+    final = derivative_paths(output_path, kinds)
+    if not final:
+        return {}
+    # 原地 faststart 先写到临时文件，整条命令成功后再替换
+    targets = dict(final)
+    if final.get('faststart') == output_path:
+        stem, ext = os.path.splitext(output_path)
+        targets['faststart'] = f'{stem}.faststart-{os.getpid()}.tmp{ext}'
+
+    print(f"[后处理] {', '.join(final)}: {os.path.basename(output_path)}")
+    try:
+        with span('derive', kinds=list(final), bytes=os.path.getsize(output_path)):
+            result = subprocess.run(derive_command(output_path, targets, info),
+                                    capture_output=True, text=True)
+    except FileNotFoundError as exc:
+        raise RuntimeError('未安装 ffmpeg，无法生成派生文件') from exc
+    if result.returncode != 0:
+        for kind, path in targets.items():
+            if path != output_path:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+        raise RuntimeError(f"ffmpeg 后处理失败: {(result.stderr or '').strip()[:300]}")
+    if targets.get('faststart') != final.get('faststart'):
+        os.replace(targets['faststart'], final['faststart'])
+
+    update_media_meta(output_path, derivatives=final,
+                      derived_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    for kind, path in final.items():
+        print(f'       {kind}: {path}')
+    return final
+
+def apply_derive_stage(output_path):
+    """按当前的 --derive 设置做后处理；失败只告警，不影响下载结果。"""
+    kinds = derive_kinds()
+    if not kinds or not output_path or not os.path.isfile(output_path):
+        return None
+    try:
+        return derive_media(output_path, kinds)
+    except (RuntimeError, OSError) as exc:
+        print(f'  警告: 后处理失败: {exc}')
+        with contextlib.suppress(OSError):
+            update_media_meta(output_path, derive_error=str(exc))
+        return None
+
+# ── 分发 ──────────────────────────────────────────────────
+
+def download_share_text(share_text, output_name=None):
+    """识别平台并调用对应引擎下载，按 --derive 做后处理，返回输出路径。"""
+    platform, url = detect_platform(share_text)
+    with event_context(platform=platform or 'generic'), span('download'):
+        output_path = _dispatch_download(platform, url, share_text, output_name)
+    apply_derive_stage(output_path)
+    return output_path
+
+def _dispatch_download(platform, url, share_text, output_name):
+
+    if platform == 'wechat_channels':
+        return download_wechat_channels(url, output_name)
+    if platform == 'douyin':
+        return download_douyin(url, output_name)
+    if platform == 'xiaohongshu':
+        return download_xiaohongshu(url, output_name)
+    if platform == 'bilibili':
+        return download_bilibili(url, output_name)
+    if platform == 'tiktok':
+        return download_tiktok(url, output_name)
+    return download_ytdlp(share_text, output_name)
+
+# ── 批处理计划（分类 → 短链解析 → 去重 → 按引擎分组） ──────
+
+PLAN_RESOLVE_WORKERS = 8
+
+# 各平台从（已展开的）链接里取规范视频 ID 的正则
+CANONICAL_ID_PATTERNS = {
+    'douyin': r'/video/(\d+)',
+    'xiaohongshu': r'/(?:discovery/item|explore)/([a-f0-9]+)',
+    'bilibili': r'/video/(BV[A-Za-z0-9]+)',
+    'tiktok': r'/video/(\d+)',
+    'wechat_channels': r'(?:/sph/|[?&]id=)([A-Za-z0-9_-]+)',
+}
+SHORT_LINK_HOSTS = ('v.douyin.com', 'xhslink.com', 'b23.tv', 'vm.tiktok.com', 'vt.tiktok.com')
+
+def canonical_video_id(platform, url):
+    """平台内唯一的视频 ID；yt-dlp 站点用去掉 #片段 的 URL 代替。取不到返回 None。"""
+    if platform is None:
+        return urllib.parse.urldefrag(extract_url(url))[0] or None
+    m = re.search(CANONICAL_ID_PATTERNS[platform], url)
+    return m.group(1) if m else None
+
+def _plan_entry(item):
+    """单条输入的计划项：识别平台、必要时展开短链、取规范 ID。"""
+    platform, url = detect_platform(item['text'])
+    entry = {
+        'seq': item['seq'],
+        'text': item['text'],
+        'output': item.get('output'),
+        'id': item.get('id'),
+        'platform': platform,
+        'engine': batch_engine_key(platform),
+        'url': url or extract_url(item['text']),
+        'video_id': None,
+    }
+    if url and any(host in url for host in SHORT_LINK_HOSTS):
+        try:
+            entry['url'] = resolve_redirect(url)
+        except Exception as exc:
+            entry['resolve_error'] = f'{type(exc).__name__}: {exc}'
+    entry['video_id'] = canonical_video_id(platform, entry['url'])
+    return entry
+
+def build_batch_plan(items, limits=None):
+    """批处理执行计划：并发展开短链，按 (平台, 视频 ID) 去重，按引擎分组。
+
+    返回 dict：
+      entries  — 需要真正执行的条目（每条带 duplicates：与它重复的输入 seq 列表）
+      groups   — 引擎 → {count, concurrency, cached, seqs}
+      以及 total_inputs / unique / duplicates / cached 计数，可直接 json.dumps 打印估算成本。
+    """
+    limits = limits or dict(BATCH_DEFAULT_LIMITS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PLAN_RESOLVE_WORKERS) as pool:
+        planned = list(pool.map(_plan_entry, items))
+
+    entries = []
+    first_by_key = {}
+    for entry in planned:
+        key = (entry['platform'], entry['video_id'])
+        if entry['video_id'] and key in first_by_key:
+            first_by_key[key]['duplicates'].append(entry['seq'])
+            continue
+        entry['duplicates'] = []
+        entry['cached'] = download_cache_has(entry['platform'], entry['video_id'])
+        first_by_key[key] = entry
+        entries.append(entry)
+    entries.sort(key=lambda e: list(BATCH_DEFAULT_LIMITS).index(e['engine']))
+
+    groups = collections.OrderedDict()
+    for entry in entries:
+        group = groups.setdefault(entry['engine'], {
+            'count': 0, 'concurrency': limits.get(entry['engine'], 1), 'cached': 0, 'seqs': [],
+        })
+        group['count'] += 1
+        group['cached'] += int(entry['cached'])
+        group['seqs'].append(entry['seq'])
+    return {
+        'total_inputs': len(items),
+        'unique': len(entries),
+        'duplicates': len(items) - len(entries),
+        'cached': sum(int(e['cached']) for e in entries),
+        'groups': groups,
+        'entries': entries,
+    }
+
+def place_duplicate_output(src, output_name=None, directory=None):
+    """重复条目共用一次下载：把 src 放到该条目自己要求的位置（目录 / 文件名），返回路径。
+
+    目标就是 src 时原样返回；否则链接或复制一份（规则同下载缓存），.meta.json 一并复制并改 output_path。
+    src 不是文件（例如 yt-dlp 只返回了目录）时原样返回。
+    """
+    if not isinstance(src, str) or not os.path.isfile(src):
+        return src
+    name = output_name or os.path.basename(src)
+    if output_name and not os.path.splitext(output_name)[1]:
+        name += os.path.splitext(src)[1]
+    dst = os.path.join(directory or os.path.dirname(src), name)
+    if os.path.abspath(dst) == os.path.abspath(src):
+        return src
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    _link_or_copy(src, dst)
+    if os.path.exists(src + '.meta.json'):
+        with open(src + '.meta.json', encoding='utf-8') as handle:
+            payload = json.load(handle)
+        payload['output_path'] = dst
+        with open(dst + '.meta.json', 'w', encoding='utf-8') as handle:
+            json.dump(payload, handle, ensure_ascii=False, indent=2)
+    return dst
+
+# ── 批处理（有界并发 worker 池） ──────────────────────────
+
+# 各引擎的默认并发上限。TikTok 走用户真实浏览器的同一个 tab，只能串行。
+BATCH_DEFAULT_LIMITS = {
+    'wechat_channels': 2,
+    'douyin': 2,
+    'xiaohongshu': 2,
+    'bilibili': 2,
+    'tiktok': 1,
+    'ytdlp': 3,
+}
+BATCH_DEFAULT_WORKERS = 6
+
+def batch_engine_key(platform):
+    """平台 → 批处理并发分组；未识别的链接都归 yt-dlp。"""
+    return platform if platform in BATCH_DEFAULT_LIMITS else 'ytdlp'
+
+def read_batch_items(lines):
+    """解析批处理输入：每行一条分享文本，或 JSONL（text/url + 可选 output/id）。
+
+    空行和 # 开头的行跳过。返回 [{'seq', 'text', 'output', 'id'}]，seq 从 1 开始。
+    """
+    items = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        output = None
+        item_id = None
+        if line.startswith('{'):
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                raise RuntimeError(f'批处理输入第 {line_no} 行不是合法 JSON: {exc}') from exc
+            text = row.get('text') or row.get('url') or row.get('share_text') or ''
+            output = row.get('output') or None
+            item_id = row.get('id')
+        else:
+            text = line
+        if not str(text).strip():
+            continue
+        items.append({
+            'seq': len(items) + 1,
+            'text': str(text).strip(),
+            'output': output,
+            'id': item_id,
+        })
+    return items
+
+def parse_batch_limits(specs):
+    """把 ['douyin=3', 'tiktok=1'] 合并进默认并发上限。"""
+    limits = dict(BATCH_DEFAULT_LIMITS)
+    for spec in specs or []:
+        key, sep, value = spec.partition('=')
+        key = key.strip()
+        if not sep or key not in limits:
+            raise RuntimeError(
+                f"无效的 --limit '{spec}'；格式为 <引擎>=<并发数>，引擎: {', '.join(limits)}"
+            )
+        try:
+            limits[key] = max(1, int(value))
+        except ValueError as exc:
+            raise RuntimeError(f"无效的 --limit '{spec}'：并发数必须是整数") from exc
+    return limits
+
+def _run_batch_item(item):
+    """在 worker 线程里下载一条，异常（含引擎里的 sys.exit）都转成结果字段。"""
+    started = time.monotonic()
+    platform, _ = detect_platform(item['text'])
+    result = {
+        'seq': item['seq'],
+        'input': item['text'],
+        'platform': platform,
+        'engine': batch_engine_key(platform),
+        'ok': False,
+        'output_path': None,
+        'error': None,
+    }
+    if item.get('id') is not None:
+        result['id'] = item['id']
+    try:
+        with event_context(seq=item['seq']):
+            result['output_path'] = download_share_text(item['text'], item.get('output'))
+        result['ok'] = True
+    except SystemExit as exc:
+        result['error'] = f'引擎退出 (exit {exc.code})'
+    except Exception as exc:
+        result['error'] = str(exc) if isinstance(exc, RuntimeError) else f'{type(exc).__name__}: {exc}'
+    result['elapsed_s'] = round(time.monotonic() - started, 3)
+    return result
+
+def run_batch(items, emit, limits=None, workers=BATCH_DEFAULT_WORKERS):
+    """按引擎分组跑批，每完成一条就 emit(result)，返回全部结果（完成顺序）。
+
+    每个引擎开 min(并发上限, 条目数) 个专属 worker 线程，只处理本引擎的条目，
+    同一引擎的条目因此复用这几个线程里的浏览器；workers 是所有引擎合计的同时下载上限。
+    """
+    limits = limits or dict(BATCH_DEFAULT_LIMITS)
+    gate = threading.BoundedSemaphore(max(1, int(workers)))
+    groups = collections.OrderedDict()
+    for item in items:
+        key = item.get('engine') or batch_engine_key(detect_platform(item['text'])[0])
+        groups.setdefault(key, collections.deque()).append(item)
+    done = queue.Queue()
+
+    def worker(group):
+        try:
+            while True:
+                try:
+                    item = group.popleft()
+                except IndexError:
+                    return
+                with gate:
+                    done.put(_run_batch_item(item))
+        finally:
+            close_browser_pool()
+
+    threads = []
+    for key, group in groups.items():
+        for i in range(min(limits.get(key, 1), len(group))):
+            threads.append(threading.Thread(
+                target=worker, args=(group,), name=f'batch-{key}-{i}', daemon=True
+            ))
+    for t in threads:
+        t.start()
+
+    results = []
+    for _ in items:
+        result = done.get()
+        results.append(result)
+        emit(result)
+    for t in threads:
+        t.join()
+    return results
+
+@contextlib.contextmanager
+def _stdout_reserved_for_results():
+    """批处理期间把 fd 1 指向 stderr，让引擎的进度输出和 yt-dlp 子进程都不污染结果流。
+
+    产出一个写到原 stdout 的文本流，专门用来输出 JSONL 结果。
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    os.dup2(2, 1)
+    results_stream = os.fdopen(saved_fd, 'w', encoding='utf-8', buffering=1)
+    try:
+        yield results_stream
+    finally:
+        sys.stdout.flush()
+        results_stream.flush()
+        os.dup2(saved_fd, 1)
+        results_stream.close()
+
+def _batch_arg_parser(prog, description):
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument('input', nargs='?', default='-', help='输入文件路径，默认 - 表示 stdin')
+    parser.add_argument('--workers', type=int, default=BATCH_DEFAULT_WORKERS,
+                        help=f'同时下载的条目总数上限（默认 {BATCH_DEFAULT_WORKERS}）')
+    parser.add_argument('--limit', action='append', default=[], metavar='ENGINE=N',
+                        help='单引擎并发上限，可重复，例如 --limit douyin=3 --limit tiktok=1')
+    return parser
+
+def _read_batch_input(path):
+    if path == '-':
+        return read_batch_items(sys.stdin)
+    with open(path, encoding='utf-8') as handle:
+        return read_batch_items(handle)
+
+def run_plan_cli(argv):
+    """plan 子命令：只生成并打印批处理执行计划（JSON），不下载。"""
+    args = _batch_arg_parser(
+        'download.py plan', '生成批处理执行计划：展开短链、去重、按引擎分组，打印 JSON。'
+    ).parse_args(argv)
+    plan = build_batch_plan(_read_batch_input(args.input), parse_batch_limits(args.limit))
+    print(json.dumps(plan, ensure_ascii=False, indent=2))
+    return 0
+
+def run_batch_cli(argv):
+    """batch 子命令入口，返回退出码：全部成功 0，有失败 1。"""
+    args = _batch_arg_parser(
+        'download.py batch',
+        '批量下载：每行一条分享文本或 JSONL（text/url, output, id），逐条输出 JSON 结果。',
+    ).parse_args(argv)
+
+    limits = parse_batch_limits(args.limit)
+    items = _read_batch_input(args.input)
+    if not items:
+        print('批处理输入为空', file=sys.stderr)
+        return 1
+
+    plan = build_batch_plan(items, limits)
+    print(
+        f"[batch] {plan['total_inputs']} 条输入，去重后 {plan['unique']} 条"
+        f"（缓存命中 {plan['cached']}）：" + '，'.join(
+            f"{engine}={group['count']}" for engine, group in plan['groups'].items()
+        ),
+        file=sys.stderr,
+    )
+    items_by_seq = {item['seq']: item for item in items}
+
+    failed = 0
+    with _stdout_reserved_for_results() as results_stream:
+        def write(result):
+            nonlocal failed
+            failed += not result['ok']
+            results_stream.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+        entries_by_seq = {entry['seq']: entry for entry in plan['entries']}
+
+        def emit(result):
+            write(result)
+            # 重复的输入共用这一次下载的结果；要求了别的文件名时另放一份
+            for dup_seq in entries_by_seq[result['seq']]['duplicates']:
+                dup = dict(result, seq=dup_seq, input=items_by_seq[dup_seq]['text'],
+                           duplicate_of=result['seq'], elapsed_s=0.0)
+                dup.pop('id', None)
+                if items_by_seq[dup_seq].get('id') is not None:
+                    dup['id'] = items_by_seq[dup_seq]['id']
+                if result['ok']:
+                    try:
+                        dup['output_path'] = place_duplicate_output(
+                            result['output_path'], items_by_seq[dup_seq].get('output'))
+                    except (OSError, ValueError) as exc:
+                        dup.update(ok=False, output_path=None, error=f'放置重复条目失败: {exc}')
+                write(dup)
+
+        run_batch(plan['entries'], emit, limits=limits, workers=args.workers)
+
+    total = plan['total_inputs']
+    print(f'[batch] 完成 {total - failed}/{total}，失败 {failed}', file=sys.stderr)
+    return 1 if failed else 0
+
+# ── 常驻服务（serve 子命令 + 瘦客户端转发） ────────────────
+
+# 服务发现文件（COOKIE_DIR 下，0600）：pid / port / token / started_at
+DAEMON_FILE = 'daemon.json'
+DAEMON_JOB_HISTORY = 500
+DAEMON_POLL_S = 25
+DAEMON_CONNECT_TIMEOUT_S = 2
+DAEMON_SUBMIT_TIMEOUT_S = 15  # 提交只登记入队、不联网，正常毫秒级返回；给足余量，免得误判为未接收
+DAEMON_FINISHED = ('done', 'failed')
+
+class DownloadDaemon:
+    """常驻服务的任务表和 worker 池，与 HTTP 层无关。
+
+    每个引擎一个任务队列，专属 worker 线程按需启动（不超过该引擎的并发上限）并一直保留，
+    线程里的浏览器因此在任务之间保持热启动。同一 (平台, 视频 ID) 正在排队或下载时，
+    新任务不再入队，而是挂在先到的任务上（duplicate_of），共用那一次下载，
+    结果再放到各自要求的目录 / 文件名（见 place_duplicate_output）。
+    短链要联网展开才知道视频 ID，放在后台线程里做，提交本身立即返回。
+    """
+
+    def __init__(self, limits=None, workers=BATCH_DEFAULT_WORKERS):
+        self.limits = limits or dict(BATCH_DEFAULT_LIMITS)
+        self._gate = threading.BoundedSemaphore(max(1, int(workers)))
+        self._cond = threading.Condition()
+        self._jobs = collections.OrderedDict()
+        self._inflight = {}
+        self._followers = collections.defaultdict(list)
+        self._queues = {}
+        self._threads = collections.defaultdict(list)
+        self._resolver = concurrent.futures.ThreadPoolExecutor(
+            max_workers=PLAN_RESOLVE_WORKERS, thread_name_prefix='serve-resolve')
+        self._seq = 0
+        self._stopping = False
+
+    def submit(self, text, output=None, output_dir=None, derive=None):
+        """登记一个下载任务，立即返回任务快照（不联网）；短链在后台展开后再去重、入队。
+
+        derive 为该任务的后处理项（None 表示用服务进程的 --derive 默认值）。
+        """
+        platform, url = detect_platform(text)
+        deferred = bool(url) and any(host in url for host in SHORT_LINK_HOSTS)
+        item = {'seq': 0, 'text': text, 'output': output}
+        entry = None if deferred else _plan_entry(item)
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError('服务正在退出，不再接受任务')
+            self._seq += 1
+            job = {
+                'id': f'{self._seq}-{secrets.token_hex(4)}',
+                'seq': self._seq,
+                'status': 'queued',
+                'input': text,
+                'platform': platform,
+                'engine': batch_engine_key(platform),
+                'video_id': None,
+                'output': output,
+                'output_dir': output_dir,
+                'derive': None if derive is None else list(parse_derive_spec(derive)),
+                'output_path': None,
+                'error': None,
+                'duplicate_of': None,
+                'submitted_at': time.time(),
+                'elapsed_s': None,
+            }
+            self._jobs[job['id']] = job
+            if deferred:
+                self._resolver.submit(self._resolve, job, item)
+            else:
+                self._admit(job, entry)
+            self._trim()
+            return dict(job)
+
+    def _resolve(self, job, item):
+        try:
+            entry = _plan_entry(item)
+        except Exception as exc:
+            entry = {'platform': job['platform'], 'video_id': None,
+                     'resolve_error': f'{type(exc).__name__}: {exc}'}
+        with self._cond:
+            self._admit(job, entry)
+
+    def _admit(self, job, entry):
+        """按 (平台, 视频 ID) 去重后入队，或挂到进行中的同一视频上；调用方持有 self._cond。"""
+        job['video_id'] = entry['video_id']
+        if self._stopping:
+            job.update(status='failed', error='服务正在退出，任务未执行')
+            self._cond.notify_all()
+            return
+        key = (entry['platform'], entry['video_id'])
+        leader = self._inflight.get(key) if entry['video_id'] else None
+        if leader is not None:
+            job['duplicate_of'] = leader['id']
+            job['status'] = leader['status']
+            self._followers[leader['id']].append(job)
+        else:
+            if entry['video_id']:
+                self._inflight[key] = job
+            self._enqueue(job)
+
+    def _enqueue(self, job):
+        engine = job['engine']
+        q = self._queues.setdefault(engine, queue.Queue())
+        q.put(job)
+        threads = self._threads[engine]
+        if len(threads) < self.limits.get(engine, 1):
+            t = threading.Thread(target=self._worker, args=(q,),
+                                 name=f'serve-{engine}-{len(threads)}', daemon=True)
+            threads.append(t)
+            t.start()
+
+    def _worker(self, q):
+        try:
+            while True:
+                job = q.get()
+                if job is None:
+                    return
+                with self._gate:
+                    self._run(job)
+        finally:
+            close_browser_pool()
+
+    def _run(self, job):
+        with self._cond:
+            group = [job] + self._followers[job['id']]
+            for j in group:
+                j['status'] = 'running'
+            # 重复任务共用这次下载，后处理项取它们的并集
+            requested = [j['derive'] for j in group if j['derive'] is not None]
+            derive = sorted({kind for kinds in requested for kind in kinds}) if requested else None
+        item = {'seq': job['seq'], 'text': job['input'], 'output': job['output']}
+        with output_dir_override(job['output_dir']), derive_override(derive), \
+                event_context(job=job['id']):
+            result = _run_batch_item(item)
+        with self._cond:
+            job.update(status='done' if result['ok'] else 'failed', output_path=result['output_path'],
+                       error=result['error'], elapsed_s=result['elapsed_s'])
+            followers = self._followers.pop(job['id'], [])
+            key = (job['platform'], job['video_id'])
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+            self._cond.notify_all()
+        for follower in followers:
+            update = {'status': job['status'], 'output_path': job['output_path'],
+                      'error': job['error'], 'elapsed_s': 0.0}
+            if result['ok']:
+                # 挂靠的任务按自己的 output / output_dir 拿一份，不直接拿先到任务的路径
+                try:
+                    with output_dir_override(follower['output_dir']):
+                        update['output_path'] = place_duplicate_output(
+                            job['output_path'], follower['output'], output_dir())
+                except (OSError, RuntimeError, ValueError) as exc:
+                    update.update(status='failed', output_path=None,
+                                  error=f'放置输出文件失败: {type(exc).__name__}: {exc}')
+            with self._cond:
+                follower.update(update)
+                self._cond.notify_all()
+
+    def _trim(self):
+        """只保留最近 DAEMON_JOB_HISTORY 个已结束的任务。"""
+        excess = len(self._jobs) - DAEMON_JOB_HISTORY
+        for job_id in [k for k, j in self._jobs.items() if j['status'] in DAEMON_FINISHED]:
+            if excess <= 0:
+                break
+            del self._jobs[job_id]
+            excess -= 1
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout):
+        """等到任务结束或超时（长轮询用），返回任务快照；没有该任务返回 None。"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._jobs.get(job_id, {}).get('status', 'done') in DAEMON_FINISHED,
+                timeout,
+            )
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self._cond:
+            return [dict(job) for job in self._jobs.values()]
+
+    def stats(self):
+        with self._cond:
+            counts = collections.Counter(job['status'] for job in self._jobs.values())
+            return {
+                'pid': os.getpid(),
+                'jobs': dict(counts),
+                'workers': {engine: len(threads) for engine, threads in self._threads.items()},
+            }
+
+    def stop(self):
+        """不再接受新任务，并让各 worker 处理完已排队的任务后退出。"""
+        with self._cond:
+            self._stopping = True
+            for engine, q in self._queues.items():
+                for _ in self._threads[engine]:
+                    q.put(None)
+        # 还在展开的短链会在 _admit 里直接标记失败
+        self._resolver.shutdown(wait=False)
+
+class _DaemonHandler(http.server.BaseHTTPRequestHandler):
+    """serve 的 HTTP 接口（JSON）；每个请求都要带 X-Daemon-Token。
+
+      GET  /health              服务状态
+      GET  /jobs                全部任务
+      GET  /jobs/<id>?wait=N    单个任务；wait>0 时长轮询到任务结束或 N 秒
+      POST /jobs                提交任务 {text, output?, output_dir?, derive?}，返回 202 + 任务
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'video-download'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.headers.get('X-Daemon-Token', '').encode('utf-8')
+        if hmac.compare_digest(token, self.server.token.encode('utf-8')):
+            return True
+        self._reply(401, {'error': 'X-Daemon-Token 无效'})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = urllib.parse.urlsplit(self.path)
+        daemon = self.server.download_daemon
+        if parts.path == '/health':
+            return self._reply(200, daemon.stats())
+        if parts.path == '/jobs':
+            return self._reply(200, {'jobs': daemon.list()})
+        if parts.path.startswith('/jobs/'):
+            job_id = parts.path[len('/jobs/'):]
+            try:
+                wait = float(urllib.parse.parse_qs(parts.query).get('wait', ['0'])[0])
+            except ValueError:
+                wait = 0
+            wait = min(max(wait, 0), DAEMON_POLL_S)
+            job = daemon.wait(job_id, wait) if wait else daemon.get(job_id)
+            if job is None:
+                return self._reply(404, {'error': f'没有任务 {job_id}'})
+            return self._reply(200, job)
+        self._reply(404, {'error': f'未知路径 {parts.path}'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if urllib.parse.urlsplit(self.path).path != '/jobs':
+            return self._reply(404, {'error': f'未知路径 {self.path}'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            text = str(payload.get('text') or payload.get('url') or '').strip()
+        except (ValueError, AttributeError):
+            return self._reply(400, {'error': '请求体必须是 JSON 对象'})
+        if not text:
+            return self._reply(400, {'error': '缺少 text'})
+        try:
+            derive = payload.get('derive')
+            parse_derive_spec(derive)
+        except RuntimeError as exc:
+            return self._reply(400, {'error': str(exc)})
+        try:
+            job = self.server.download_daemon.submit(
+                text, payload.get('output') or None, payload.get('output_dir') or None, derive)
+        except RuntimeError as exc:
+            return self._reply(503, {'error': str(exc)})
+        self._reply(202, job)
+
+def make_daemon_server(daemon, token, port=0):
+    """在 127.0.0.1 上监听的 ThreadingHTTPServer（port=0 时由系统分配端口）。"""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _DaemonHandler)
+    server.daemon_threads = True
+    server.download_daemon = daemon
+    server.token = token
+    return server
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def find_daemon():
+    """读服务发现文件；进程还在时返回 {pid, port, token, ...}，否则 None。"""
+    info = read_state_file(DAEMON_FILE)
+    try:
+        pid, port, token = int(info['pid']), int(info['port']), str(info['token'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if pid == os.getpid() or not _pid_alive(pid):
+        return None
+    return dict(info, pid=pid, port=port, token=token)
+
+def _write_daemon_file(info):
+    path = os.path.join(COOKIE_DIR, DAEMON_FILE)
+    os.makedirs(COOKIE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+        json.dump(info, handle)
+    os.replace(tmp_path, path)
+
+def _remove_daemon_file():
+    """只删除本进程写下的发现文件（可能已被新起的服务覆盖）。"""
+    if read_state_file(DAEMON_FILE).get('pid') == os.getpid():
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(COOKIE_DIR, DAEMON_FILE))
+
+def run_serve_cli(argv):
+    """serve 子命令：在本机端口上常驻，接受下载任务，直到 Ctrl-C / SIGTERM。"""
+    parser = argparse.ArgumentParser(
+        prog='download.py serve',
+        description='常驻下载服务：保持浏览器/yt-dlp/Cookie 热启动，合并重复的进行中任务。',
+    )
+    parser.add_argument('--port', type=int,
+                        default=int(os.environ.get('VIDEO_DOWNLOAD_DAEMON_PORT', '0') or 0),
+                        help='监听端口（只绑定 127.0.0.1），默认由系统分配')
+    parser.add_argument('--workers', type=int, default=BATCH_DEFAULT_WORKERS,
+                        help=f'同时下载的任务总数上限（默认 {BATCH_DEFAULT_WORKERS}）')
+    parser.add_argument('--limit', action='append', default=[], metavar='ENGINE=N',
+                        help='单引擎并发上限，可重复，例如 --limit douyin=3')
+    args = parser.parse_args(argv)
+
+    running = find_daemon()
+    if running:
+        print(f"[serve] 已有服务在运行（pid {running['pid']}，端口 {running['port']}）",
+              file=sys.stderr)
+        return 1
+    daemon = DownloadDaemon(parse_batch_limits(args.limit), args.workers)
+    server = make_daemon_server(daemon, secrets.token_urlsafe(24), args.port)
+    port = server.server_address[1]
+    _write_daemon_file({'pid': os.getpid(), 'port': port, 'token': server.token,
+                        'started_at': time.time()})
+    get_ytdlp_engine()
+
+    def on_term(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_term)
+    print(f'[serve] 监听 127.0.0.1:{port}（pid {os.getpid()}）', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        server.server_close()
+        _remove_daemon_file()
+    print('[serve] 已退出', file=sys.stderr)
+    return 0
+
+def _daemon_call(info, method, path, payload=None, timeout=DAEMON_CONNECT_TIMEOUT_S):
+    body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    headers = {'X-Daemon-Token': info['token'], 'Content-Type': 'application/json'}
+    resp = http_request(method, f"http://127.0.0.1:{info['port']}{path}",
+                        headers=headers, body=body, timeout=timeout)
+    return resp.json()
+
+def forward_to_daemon(share_text, output_name=None):
+    """瘦客户端：有服务在运行时把下载交给它并等待结果，返回输出路径。
+
+    没有服务、服务不可达、VIDEO_DOWNLOAD_DAEMON=0 或本进程开了 --events 时返回 None，
+    由调用方在本进程里下载；任务已提交后的失败直接抛 RuntimeError，不再重复下载。
+    """
+    if os.environ.get('VIDEO_DOWNLOAD_DAEMON', '1') == '0' or _event_sink is not None:
+        return None
+    info = find_daemon()
+    if info is None:
+        return None
+    try:
+        _daemon_call(info, 'GET', '/health')
+    except (OSError, RuntimeError, ValueError) as exc:
+        print(f'[daemon] 服务不可用（{exc}），改为本进程下载')
+        return None
+    try:
+        job = _daemon_call(info, 'POST', '/jobs', {
+            'text': share_text, 'output': output_name, 'output_dir': output_dir(),
+            'derive': list(derive_kinds()) or None,
+        }, timeout=DAEMON_SUBMIT_TIMEOUT_S)
+    except (HttpStatusError, ConnectionRefusedError) as exc:
+        # 服务明确拒绝（退出中 / 请求无效）或已不在监听：任务没有被接收
+        print(f'[daemon] 服务未接收任务（{exc}），改为本进程下载')
+        return None
+    except (OSError, RuntimeError, ValueError, asyncio.TimeoutError) as exc:
+        # 请求可能已送达、任务可能已在服务端运行；此时本地再下一遍就是重复下载
+        raise RuntimeError(f'提交到服务的结果未知（{exc}）；可用 GET /jobs 查看或稍后重试') from exc
+    note = f"，复用进行中的任务 {job['duplicate_of']}" if job.get('duplicate_of') else ''
+    print(f"[daemon] 已提交任务 {job['id']}（pid {info['pid']}{note}）")
+    try:
+        while job['status'] not in DAEMON_FINISHED:
+            job = _daemon_call(info, 'GET', f"/jobs/{job['id']}?wait={DAEMON_POLL_S}",
+                               timeout=DAEMON_POLL_S + 10)
+    except (OSError, RuntimeError, ValueError) as exc:
+        raise RuntimeError(f"等待服务任务 {job['id']} 失败: {exc}") from exc
+    if job['status'] != 'done':
+        raise RuntimeError(job.get('error') or '服务端下载失败')
+    print(f"下载完成: {job['output_path']}")
+    return job['output_path']
+
 # ── 入口 ──────────────────────────────────────────────────
 
+def _pop_events_option(argv):
+    """取出各子命令通用的 --events <path>，打开结构化事件输出（JSONL 追加写）。"""
+    if '--events' not in argv:
+        return
+    idx = argv.index('--events')
+    if idx + 1 >= len(argv):
+        raise RuntimeError('--events 需要一个文件路径')
+    path = argv[idx + 1]
+    del argv[idx:idx + 2]
+    open_event_sink(path)
+
+def _pop_derive_option(argv):
+    """取出各下载命令通用的 --derive <项>，设置下载后的 ffmpeg 后处理项。"""
+    if '--derive' not in argv:
+        return
+    idx = argv.index('--derive')
+    if idx + 1 >= len(argv):
+        raise RuntimeError(f"--derive 需要后处理项，可选: {', '.join(DERIVE_KINDS)}, all")
+    spec = argv[idx + 1]
+    del argv[idx:idx + 2]
+    set_derive_kinds(spec)
+
 def main():
+    _pop_events_option(sys.argv)
+    _pop_derive_option(sys.argv)
     if len(sys.argv) < 2:
         print("用法:")
         print("  python3 download.py <分享链接或文本> [输出文件名]  # 下载视频")
         print("  python3 download.py resolve <视频号分享链接>       # 仅解析视频号")
         print("  python3 download.py login <平台> [--signal-file F] # 登录保存cookie")
         print("  python3 download.py check-login <平台>             # 检查登录状态")
+        print("  python3 download.py batch [文件|-] [--workers N] [--limit 引擎=N]  # 批量下载，逐条输出 JSON")
+        print("  python3 download.py plan [文件|-]                  # 打印批处理执行计划（去重/分组）")
+        print("  python3 download.py serve [--port N]               # 常驻服务；运行时下载命令自动转发给它")
+        print("  以上下载命令均可加 --events <文件>                 # 追加写出各阶段耗时事件 (JSONL)")
+        print("              以及 --derive faststart,proxy,poster,sheet|all  # 下载后一次 ffmpeg 生成派生文件")
         print()
         print("支持平台: 微信视频号 (自托管解析器)")
         print("         抖音 / 小红书 / B站 (Playwright)")
@@ -1367,23 +4434,22 @@ def main():
         print(json.dumps(result, ensure_ascii=False, indent=2))
         return
 
-    share_text = sys.argv[1]
-    output_name = sys.argv[2] if len(sys.argv) > 2 else None
+    # batch 子命令：从文件或 stdin 批量下载，逐条输出 JSON 结果
+    if sys.argv[1] == 'batch':
+        sys.exit(run_batch_cli(sys.argv[2:]))
 
-    platform, url = detect_platform(share_text)
+    # plan 子命令：只打印批处理执行计划（JSON），用于开跑前估算
+    if sys.argv[1] == 'plan':
+        sys.exit(run_plan_cli(sys.argv[2:]))
 
-    if platform == 'wechat_channels':
-        download_wechat_channels(url, output_name)
-    elif platform == 'douyin':
-        download_douyin(url, output_name)
-    elif platform == 'xiaohongshu':
-        download_xiaohongshu(url, output_name)
-    elif platform == 'bilibili':
-        download_bilibili(url, output_name)
-    elif platform == 'tiktok':
-        download_tiktok(url, output_name)
-    else:
-        download_ytdlp(share_text, output_name)
+    # serve 子命令：常驻服务，其他下载命令检测到它时会转发过去
+    if sys.argv[1] == 'serve':
+        sys.exit(run_serve_cli(sys.argv[2:]))
+
+    share_text = sys.argv[1]
+    output_name = sys.argv[2] if len(sys.argv) > 2 else None
+    if forward_to_daemon(share_text, output_name) is None:
+        download_share_text(share_text, output_name)
 
 if __name__ == '__main__':
     try:
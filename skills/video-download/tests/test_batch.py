@@ -0,0 +1,476 @@
+import contextlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "scripts", "download.py"
+)
+SPEC = importlib.util.spec_from_file_location("video_download_batch", SCRIPT)
+video_download = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(video_download)
+
+
+DOUYIN = "https://www.douyin.com/video/{}"
+YOUTUBE = "https://www.youtube.com/watch?v={}"
+
+
+class BatchInputTests(unittest.TestCase):
+    def test_reads_plain_and_jsonl_lines(self):
+        lines = [
+            "# 注释行",
+            "",
+            "看看 https://www.douyin.com/video/1",
+            '{"url": "https://b23.tv/abc", "output": "b.mp4", "id": "row-7"}',
+        ]
+
+        items = video_download.read_batch_items(lines)
+
+        self.assertEqual([item["seq"] for item in items], [1, 2])
+        self.assertEqual(items[0]["text"], "看看 https://www.douyin.com/video/1")
+        self.assertIsNone(items[0]["output"])
+        self.assertEqual(items[1]["text"], "https://b23.tv/abc")
+        self.assertEqual(items[1]["output"], "b.mp4")
+        self.assertEqual(items[1]["id"], "row-7")
+
+    def test_invalid_limit_is_actionable(self):
+        with self.assertRaisesRegex(RuntimeError, "--limit"):
+            video_download.parse_batch_limits(["weibo=2"])
+
+        limits = video_download.parse_batch_limits(["douyin=5"])
+        self.assertEqual(limits["douyin"], 5)
+        self.assertEqual(limits["tiktok"], video_download.BATCH_DEFAULT_LIMITS["tiktok"])
+
+
+class BatchRunTests(unittest.TestCase):
+    def test_per_engine_limit_is_respected_and_results_stream(self):
+        lock = threading.Lock()
+        active = {"douyin": 0, "ytdlp": 0}
+        peak = {"douyin": 0, "ytdlp": 0}
+
+        def fake_download(text, output_name=None):
+            key = "douyin" if "douyin" in text else "ytdlp"
+            with lock:
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+            time.sleep(0.05)
+            with lock:
+                active[key] -= 1
+            return f"/tmp/{key}.mp4"
+
+        items = video_download.read_batch_items(
+            [DOUYIN.format(i) for i in range(4)] + [YOUTUBE.format(i) for i in range(4)]
+        )
+        emitted = []
+        with mock.patch.object(video_download, "download_share_text", side_effect=fake_download):
+            results = video_download.run_batch(
+                items, emitted.append, limits={"douyin": 1, "ytdlp": 3}, workers=4
+            )
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(emitted, results)
+        self.assertEqual(peak["douyin"], 1)
+        self.assertGreater(peak["ytdlp"], 1)
+        self.assertTrue(all(r["ok"] for r in results))
+        self.assertEqual(sorted(r["seq"] for r in results), list(range(1, 9)))
+
+    def test_engine_failures_and_exits_become_result_lines(self):
+        def fake_download(text, output_name=None):
+            if text.endswith("1"):
+                raise RuntimeError("抓取失败")
+            raise SystemExit(1)
+
+        items = video_download.read_batch_items([DOUYIN.format(1), DOUYIN.format(2)])
+        with mock.patch.object(video_download, "download_share_text", side_effect=fake_download):
+            results = video_download.run_batch(items, lambda r: None, workers=2)
+
+        by_seq = {r["seq"]: r for r in results}
+        self.assertFalse(by_seq[1]["ok"])
+        self.assertEqual(by_seq[1]["error"], "抓取失败")
+        self.assertFalse(by_seq[2]["ok"])
+        self.assertIn("exit 1", by_seq[2]["error"])
+        self.assertEqual(by_seq[1]["platform"], "douyin")
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+        self.visits = []
+
+    def is_closed(self):
+        return self.closed
+
+    def goto(self, url, **kwargs):
+        self.visits.append(url)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.cookies = []
+        self.closed = False
+
+    def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    def add_cookies(self, cookies):
+        self.cookies.append(cookies)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    def is_connected(self):
+        return True
+
+    def new_context(self, **kwargs):
+        ctx = FakeContext()
+        self.contexts.append(ctx)
+        return ctx
+
+    def close(self):
+        pass
+
+
+class BrowserPoolTests(unittest.TestCase):
+    def test_context_per_platform_cookies_once_and_page_recycled(self):
+        pool = video_download.BrowserPool(page_max_uses=2)
+        browser = FakeBrowser()
+        pool._browser = browser
+        with mock.patch.object(
+            video_download, "load_cookies", return_value=[{"name": "sessionid"}]
+        ) as load:
+            for _ in range(3):
+                with pool.page("douyin") as page:
+                    page.goto("https://www.douyin.com/video/1")
+            with pool.page("bilibili"):
+                pass
+
+        self.assertEqual(len(browser.contexts), 2)
+        self.assertEqual(load.call_count, 2)
+        douyin_ctx = browser.contexts[0]
+        self.assertEqual(len(douyin_ctx.cookies), 1)
+        # 第 1、2 次复用同一页面，用满后关闭，第 3 次换新页面
+        self.assertEqual(len(douyin_ctx.pages), 2)
+        self.assertTrue(douyin_ctx.pages[0].closed)
+        self.assertIn("about:blank", douyin_ctx.pages[0].visits)
+
+    def test_context_is_rebuilt_when_cookie_file_changes(self):
+        pool = video_download.BrowserPool()
+        browser = FakeBrowser()
+        pool._browser = browser
+        with tempfile.TemporaryDirectory() as config_dir:
+            path = os.path.join(config_dir, "douyin_cookies.json")
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump([{"name": "sessionid", "value": "a"}], handle)
+            with mock.patch.object(video_download, "COOKIE_DIR", config_dir), mock.patch.object(
+                video_download, "load_cookies", side_effect=lambda platform: [{"name": "sessionid"}]
+            ) as load:
+                with pool.page("douyin"):
+                    pass
+                with pool.page("douyin"):
+                    pass
+                with open(path, "w", encoding="utf-8") as handle:
+                    json.dump([{"name": "sessionid", "value": "bb"}], handle)
+                os.utime(path, ns=(1, 1))
+                with pool.page("douyin") as page:
+                    pass
+
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(len(browser.contexts), 2)
+        old, new = browser.contexts
+        self.assertTrue(old.closed)
+        self.assertFalse(new.closed)
+        self.assertIs(page, new.pages[0])
+
+    def test_page_is_dropped_after_error(self):
+        pool = video_download.BrowserPool()
+        browser = FakeBrowser()
+        pool._browser = browser
+        with self.assertRaises(ValueError):
+            with pool.page():
+                raise ValueError("页面崩了")
+        with pool.page():
+            pass
+
+        pages = browser.contexts[0].pages
+        self.assertEqual(len(pages), 2)
+        self.assertTrue(pages[0].closed)
+        self.assertFalse(pages[1].closed)
+
+
+class SharedChromiumTests(unittest.TestCase):
+    def test_one_browser_serves_every_thread_until_it_exits(self):
+        launches = []
+        crashed = threading.Event()
+
+        @contextlib.contextmanager
+        def fake_launcher(profile_dir):
+            launches.append(profile_dir)
+            with open(os.path.join(profile_dir, "DevToolsActivePort"), "w") as handle:
+                handle.write(f"{9332 + len(launches)}\n/devtools/browser/abc\n")
+
+            def wait_closed(timeout_s):
+                time.sleep(0.01)
+                return crashed.is_set()
+
+            yield wait_closed
+
+        shared = video_download.SharedChromium(fake_launcher)
+        self.addCleanup(shared.close)
+        endpoints = []
+        threads = [threading.Thread(target=lambda: endpoints.append(shared.endpoint())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        crashed.set()  # 浏览器退出：属主线程结束，下一次取地址时重新启动
+        shared._owner.join(5)
+        crashed.clear()
+        relaunched = shared.endpoint()
+        shared.close()
+
+        self.assertEqual(endpoints, ["ws://127.0.0.1:9333/devtools/browser/abc"] * 4)
+        self.assertEqual(relaunched, "ws://127.0.0.1:9334/devtools/browser/abc")
+        self.assertEqual(len(launches), 2)
+        self.assertFalse(any(os.path.exists(path) for path in launches))
+
+    def test_launch_failure_is_reported(self):
+        @contextlib.contextmanager
+        def broken_launcher(profile_dir):
+            raise OSError("no chromium")
+            yield
+
+        shared = video_download.SharedChromium(broken_launcher)
+        with self.assertRaises(RuntimeError) as caught:
+            shared.endpoint()
+
+        self.assertIn("no chromium", str(caught.exception))
+
+
+class BatchPlanTests(unittest.TestCase):
+    def test_detect_platform_keeps_rule_priority_in_one_pass(self):
+        text = "先看 https://b23.tv/Ab1 再看 https://weixin.qq.com/sph/ARebDCbPGy"
+        self.assertEqual(
+            video_download.detect_platform(text),
+            ("wechat_channels", "https://weixin.qq.com/sph/ARebDCbPGy"),
+        )
+        self.assertEqual(
+            video_download.detect_platform("https://www.douyin.com/jingxuan?modal_id=42"),
+            ("douyin", "https://www.douyin.com/video/42"),
+        )
+        self.assertEqual(video_download.detect_platform("纯文本"), (None, None))
+
+    def test_plan_resolves_short_links_dedupes_and_groups(self):
+        lines = [
+            "https://v.douyin.com/abc/",
+            YOUTUBE.format("x"),
+            DOUYIN.format("7"),
+            YOUTUBE.format("x") + "#t=3",
+            "https://www.bilibili.com/video/BV1xx411c7mD",
+        ]
+        resolved = {"https://v.douyin.com/abc/": DOUYIN.format("7") + "?previous_page=app"}
+        with mock.patch.object(
+            video_download, "resolve_redirect", side_effect=lambda url: resolved[url]
+        ), mock.patch.object(video_download, "download_cache_has", return_value=False):
+            plan = video_download.build_batch_plan(video_download.read_batch_items(lines))
+
+        self.assertEqual(plan["total_inputs"], 5)
+        self.assertEqual(plan["unique"], 3)
+        self.assertEqual(list(plan["groups"]), ["douyin", "bilibili", "ytdlp"])
+        douyin = plan["entries"][0]
+        self.assertEqual((douyin["seq"], douyin["video_id"]), (1, "7"))
+        self.assertEqual(douyin["duplicates"], [3])
+        self.assertEqual(plan["entries"][2]["duplicates"], [4])
+        self.assertEqual(plan["groups"]["bilibili"]["seqs"], [5])
+
+    def test_batch_cli_emits_duplicate_rows_from_one_download(self):
+        lines = [DOUYIN.format(7), DOUYIN.format(7)]
+        emitted = []
+        with mock.patch.object(
+            video_download, "read_batch_items",
+            return_value=video_download.read_batch_items(lines),
+        ), mock.patch.object(
+            video_download, "download_cache_has", return_value=False
+        ), mock.patch.object(
+            video_download, "download_share_text", return_value="/tmp/7.mp4"
+        ) as download, mock.patch.object(
+            video_download, "_stdout_reserved_for_results",
+        ) as reserved:
+            reserved.return_value.__enter__.return_value.write = emitted.append
+            code = video_download.run_batch_cli(["-"])
+
+        self.assertEqual(code, 0)
+        self.assertEqual(download.call_count, 1)
+        rows = [json.loads(line) for line in emitted]
+        self.assertEqual([r["seq"] for r in rows], [1, 2])
+        self.assertEqual(rows[1]["duplicate_of"], 1)
+        self.assertEqual(rows[1]["output_path"], "/tmp/7.mp4")
+
+    def test_duplicate_with_its_own_output_name_gets_its_own_file(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            leader = os.path.join(out_dir, "7.mp4")
+            with open(leader, "wb") as handle:
+                handle.write(b"video")
+            with open(leader + ".meta.json", "w", encoding="utf-8") as handle:
+                json.dump({"output_path": leader}, handle)
+            lines = [DOUYIN.format(7), json.dumps({"url": DOUYIN.format(7), "output": "mine"})]
+            emitted = []
+            with mock.patch.object(
+                video_download, "read_batch_items",
+                return_value=video_download.read_batch_items(lines),
+            ), mock.patch.object(
+                video_download, "download_cache_has", return_value=False
+            ), mock.patch.object(
+                video_download, "download_share_text", return_value=leader
+            ) as download, mock.patch.object(
+                video_download, "_stdout_reserved_for_results",
+            ) as reserved:
+                reserved.return_value.__enter__.return_value.write = emitted.append
+                video_download.run_batch_cli(["-"])
+            rows = [json.loads(line) for line in emitted]
+            mine = os.path.join(out_dir, "mine.mp4")
+            with open(mine, "rb") as handle:
+                content = handle.read()
+            with open(mine + ".meta.json", encoding="utf-8") as handle:
+                meta = json.load(handle)
+
+        self.assertEqual(download.call_count, 1)
+        self.assertEqual(rows[1]["output_path"], mine)
+        self.assertEqual(content, b"video")
+        self.assertEqual(meta["output_path"], mine)
+
+
+class DownloadDaemonTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(video_download, "download_cache_has", return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_inflight_jobs_share_one_download(self):
+        release = threading.Event()
+        calls = []
+
+        def fake_download(text, output_name=None):
+            calls.append((text, video_download.output_dir()))
+            release.wait(5)
+            path = os.path.join(video_download.output_dir(), "7.mp4")
+            with open(path, "wb") as handle:
+                handle.write(b"video")
+            return path
+
+        daemon = video_download.DownloadDaemon(workers=2)
+        self.addCleanup(daemon.stop)
+        with tempfile.TemporaryDirectory() as first_dir, tempfile.TemporaryDirectory() as second_dir, \
+                mock.patch.object(video_download, "download_share_text", side_effect=fake_download):
+            first = daemon.submit(DOUYIN.format(7), output_dir=first_dir)
+            second = daemon.submit("再看一遍 " + DOUYIN.format(7), output="again", output_dir=second_dir)
+            other = daemon.submit(DOUYIN.format(8), output_dir=first_dir)
+            release.set()
+            done = [daemon.wait(job["id"], 5) for job in (first, second, other)]
+            with open(os.path.join(second_dir, "again.mp4"), "rb") as handle:
+                placed = handle.read()
+
+        self.assertEqual(second["duplicate_of"], first["id"])
+        self.assertIsNone(other["duplicate_of"])
+        self.assertEqual(len(calls), 2)
+        self.assertIn((DOUYIN.format(7), first_dir), calls)
+        self.assertEqual([job["status"] for job in done], ["done"] * 3)
+        # 挂靠的任务拿到自己要求的目录和文件名，而不是先到任务的路径
+        self.assertEqual(done[0]["output_path"], os.path.join(first_dir, "7.mp4"))
+        self.assertEqual(done[1]["output_path"], os.path.join(second_dir, "again.mp4"))
+        self.assertEqual(placed, b"video")
+
+    def test_short_links_are_resolved_off_the_submit_path(self):
+        resolved = threading.Event()
+
+        def slow_resolve(url):
+            resolved.wait(5)
+            return "https://www.douyin.com/video/9"
+
+        daemon = video_download.DownloadDaemon()
+        self.addCleanup(daemon.stop)
+        with mock.patch.object(video_download, "resolve_redirect", side_effect=slow_resolve), \
+                mock.patch.object(video_download, "download_share_text", return_value="/tmp/9.mp4"):
+            started = time.monotonic()
+            job = daemon.submit("https://v.douyin.com/abc/")
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual((job["status"], job["video_id"]), ("queued", None))
+            resolved.set()
+            done = daemon.wait(job["id"], 5)
+
+        self.assertEqual(done["status"], "done")
+        self.assertEqual(done["video_id"], "9")
+
+    def test_client_falls_back_only_when_job_was_not_accepted(self):
+        info = {"pid": 1, "port": 1, "token": "t"}
+
+        def call(reply):
+            def fake_call(info, method, path, payload=None, timeout=None):
+                if path == "/health":
+                    return {}
+                if isinstance(reply, BaseException):
+                    raise reply
+                return reply
+            return fake_call
+
+        with mock.patch.object(video_download, "find_daemon", return_value=info):
+            with mock.patch.object(video_download, "_daemon_call",
+                                   call(video_download.HttpStatusError(503, "/jobs"))):
+                self.assertIsNone(video_download.forward_to_daemon(DOUYIN.format(1)))
+            with mock.patch.object(video_download, "_daemon_call", call(TimeoutError("timed out"))):
+                with self.assertRaises(RuntimeError):
+                    video_download.forward_to_daemon(DOUYIN.format(1))
+
+    def test_http_api_requires_token_and_long_polls(self):
+        daemon = video_download.DownloadDaemon()
+        server = video_download.make_daemon_server(daemon, "secret")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(daemon.stop)
+        info = {"port": server.server_address[1], "token": "secret"}
+
+        with self.assertRaises(video_download.HttpStatusError) as ctx:
+            video_download._daemon_call(dict(info, token="wrong"), "GET", "/health")
+        self.assertEqual(ctx.exception.status, 401)
+
+        with mock.patch.object(video_download, "download_share_text", return_value="/tmp/x.mp4"):
+            job = video_download._daemon_call(
+                info, "POST", "/jobs", {"text": YOUTUBE.format("x")}
+            )
+            job = video_download._daemon_call(info, "GET", f"/jobs/{job['id']}?wait=5", timeout=10)
+
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["engine"], "ytdlp")
+        self.assertEqual(job["output_path"], "/tmp/x.mp4")
+        listed = video_download._daemon_call(info, "GET", "/jobs")["jobs"]
+        self.assertEqual([j["id"] for j in listed], [job["id"]])
+
+    def test_client_falls_back_without_daemon(self):
+        with mock.patch.object(video_download, "read_state_file", return_value={}):
+            self.assertIsNone(video_download.forward_to_daemon(DOUYIN.format(1)))
+        stale = {"pid": 2 ** 22 + 7, "port": 1, "token": "t"}
+        with mock.patch.object(video_download, "read_state_file", return_value=stale), \
+                mock.patch.object(video_download, "_pid_alive", return_value=False):
+            self.assertIsNone(video_download.forward_to_daemon(DOUYIN.format(1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "bench")
+sys.path.insert(0, BENCH_DIR)
+
+import fixture_server  # noqa: E402
+import run_bench  # noqa: E402
+
+
+class FixtureServerTests(unittest.TestCase):
+    def test_payload_slices_are_consistent(self):
+        whole = fixture_server.payload_slice(0, 200000)
+        self.assertEqual(len(whole), 200001)
+        self.assertEqual(fixture_server.payload_slice(70000, 70100), whole[70000:70101])
+
+
+class BenchScenarioTests(unittest.TestCase):
+    def run_scenario(self, name, config):
+        env = {
+            "VIDEO_DOWNLOAD_CACHE": "0",
+            "VIDEO_DOWNLOAD_ADAPTIVE_ENGINES": "0",
+        }
+        with fixture_server.FixtureServer(config) as server, \
+                tempfile.TemporaryDirectory() as out_dir, \
+                mock.patch.dict(os.environ, dict(env, VIDEO_DOWNLOAD_OUTPUT_DIR=out_dir)):
+            result = run_bench.run_scenario(name, server.base_url, 2, out_dir)
+            return result, server.stats
+
+    def test_download_file_survives_injected_failures(self):
+        config = fixture_server.FixtureConfig(size=3 * 1024 * 1024, fail_rate=0.3, seed=2)
+        with mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_CONNECTIONS": "2"}):
+            (latencies, total, errors, extra), stats = self.run_scenario("download_file", config)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(latencies), 2)
+        self.assertEqual(total, 2 * config.size)
+        self.assertEqual(extra["probe"], "synthetic")
+        self.assertGreater(stats["requests"], 2)
+
+    def test_compare_reports_relative_change(self):
+        old = {"revision": "a", "scenarios": {"batch": {"mb_per_s": 100.0, "failed": 0}}}
+        new = {"revision": "b", "scenarios": {"batch": {"mb_per_s": 150.0, "failed": 0}}}
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, payload in (("old.json", old), ("new.json", new)):
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], "w", encoding="utf-8") as handle:
+                    json.dump(payload, handle)
+            with mock.patch("builtins.print") as printed:
+                run_bench.compare_main(*paths)
+
+        diff = json.loads(printed.call_args[0][0])
+        self.assertEqual(diff["scenarios"]["batch"]["mb_per_s"]["change_pct"], 50.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "scripts", "download.py"
+)
+SPEC = importlib.util.spec_from_file_location("video_download_cache", SCRIPT)
+video_download = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(video_download)
+
+
+class DownloadCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.out_dir = tempfile.TemporaryDirectory()
+        for patcher in (
+            mock.patch.object(video_download, "DOWNLOAD_CACHE_DIR", self.cache_dir.name),
+            mock.patch.object(video_download, "probe_media", return_value=None),
+            mock.patch.dict(
+                os.environ,
+                {"VIDEO_DOWNLOAD_OUTPUT_DIR": self.out_dir.name, "VIDEO_DOWNLOAD_CACHE": "1"},
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+        self.out_dir.cleanup()
+
+    def write_video(self, name, payload):
+        path = os.path.join(self.out_dir.name, name)
+        with open(path, "wb") as handle:
+            handle.write(payload)
+        return path
+
+    def test_miss_without_index_does_not_create_it(self):
+        self.assertIsNone(video_download.download_cache_lookup("douyin", "1"))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir.name, "index.sqlite3")))
+
+    def test_hit_restores_file_name_and_meta(self):
+        path = self.write_video("标题.mp4", b"video-bytes")
+        with open(path + ".meta.json", "w", encoding="utf-8") as handle:
+            json.dump({"platform": "tiktok", "output_path": path}, handle)
+        video_download.download_cache_store("tiktok", "123", path)
+        os.remove(path)
+        os.remove(path + ".meta.json")
+
+        restored = video_download.download_cache_lookup("tiktok", "123")
+        renamed = video_download.download_cache_lookup("tiktok", "123", "named")
+
+        self.assertEqual(restored, path)
+        with open(restored, "rb") as handle:
+            self.assertEqual(handle.read(), b"video-bytes")
+        with open(restored + ".meta.json", encoding="utf-8") as handle:
+            self.assertEqual(json.load(handle)["output_path"], restored)
+        self.assertEqual(renamed, os.path.join(self.out_dir.name, "named.mp4"))
+
+    def test_hit_never_overwrites_an_unrelated_file(self):
+        path = self.write_video("v.mp4", b"cached-bytes")
+        video_download.download_cache_store("douyin", "7", path)
+        os.remove(path)
+        self.write_video("v.mp4", b"user edit")
+        copy = self.write_video("copy.mp4", b"cached-bytes")
+
+        self.assertIsNone(video_download.download_cache_lookup("douyin", "7"))
+        with open(path, "rb") as handle:
+            self.assertEqual(handle.read(), b"user edit")
+        # 内容相同的已有文件（例如跨盘复制来的）直接当作命中
+        self.assertEqual(video_download.download_cache_lookup("douyin", "7", "copy.mp4"), copy)
+
+    def test_copy_mode_keeps_output_independent_of_cache(self):
+        path = self.write_video("v.mp4", b"cached-bytes")
+        with mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_CACHE_LINK": "0"}):
+            video_download.download_cache_store("douyin", "8", path)
+            os.remove(path)
+            restored = video_download.download_cache_lookup("douyin", "8")
+        with open(restored, "r+b") as handle:
+            handle.write(b"EDITED")
+        os.remove(restored)
+
+        self.assertEqual(video_download.download_cache_lookup("douyin", "8"), restored)
+        with open(restored, "rb") as handle:
+            self.assertEqual(handle.read(), b"cached-bytes")
+
+    def test_evicts_least_recently_used_over_budget(self):
+        first = self.write_video("a.mp4", b"a" * 100)
+        second = self.write_video("b.mp4", b"b" * 100)
+        with mock.patch.object(video_download, "DOWNLOAD_CACHE_MAX_BYTES", 150):
+            video_download.download_cache_store("douyin", "1", first)
+            video_download.download_cache_store("douyin", "2", second)
+
+        self.assertIsNone(video_download.download_cache_lookup("douyin", "1"))
+        self.assertEqual(video_download.download_cache_lookup("douyin", "2"), second)
+        objects = [
+            name
+            for _, _, files in os.walk(os.path.join(self.cache_dir.name, "objects"))
+            for name in files
+        ]
+        self.assertEqual(len(objects), 1)
+
+    def test_douyin_hit_skips_browser(self):
+        path = self.write_video("douyin.mp4", b"cached")
+        video_download.download_cache_store("douyin", "7625857786269715752", path)
+
+        with mock.patch.object(
+            video_download,
+            "launch_browser_and_capture",
+            side_effect=AssertionError("命中缓存时不应启动浏览器"),
+        ):
+            result = video_download.download_douyin(
+                "https://www.douyin.com/video/7625857786269715752", "douyin.mp4"
+            )
+
+        self.assertEqual(result, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
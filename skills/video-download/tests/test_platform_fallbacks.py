@@ -16,6 +16,21 @@ video_download = importlib.util.module_from_spec(SPEC)
 SPEC.loader.exec_module(video_download)
 
 
+def setUpModule():
+    # 不读写用户真实的下载缓存和引擎记分板，回退顺序固定为默认顺序；
+    # 页面直取会真的发请求，只在 PageStateFastPathTests 里单独打开
+    patcher = mock.patch.dict(
+        os.environ,
+        {
+            "VIDEO_DOWNLOAD_CACHE": "0",
+            "VIDEO_DOWNLOAD_ADAPTIVE_ENGINES": "0",
+            "VIDEO_DOWNLOAD_PAGE_FAST_PATH": "0",
+        },
+    )
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+
+
 class PlatformFallbackTests(unittest.TestCase):
     def test_douyin_playwright_success_returns_output_path(self):
         with tempfile.TemporaryDirectory() as output_dir, mock.patch.object(
@@ -110,6 +125,10 @@ class PlatformFallbackTests(unittest.TestCase):
             return_value=(playinfo, "title"),
         ), mock.patch.object(
             video_download, "download_file", return_value=1024
+        ) as download_file, mock.patch.object(
+            video_download,
+            "mux_dash_streaming",
+            side_effect=RuntimeError("pipe broken"),
         ), mock.patch.object(
             video_download.subprocess,
             "run",
@@ -125,6 +144,11 @@ class PlatformFallbackTests(unittest.TestCase):
             )
 
         self.assertEqual(result, os.path.join(output_dir, "bilibili.mp4"))
+        # 边下边合并失败后，音视频仍并发落盘再合并
+        self.assertEqual(
+            sorted(call.args[0] for call in download_file.call_args_list),
+            ["https://cdn.example/audio.m4s", "https://cdn.example/video.m4s"],
+        )
 
     def test_douyin_falls_back_to_ytdlp_with_platform_cookies(self):
         with mock.patch.object(
@@ -221,7 +245,7 @@ class PlatformFallbackTests(unittest.TestCase):
         self.assertEqual(result, "playwright-result")
         fallback.assert_called_once_with(url, "bili.mp4")
 
-    def test_ytdlp_uses_scoped_cookie_file_and_removes_it(self):
+    def test_ytdlp_reuses_private_cookie_export(self):
         cookie = {
             "name": "sessionid",
             "value": "secret-value",
@@ -235,10 +259,14 @@ class PlatformFallbackTests(unittest.TestCase):
         def fake_run(command, text):
             cookie_path = command[command.index("--cookies") + 1]
             captured["command"] = command
-            captured["cookie_path"] = cookie_path
+            captured.setdefault("cookie_paths", []).append(cookie_path)
             captured["mode"] = stat.S_IMODE(os.stat(cookie_path).st_mode)
+            captured["dir_mode"] = stat.S_IMODE(os.stat(os.path.dirname(cookie_path)).st_mode)
+            captured["mtime_ns"] = os.stat(cookie_path).st_mtime_ns
             with open(cookie_path, encoding="utf-8") as handle:
                 captured["cookie_text"] = handle.read()
+            with open(cookie_path, "a", encoding="utf-8") as handle:
+                handle.write("# written back by yt-dlp\n")  # CLI 退出时会回写 --cookies 文件
             return SimpleNamespace(returncode=0)
 
         with tempfile.TemporaryDirectory() as config_dir, tempfile.TemporaryDirectory() as output_dir:
@@ -251,26 +279,119 @@ class PlatformFallbackTests(unittest.TestCase):
 
             with mock.patch.object(video_download, "COOKIE_DIR", config_dir), mock.patch.object(
                 video_download, "get_ytdlp_command", return_value=["yt-dlp"]
+            ), mock.patch.object(
+                video_download, "get_ytdlp_engine", return_value=None
             ), mock.patch.object(
                 video_download.subprocess, "run", side_effect=fake_run
             ), mock.patch.dict(
                 os.environ, {"VIDEO_DOWNLOAD_OUTPUT_DIR": output_dir}, clear=False
             ):
-                try:
+                store = video_download.CookieStore()
+                with mock.patch.object(video_download, "cookie_store", store):
+                    video_download.download_ytdlp(
+                        "https://www.douyin.com/video/1", "video.mp4", platform="douyin"
+                    )
+                    shared = store.netscape_path("douyin")
+                    shared_mtime = os.stat(shared).st_mtime_ns
                     video_download.download_ytdlp(
-                        "https://www.douyin.com/video/1",
-                        "video.mp4",
-                        platform="douyin",
+                        "https://www.douyin.com/video/2", "video2.mp4", platform="douyin"
                     )
-                except TypeError:
-                    self.fail("download_ytdlp 应接受 platform 并使用对应平台 Cookie")
+                    self.assertEqual(store.netscape_path("douyin"), shared)
+                    self.assertEqual(os.stat(shared).st_mtime_ns, shared_mtime)
+                    with open(shared, encoding="utf-8") as handle:
+                        self.assertNotIn("written back", handle.read())
+                    store.close()
 
         self.assertIn("--cookies", captured["command"])
         self.assertEqual(captured["mode"], 0o600)
+        self.assertEqual(captured["dir_mode"], 0o700)
         self.assertIn(".douyin.com", captured["cookie_text"])
         self.assertIn("\t0\tsessionid\t", captured["cookie_text"])
         self.assertNotIn("secret-value", " ".join(captured["command"]))
-        self.assertFalse(os.path.exists(captured["cookie_path"]))
+        # 每个子进程拿一份私有副本（回写互不干扰），用完即删；共享导出只生成一次
+        self.assertEqual(len(set(captured["cookie_paths"])), 2)
+        self.assertNotIn(shared, captured["cookie_paths"])
+        self.assertFalse(any(os.path.exists(path) for path in captured["cookie_paths"]))
+        self.assertEqual(os.path.dirname(captured["cookie_paths"][0]), os.path.dirname(shared))
+
+    def test_cookie_store_parses_once_until_file_changes(self):
+        with tempfile.TemporaryDirectory() as config_dir:
+            path = os.path.join(config_dir, "douyin_cookies.json")
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump([{"name": "sessionid", "value": "a", "domain": ".douyin.com"}], handle)
+            store = video_download.CookieStore()
+            with mock.patch.object(video_download, "COOKIE_DIR", config_dir), mock.patch.object(
+                video_download.json, "load", wraps=json.load
+            ) as load:
+                first = store.get("douyin")
+                self.assertIs(store.get("douyin"), first)
+                self.assertEqual(load.call_count, 1)
+
+                with open(path, "w", encoding="utf-8") as handle:
+                    json.dump([{"name": "sessionid", "value": "bb", "domain": ".douyin.com"}], handle)
+                os.utime(path, ns=(1, 1))
+                self.assertEqual(store.get("douyin")[0]["value"], "bb")
+                self.assertEqual(load.call_count, 2)
+
+    def test_inprocess_ytdlp_reuses_instance_and_loads_cookies_once(self):
+        created = []
+
+        class FakeYoutubeDL:
+            def __init__(self, params):
+                self.params = dict(params)
+                self.cookie_text = None
+                created.append(self)
+
+            @property
+            def cookiejar(self):
+                with open(self.params["cookiefile"], encoding="utf-8") as handle:
+                    self.cookie_text = handle.read()
+                return self.cookie_text
+
+            def extract_info(self, url, download):
+                path = self.params["outtmpl"]["default"]
+                for hook in self.params["progress_hooks"]:
+                    hook({"status": "downloading", "downloaded_bytes": 5, "total_bytes": 10})
+                with open(path, "wb") as handle:
+                    handle.write(b"video")
+                return {"requested_downloads": [{"filepath": path}]}
+
+        fake_module = SimpleNamespace(
+            YoutubeDL=FakeYoutubeDL,
+            utils=SimpleNamespace(DownloadError=type("DownloadError", (Exception,), {})),
+        )
+        engine = video_download.YtdlpEngine(fake_module)
+        with tempfile.TemporaryDirectory() as config_dir, tempfile.TemporaryDirectory() as output_dir:
+            with open(os.path.join(config_dir, "douyin_cookies.json"), "w", encoding="utf-8") as handle:
+                json.dump([{"name": "sessionid", "value": "v", "domain": ".douyin.com"}], handle)
+            with mock.patch.object(video_download, "COOKIE_DIR", config_dir), mock.patch.object(
+                video_download, "get_ytdlp_engine", return_value=engine
+            ), mock.patch.object(
+                video_download.subprocess, "run", side_effect=AssertionError("不应启动子进程")
+            ), mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_OUTPUT_DIR": output_dir}):
+                events_path = os.path.join(output_dir, "events.jsonl")
+                video_download.open_event_sink(events_path)
+                self.addCleanup(video_download.close_event_sink)
+                first = video_download.download_ytdlp("https://www.douyin.com/video/1", "a", platform="douyin")
+                again = video_download.download_ytdlp("https://www.douyin.com/video/2", "a", platform="douyin")
+                second = video_download.download_ytdlp("https://www.douyin.com/video/3", "b", platform="douyin")
+                video_download.close_event_sink()
+                with open(events_path, encoding="utf-8") as handle:
+                    events = [json.loads(line) for line in handle]
+
+        self.assertEqual(first, os.path.join(output_dir, "a.mp4"))
+        self.assertEqual(again, first)
+        self.assertEqual(second, os.path.join(output_dir, "b.mp4"))
+        # 同一输出模板复用实例；不同模板各建一个，已建实例的 outtmpl 不被改写
+        self.assertEqual(len(created), 2)
+        self.assertEqual(created[0].params["outtmpl"]["default"], os.path.join(output_dir, "a.mp4"))
+        self.assertEqual(created[1].params["outtmpl"]["default"], os.path.join(output_dir, "b.mp4"))
+        self.assertIn("\tsessionid\t", created[0].cookie_text)
+        self.assertIsNone(created[0].params["cookiefile"])
+        progress = [e for e in events if e["event"] == "progress"]
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(progress[0]["engine"], "ytdlp")
+        self.assertEqual((progress[0]["downloaded"], progress[0]["total"]), (5, 10))
 
 
 if __name__ == "__main__":
@@ -335,3 +456,499 @@ class EngineErrorWrappingTests(unittest.TestCase):
 
         self.assertEqual(result, "fallback-result")
         self.assertEqual(fallback.call_args.kwargs.get("platform"), "xiaohongshu")
+
+
+class CaptureWaitTests(unittest.TestCase):
+    """固定 sleep 改成「命中即返回」，原来的等待时长只作为上限。"""
+
+    def test_wait_until_returns_as_soon_as_condition_holds(self):
+        state = {"polls": 0}
+
+        class Page:
+            def wait_for_timeout(self, ms):
+                state["polls"] += 1
+
+        result = video_download.wait_until(Page(), lambda: state["polls"] >= 3, timeout_s=10)
+
+        self.assertTrue(result)
+        self.assertEqual(state["polls"], 3)
+
+    def test_wait_until_gives_up_at_upper_bound(self):
+        class Page:
+            def wait_for_timeout(self, ms):
+                import time
+                time.sleep(ms / 1000)
+
+        self.assertFalse(video_download.wait_until(Page(), lambda: False, timeout_s=0.05))
+
+    def test_capture_timing_keeps_percentiles_and_misses(self):
+        with tempfile.TemporaryDirectory() as config_dir, mock.patch.object(
+            video_download, "COOKIE_DIR", config_dir
+        ):
+            for seconds in (0.8, 1.2, 2.0, None):
+                video_download.record_capture_timing("douyin", seconds)
+            with open(os.path.join(config_dir, "capture_stats.json"), encoding="utf-8") as handle:
+                stats = json.load(handle)["douyin"]
+
+        self.assertEqual(stats["captures"], 4)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["samples"], [0.8, 1.2, 2.0])
+        self.assertEqual(stats["p50"], 1.2)
+        self.assertEqual(stats["max"], 2.0)
+
+    @unittest.skipUnless(hasattr(os, "fork") and video_download.fcntl, "需要 fork 与 fcntl")
+    def test_state_updates_from_several_processes_are_not_lost(self):
+        def bump(state):
+            state["n"] = state.get("n", 0) + 1
+
+        with tempfile.TemporaryDirectory() as config_dir, mock.patch.object(
+            video_download, "COOKIE_DIR", config_dir
+        ):
+            children = []
+            for _ in range(4):
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        for _ in range(25):
+                            video_download.update_state_file("counter.json", bump)
+                    finally:
+                        os._exit(0)
+                children.append(pid)
+            for pid in children:
+                os.waitpid(pid, 0)
+
+            self.assertEqual(video_download.read_state_file("counter.json"), {"n": 100})
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type, headers={})
+        self.outcome = None
+
+    def abort(self, error_code=None):
+        self.outcome = "abort"
+
+    def continue_(self):
+        self.outcome = "continue"
+
+
+class RoutedPage:
+    """只实现抓流用到的 Page 方法；goto 时把预设的请求依次交给拦截路由。"""
+
+    def __init__(self, requests, responses=()):
+        self.routes = [FakeRoute(url, kind) for url, kind in requests]
+        self.responses = [SimpleNamespace(url=url, headers=headers) for url, headers in responses]
+        self.handlers = []
+        self.listeners = []
+
+    def route(self, pattern, handler):
+        self.handlers.append(handler)
+
+    def unroute(self, pattern, handler):
+        self.handlers.remove(handler)
+
+    def on(self, event, fn):
+        self.listeners.append(fn)
+
+    def remove_listener(self, event, fn):
+        self.listeners.remove(fn)
+
+    def goto(self, url, **kwargs):
+        for route in self.routes:
+            for handler in self.handlers:
+                handler(route)
+        for response in self.responses:
+            for listener in list(self.listeners):
+                listener(response)
+
+    def wait_for_timeout(self, ms):
+        pass
+
+    def title(self):
+        return "标题 - 抖音"
+
+
+class CaptureRoutingTests(unittest.TestCase):
+    """抓流页面中止图片/字体/上报请求，视频请求只记 URL、不下载正文。"""
+
+    def test_block_rules_are_per_platform(self):
+        block = video_download.should_block_request
+        self.assertTrue(block("douyin", "image", "https://p3.douyinpic.com/a.webp"))
+        self.assertTrue(block("douyin", "xhr", "https://mcs.zijieapi.com/list"))
+        self.assertFalse(block("xiaohongshu", "xhr", "https://mcs.zijieapi.com/list"))
+        self.assertTrue(block("bilibili", "media", "https://upos-sz.bilivideo.com/x.m4s"))
+        self.assertFalse(block("douyin", "media", "https://www.douyin.com/aweme/v1/play/"))
+        self.assertTrue(block("bilibili", "ping", "https://api.bilibili.com/x/click-interface/h"))
+        self.assertFalse(block("bilibili", "xhr", "https://api.bilibili.com/x/player/wbi/v2"))
+
+    def test_capture_keeps_media_url_and_aborts_heavy_requests(self):
+        video = "https://v3-web.douyinvod.com/abc/video_mp4/?a=1"
+        page = RoutedPage([
+            ("https://www.douyin.com/video/1", "document"),
+            ("https://lf-cdn.example/app.js", "script"),
+            ("https://p3.douyinpic.com/cover.jpeg", "image"),
+            ("https://lf-cdn.example/font.woff2", "font"),
+            (video, "media"),
+        ])
+        pool = mock.Mock()
+        pool.page.return_value.__enter__ = mock.Mock(return_value=page)
+        pool.page.return_value.__exit__ = mock.Mock(return_value=False)
+        with mock.patch.object(video_download, "get_browser_pool", return_value=pool), \
+                mock.patch.object(video_download, "record_capture_timing"):
+            url, title = video_download.launch_browser_and_capture(
+                "https://www.douyin.com/video/1",
+                lambda u: "douyinvod.com" in u and "video_mp4" in u,
+                platform="douyin",
+            )
+
+        self.assertEqual(url, video)
+        self.assertEqual(title, "标题 - 抖音")
+        self.assertEqual(
+            [r.outcome for r in page.routes],
+            ["continue", "continue", "abort", "abort", "abort"],
+        )
+        self.assertEqual(page.handlers, [])
+        self.assertEqual(page.listeners, [])
+
+    def test_route_handler_matches_on_url_and_headers_only_on_responses(self):
+        """路由里的请求没有响应头：content-type 判断只能放在 video_response_fn，由响应事件处理。"""
+        video = "https://ci.xhscdn.com/stream/abc"
+        page = RoutedPage(
+            [(video, "media")],
+            responses=[(video, {"content-type": "video/mp4"})],
+        )
+        pool = mock.Mock()
+        pool.page.return_value.__enter__ = mock.Mock(return_value=page)
+        pool.page.return_value.__exit__ = mock.Mock(return_value=False)
+        seen = []
+
+        def url_fn(url):
+            seen.append(url)
+            return url.endswith(".mp4")
+
+        with mock.patch.object(video_download, "get_browser_pool", return_value=pool), \
+                mock.patch.object(video_download, "record_capture_timing"):
+            url, _ = video_download.launch_browser_and_capture(
+                "https://www.xiaohongshu.com/explore/abc", url_fn, platform="xiaohongshu",
+                video_response_fn=lambda r: "video" in r.headers.get("content-type", ""),
+            )
+
+        self.assertEqual(url, video)
+        self.assertTrue(all(isinstance(u, str) for u in seen))
+        self.assertEqual(page.routes[0].outcome, "continue")
+
+    def test_routing_can_be_disabled(self):
+        page = RoutedPage([("https://p3.douyinpic.com/cover.jpeg", "image")])
+        with mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_BLOCK_ASSETS": "0"}):
+            with video_download.capture_routing(page, "douyin") as counts:
+                page.goto("https://www.douyin.com/")
+
+        self.assertIsNone(page.routes[0].outcome)
+        self.assertEqual(counts, {"blocked": 0, "media": 0})
+
+
+class TikTokCaptureStreamingTests(unittest.TestCase):
+    """CDP 抓到视频后按 URL 带 Cookie 回放流式落盘，不把整段视频读进内存。"""
+
+    def make_ctx_and_page(self):
+        ctx = mock.Mock()
+        ctx.cookies.return_value = [{"name": "tt_chain_token", "value": "abc"}]
+        page = mock.Mock()
+        page.evaluate.return_value = "Browser-UA"
+        return ctx, page
+
+    def test_replays_captured_url_with_browser_cookies(self):
+        ctx, page = self.make_ctx_and_page()
+        hit = {"url": "https://v16.tiktokcdn.com/video/tos/x.mp4"}
+
+        with mock.patch.object(video_download, "download_file", return_value=4096) as download:
+            size = video_download.save_captured_tiktok_media(ctx, page, hit, "/tmp/out.mp4")
+
+        self.assertEqual(size, 4096)
+        headers = download.call_args.args[3]
+        self.assertEqual(headers["Cookie"], "tt_chain_token=abc")
+        self.assertEqual(headers["User-Agent"], "Browser-UA")
+
+    def test_rejected_replay_raises_instead_of_buffering_the_body(self):
+        ctx, page = self.make_ctx_and_page()
+        hit = {"url": "https://v16.tiktokcdn.com/video/tos/x.mp4"}
+
+        with mock.patch.object(
+            video_download, "download_file", side_effect=RuntimeError("HTTP 403")
+        ), self.assertRaisesRegex(RuntimeError, "HTTP 403"):
+            video_download.save_captured_tiktok_media(ctx, page, hit, "/tmp/out.mp4")
+
+
+class MediaProbeTests(unittest.TestCase):
+    """每个文件只跑一次 ffprobe，后续校验、时长与元数据都复用缓存结果。"""
+
+    FFPROBE_JSON = json.dumps({
+        "streams": [
+            {"codec_type": "video", "codec_name": "h264", "width": 1080, "height": 1920},
+            {"codec_type": "audio", "codec_name": "aac", "duration": "12.4"},
+        ],
+        "format": {"duration": "12.500", "bit_rate": "2048000"},
+    })
+
+    def test_single_probe_feeds_validation_duration_and_meta(self):
+        with tempfile.TemporaryDirectory() as out_dir, mock.patch.object(
+            video_download.subprocess,
+            "run",
+            return_value=SimpleNamespace(returncode=0, stdout=self.FFPROBE_JSON),
+        ) as run:
+            path = os.path.join(out_dir, "video.mp4")
+            with open(path, "wb") as handle:
+                handle.write(b"fake")
+
+            info = video_download.probe_media(path)
+            self.assertTrue(video_download.validate_video_file(path))
+            self.assertEqual(video_download.get_media_duration_seconds(path), 12.5)
+            video_download.write_tiktok_meta(path, "cdp")
+            with open(path + ".meta.json", encoding="utf-8") as handle:
+                meta = json.load(handle)
+
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(info["video_codec"], "h264")
+        self.assertEqual(info["audio_codec"], "aac")
+        self.assertEqual((info["width"], info["height"]), (1080, 1920))
+        self.assertEqual(info["bit_rate"], 2048000)
+        self.assertEqual(meta["media"]["duration"], 12.5)
+
+    def test_rejects_file_without_video_track(self):
+        audio_only = json.dumps({"streams": [{"codec_type": "audio"}], "format": {}})
+        with tempfile.TemporaryDirectory() as out_dir, mock.patch.object(
+            video_download.subprocess,
+            "run",
+            return_value=SimpleNamespace(returncode=0, stdout=audio_only),
+        ):
+            path = os.path.join(out_dir, "audio.mp4")
+            with open(path, "wb") as handle:
+                handle.write(b"fake")
+            with self.assertRaisesRegex(RuntimeError, "视频轨"):
+                video_download.validate_video_file(path)
+
+
+class DeriveStageTests(unittest.TestCase):
+    """下载后一次 ffmpeg 解码产出全部派生文件，结果记进 .meta.json。"""
+
+    def run_stage(self, out_dir, ffmpeg_returncode=0):
+        path = os.path.join(out_dir, "video.mp4")
+        with open(path, "wb") as handle:
+            handle.write(b"original")
+        calls = []
+
+        def fake_run(cmd, **kwargs):
+            if cmd[0] == "ffprobe":
+                return SimpleNamespace(returncode=0, stdout=MediaProbeTests.FFPROBE_JSON)
+            calls.append(cmd)
+            if ffmpeg_returncode == 0:
+                for arg in cmd[cmd.index(path) + 1:]:
+                    if arg.endswith((".mp4", ".jpg")):
+                        with open(arg, "wb") as handle:
+                            handle.write(b"derived")
+            return SimpleNamespace(returncode=ffmpeg_returncode, stderr="boom")
+
+        with mock.patch.object(video_download.subprocess, "run", side_effect=fake_run), \
+                video_download.derive_override("all"):
+            derived = video_download.apply_derive_stage(path)
+        with open(path + ".meta.json", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        return path, derived, calls, meta
+
+    def test_single_ffmpeg_pass_writes_every_output(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            path, derived, calls, meta = self.run_stage(out_dir)
+            with open(path, "rb") as handle:
+                remuxed = handle.read()
+            leftovers = sorted(os.listdir(out_dir))
+
+        self.assertEqual(len(calls), 1)
+        cmd = calls[0]
+        self.assertEqual(cmd.count("-i"), 1)
+        self.assertIn("[0:v:0]split=3[proxy_in][poster_in][sheet_in]", cmd[cmd.index("-filter_complex") + 1])
+        self.assertIn("tile=3x3", cmd[cmd.index("-filter_complex") + 1])
+        self.assertEqual(remuxed, b"derived")
+        self.assertEqual(derived["faststart"], path)
+        self.assertEqual(meta["derivatives"], derived)
+        self.assertEqual(
+            leftovers,
+            ["video.mp4", "video.mp4.meta.json", "video.poster.jpg", "video.proxy.mp4",
+             "video.sheet.jpg"],
+        )
+
+    def test_failed_pass_keeps_download_and_records_error(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            path, derived, calls, meta = self.run_stage(out_dir, ffmpeg_returncode=1)
+            with open(path, "rb") as handle:
+                original = handle.read()
+            leftovers = sorted(os.listdir(out_dir))
+
+        self.assertIsNone(derived)
+        self.assertEqual(original, b"original")
+        self.assertIn("boom", meta["derive_error"])
+        self.assertEqual(leftovers, ["video.mp4", "video.mp4.meta.json"])
+
+    def test_unknown_kind_is_actionable(self):
+        self.assertEqual(video_download.parse_derive_spec("sheet, poster"), ("poster", "sheet"))
+        with self.assertRaisesRegex(RuntimeError, "--derive"):
+            video_download.parse_derive_spec("gif")
+
+
+class PageStateFastPathTests(unittest.TestCase):
+    """抖音/小红书先直接请求页面读内嵌数据，拿不到或校验失败再启动浏览器。"""
+
+    DOUYIN_ID = "7625857786269715752"
+    XHS_ID = "6411cf99000000001300b6d9"
+
+    def douyin_html(self, play_url="//v26.douyinvod.com/video/tos/playwm/abc/?a=1"):
+        state = {"app": {"videoDetail": {
+            "awemeId": self.DOUYIN_ID,
+            "desc": "抖音标题",
+            "video": {"playAddr": [{"src": play_url}]},
+        }}}
+        encoded = video_download.urllib.parse.quote(json.dumps(state, ensure_ascii=False))
+        return f'<html><script id="RENDER_DATA" type="application/json">{encoded}</script></html>'
+
+    def xhs_html(self):
+        state = (
+            '{"note":{"noteDetailMap":{"%s":{"note":{"noteId":"%s","title":"小红书标题",'
+            '"imageList":undefined,"video":{"media":{"stream":{"h264":[{"masterUrl":'
+            '"http://sns-video-bd.xhscdn.com/stream/1.mp4","backupUrls":[]}]}}}}}}}}'
+        ) % (self.XHS_ID, self.XHS_ID)
+        return f"<html><script>window.__INITIAL_STATE__={state}</script></html>"
+
+    def test_extracts_play_urls_from_embedded_state(self):
+        self.assertEqual(
+            video_download.extract_douyin_play_url(self.douyin_html(), self.DOUYIN_ID),
+            ("https://v26.douyinvod.com/video/tos/play/abc/?a=1", "抖音标题"),
+        )
+        self.assertEqual(
+            video_download.extract_douyin_play_url(self.douyin_html(), "1"), (None, None)
+        )
+        self.assertEqual(
+            video_download.extract_xhs_video_url(self.xhs_html(), self.XHS_ID),
+            ("http://sns-video-bd.xhscdn.com/stream/1.mp4", "小红书标题"),
+        )
+        self.assertEqual(
+            video_download.extract_xhs_video_url("<html></html>", self.XHS_ID), (None, None)
+        )
+
+    def test_cookie_header_keeps_matching_unexpired_cookies(self):
+        cookies = [
+            {"name": "sid", "value": "1", "domain": ".douyin.com", "expires": -1},
+            {"name": "old", "value": "2", "domain": ".douyin.com", "expires": 1},
+            {"name": "other", "value": "3", "domain": ".example.com", "expires": -1},
+        ]
+        with mock.patch.object(video_download.cookie_store, "get", return_value=cookies):
+            header = video_download.cookie_header("douyin", "https://www.douyin.com/video/1")
+        self.assertEqual(header, "sid=1")
+
+    def run_douyin(self, output_dir, validate_side_effect=None):
+        with mock.patch.dict(os.environ, {
+            "VIDEO_DOWNLOAD_PAGE_FAST_PATH": "1", "VIDEO_DOWNLOAD_OUTPUT_DIR": output_dir,
+        }), mock.patch.object(
+            video_download, "fetch_page_html", return_value=self.douyin_html()
+        ), mock.patch.object(
+            video_download, "download_file", return_value=1024
+        ) as download_file, mock.patch.object(
+            video_download, "validate_video_file", side_effect=validate_side_effect
+        ), mock.patch.object(
+            video_download, "launch_browser_and_capture",
+            return_value=("https://cdn.example/douyin.mp4", "title"),
+        ) as capture:
+            result = video_download.download_douyin(
+                f"https://www.douyin.com/video/{self.DOUYIN_ID}", "douyin.mp4"
+            )
+        return result, download_file, capture
+
+    def test_fast_path_success_skips_browser(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            result, download_file, capture = self.run_douyin(output_dir)
+
+        self.assertEqual(result, os.path.join(output_dir, "douyin.mp4"))
+        capture.assert_not_called()
+        self.assertEqual(
+            download_file.call_args[0][0], "https://v26.douyinvod.com/video/tos/play/abc/?a=1"
+        )
+
+    def test_invalid_fast_path_file_falls_back_to_browser(self):
+        rejected = [RuntimeError("没有视频轨"), None]
+        with tempfile.TemporaryDirectory() as output_dir:
+            result, download_file, capture = self.run_douyin(output_dir, rejected)
+
+        self.assertEqual(result, os.path.join(output_dir, "douyin.mp4"))
+        capture.assert_called_once()
+        self.assertEqual(download_file.call_count, 2)
+
+
+class EngineScoreboardTests(unittest.TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.TemporaryDirectory()
+        for patcher in (
+            mock.patch.object(video_download, "COOKIE_DIR", self.config_dir.name),
+            mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_ADAPTIVE_ENGINES": "1"}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.config_dir.cleanup()
+
+    def test_unscored_engines_keep_default_order(self):
+        self.assertEqual(
+            video_download.order_engines("bilibili", ["ytdlp", "playwright"]),
+            (["ytdlp", "playwright"], []),
+        )
+
+    def test_failing_engine_moves_behind_and_cools_down(self):
+        with mock.patch.object(video_download, "ENGINE_FAILURE_STREAK", 3):
+            for _ in range(2):
+                video_download.record_engine_result("tiktok", "cdp", False, 1.0)
+            video_download.record_engine_result("tiktok", "tikwm", True, 8.0)
+            order, skipped = video_download.order_engines("tiktok", ["cdp", "tikwm"])
+            self.assertEqual((order, skipped), (["tikwm", "cdp"], []))
+
+            video_download.record_engine_result("tiktok", "cdp", False, 1.0)
+            order, skipped = video_download.order_engines("tiktok", ["cdp", "tikwm"])
+            self.assertEqual((order, skipped), (["tikwm"], ["cdp"]))
+
+            video_download.record_engine_result("tiktok", "tikwm", False, 1.0)
+            video_download.record_engine_result("tiktok", "tikwm", False, 1.0)
+            video_download.record_engine_result("tiktok", "tikwm", False, 1.0)
+            # 全部在冷却时不跳过，按默认顺序全试
+            self.assertEqual(
+                video_download.order_engines("tiktok", ["cdp", "tikwm"]), (["cdp", "tikwm"], [])
+            )
+
+    def test_tiktok_skips_cooling_cdp_entirely(self):
+        with mock.patch.object(video_download, "ENGINE_FAILURE_STREAK", 1):
+            video_download.record_engine_result("tiktok", "cdp", False, 2.0)
+        calls = []
+        with mock.patch.object(
+            video_download, "download_tiktok_cdp",
+            side_effect=AssertionError("冷却中的 CDP 不应再尝试"),
+        ), mock.patch.object(
+            video_download, "download_tiktok_tikwm",
+            side_effect=lambda url, name: calls.append(url) or "tikwm-result",
+        ):
+            result = video_download._download_tiktok_uncached(
+                "https://www.tiktok.com/@a/video/1", "t.mp4"
+            )
+
+        self.assertEqual(result, "tikwm-result")
+        self.assertEqual(len(calls), 1)
+        scores = video_download.read_state_file(video_download.ENGINE_SCORES_FILE)
+        self.assertEqual(scores["tiktok"]["tikwm"]["consecutive_failures"], 0)
+
+    def test_bilibili_playwright_exit_is_recorded_as_failure(self):
+        with mock.patch.object(
+            video_download, "download_ytdlp", side_effect=RuntimeError("yt-dlp failed"),
+        ), mock.patch.object(
+            video_download, "download_bilibili_playwright", side_effect=SystemExit(1),
+        ):
+            with self.assertRaisesRegex(RuntimeError, "playwright=exit 1"):
+                video_download.download_bilibili("https://www.bilibili.com/video/BV1xx411c7mD")
+
+        scores = video_download.read_state_file(video_download.ENGINE_SCORES_FILE)["bilibili"]
+        self.assertEqual(scores["ytdlp"]["attempts"], 1)
+        self.assertLess(scores["playwright"]["success_rate"], video_download.ENGINE_PRIOR_SUCCESS)
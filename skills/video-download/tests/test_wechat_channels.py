@@ -15,18 +15,17 @@ video_download = importlib.util.module_from_spec(SPEC)
 SPEC.loader.exec_module(video_download)
 
 
-class FakeResponse:
-    def __init__(self, payload):
-        self.payload = json.dumps(payload).encode("utf-8")
+def setUpModule():
+    # 不读写用户真实的下载缓存
+    patcher = mock.patch.dict(os.environ, {"VIDEO_DOWNLOAD_CACHE": "0"})
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
 
-    def read(self):
-        return self.payload
 
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc, tb):
-        return False
+def fake_response(payload):
+    return video_download.HttpResponse(
+        200, "OK", {}, "http://api.example.test/", json.dumps(payload).encode("utf-8")
+    )
 
 
 class WeChatChannelsTests(unittest.TestCase):
@@ -92,13 +91,13 @@ class WeChatChannelsTests(unittest.TestCase):
         }
         captured = {}
 
-        def fake_urlopen(request, timeout):
-            captured["url"] = request.full_url
-            captured["headers"] = dict(request.header_items())
+        def fake_http_request(method, url, headers, timeout):
+            captured["url"] = url
+            captured["headers"] = headers
             captured["timeout"] = timeout
-            return FakeResponse(payload)
+            return fake_response(payload)
 
-        with mock.patch.object(video_download.urllib.request, "urlopen", fake_urlopen):
+        with mock.patch.object(video_download, "http_request", fake_http_request):
             result = video_download.resolve_wechat_channels(
                 "https://weixin.qq.com/sph/ARebDCbPGy",
                 resolver_url="http://api.example.test/api/channels/parse_sph",
@@ -111,7 +110,7 @@ class WeChatChannelsTests(unittest.TestCase):
         self.assertEqual(
             query["url"], ["https://weixin.qq.com/sph/ARebDCbPGy"]
         )
-        self.assertEqual(captured["headers"]["X-api-key"], "test-api-key-value")
+        self.assertEqual(captured["headers"]["X-API-Key"], "test-api-key-value")
         self.assertNotIn("Cookie", captured["headers"])
         self.assertEqual(result["video_url"], "https://cdn.example/video.mp4")
 
@@ -13,6 +13,14 @@ from pathlib import Path
 
 UA = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 ssl._create_default_https_context = ssl._create_unverified_context
+READY_JS = r"""() => {
+    const text = document.body ? document.body.innerText : '';
+    return /\d{2,4}-\d{1,2}-\d{1,2}\s+\d{1,2}:\d{2}|今天\s*\d{1,2}:\d{2}|昨天\s*\d{1,2}:\d{2}/.test(text)
+        && /\n(转发|评论|赞)/.test(text);
+}"""
+READY_POLL_MS = 250
+# Once the post detail API has answered, the DOM only needs a moment to render it.
+STATUS_RENDER_MS = 2000
 
 
 def parse_args():
@@ -20,7 +28,7 @@ def parse_args():
     parser.add_argument("--json", action="store_true")
     parser.add_argument("--json-input", action="store_true")
     parser.add_argument("--between-ms", type=int, default=6000)
-    parser.add_argument("--page-wait-ms", type=int, default=12000)
+    parser.add_argument("--page-wait-ms", type=int, default=12000, help="Readiness ceiling after navigation; the scrape moves on as soon as the post is rendered.")
     parser.add_argument("--chrome-executable-path", default="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")
     parser.add_argument("--cdp-url", default="")
     parser.add_argument("--new-tab", action="store_true")
@@ -230,18 +238,37 @@ def build_result(item, page_url, page_title, page_data, captured_video_urls, wor
     }
 
 
+def wait_until_ready(page, args, status_seen_at):
+    deadline = time.monotonic() + max(args.page_wait_ms, 0) / 1000
+    while True:
+        try:
+            if page.evaluate(READY_JS):
+                return "dom"
+        except Exception:
+            pass
+        now = time.monotonic()
+        if status_seen_at and now >= status_seen_at[0] + STATUS_RENDER_MS / 1000:
+            return "response"
+        if now >= deadline:
+            return "timeout"
+        page.wait_for_timeout(READY_POLL_MS)
+
+
 def scrape_one(page, item, args):
     captured_video_urls = []
+    status_seen_at = []
 
     def on_response(response):
         url = response.url
         if (".mp4" in url or ".m3u8" in url) and url not in captured_video_urls:
             captured_video_urls.append(url)
+        if not status_seen_at and "/ajax/statuses/show" in url:
+            status_seen_at.append(time.monotonic())
 
     page.on("response", on_response)
     try:
         page.goto(item["url"], wait_until="domcontentloaded", timeout=45000)
-        page.wait_for_timeout(args.page_wait_ms)
+        ready_by = wait_until_ready(page, args, status_seen_at)
         page_data = page.evaluate(
             """() => ({
                 title: document.title,
@@ -251,7 +278,9 @@ def scrape_one(page, item, args):
                 sources: Array.from(document.querySelectorAll('source')).map(s => s.src || '')
             })"""
         )
-        return build_result(item, page.url, page_data.get("title", ""), page_data, captured_video_urls, args.work_dir)
+        result = build_result(item, page.url, page_data.get("title", ""), page_data, captured_video_urls, args.work_dir)
+        result["readyBy"] = ready_by
+        return result
     except Exception as exc:
         return {"ok": False, "url": item["url"], "error": str(exc)}
     finally: